@@ -1,6 +1,7 @@
 import os
 import time
 
+import click
 from flask import Flask
 from flask_mail import Mail
 from flask_migrate import Migrate
@@ -11,11 +12,18 @@ from sqlalchemy.exc import OperationalError, TimeoutError
 from config import DevConfig, ProdConfig
 from init_db import db
 from ldap_utils.ldap_utils import register_hooks, ldap_client
-from utils.xlsx_reader import get_books, get_magazines
+from models.decorators_roles import current_user_has_role
+from models.users import role_cache
+from search_engine import init_search_indexes
+from search_engine.documents import reindex_search_documents
+from send_email.emails import init_mail
+from utils.xlsx_reader import load_workbook
 from utils.create_admin_user import create_super_user
 from views.book import library_books
 from views.book_borrowing_dashboard import library_book_borrowing_dashboard
+from views.export import library_export
 from views.index import library
+from views.ingest import library_ingest
 
 mail = Mail()
 sentry = Sentry()
@@ -34,11 +42,17 @@ def create_app(config=config_env):
     app.register_blueprint(library)
     app.register_blueprint(library_books)
     app.register_blueprint(library_book_borrowing_dashboard)
+    app.register_blueprint(library_export)
+    app.register_blueprint(library_ingest)
     app.secret_key = os.urandom(24)
     ldap_client.init_app(app)
     mail.init_app(app)
+    init_mail(app)
     db.init_app(app)
     wait_for_db(app)
+    init_search_indexes(app)
+    role_cache.configure(app.config['ROLE_CACHE_TTL'])
+    app.add_template_global(current_user_has_role, 'has_role')
     return app
 
 
@@ -66,16 +80,28 @@ migrate = Migrate(app, db)
 
 @app.cli.command('load_xls_into_db', with_appcontext=True)
 def load_xls_into_db():
-    get_magazines('./lib-data.xlsx')
-    get_books('./lib-data.xlsx')
+    stats = load_workbook('./lib-data.xlsx')
+    print('Loaded {rows} rows in {seconds}s ({rows_per_second} rows/s): '
+          '{authors} authors, {books} books, {magazines} magazines, '
+          '{copies} copies'.format(**stats))
 
 
 app.cli.add_command(load_xls_into_db)
 
 
 @app.cli.command('create_admin', with_appcontext=True)
-def create_admin():
-    create_super_user()
+@click.argument('emails', nargs=-1)
+def create_admin(emails):
+    create_super_user(list(emails) or None)
 
 
 app.cli.add_command(create_admin)
+
+
+@app.cli.command('reindex_search', with_appcontext=True)
+def reindex_search():
+    count = reindex_search_documents(db.session)
+    print('Search documents rebuilt for {} library items'.format(count))
+
+
+app.cli.add_command(reindex_search)
@@ -15,6 +15,11 @@ class Config(object):
     MAIL_PASSWORD = getenv("MAIL_PASSWORD")
     MAIL_SENDER = getenv("MAIL_SENDER")
     MAIL_ADMINS = getenv("MAIL_ADMINS")
+    # seconds to wait for the mail server, and its circuit breaker
+    MAIL_TIMEOUT = float(getenv("MAIL_TIMEOUT", 10))
+    MAIL_BREAKER_THRESHOLD = int(getenv("MAIL_BREAKER_THRESHOLD", 3))
+    MAIL_BREAKER_RESET_SECONDS = int(getenv("MAIL_BREAKER_RESET_SECONDS", 60))
+    MAIL_LATENCY_BUDGET = float(getenv("MAIL_LATENCY_BUDGET", 10))
     ADMINS = [getenv("MAIL_USERNAME")]
 
     # database
@@ -37,9 +42,61 @@ class Config(object):
     LDAP_BASE_DN = getenv("LDAP_BASE_DN")
     LDAP_LOGIN_VIEW = getenv("LDAP_LOGIN_VIEW")
     LDAP_USER_OBJECT_FILTER = getenv("LDAP_USER_OBJECT_FILTER")
+    # connections kept per worker for lookups and for password checks;
+    # idle ones are health checked before reuse after the given seconds
+    LDAP_POOL_SIZE = int(getenv("LDAP_POOL_SIZE", 4))
+    LDAP_POOL_TIMEOUT = int(getenv("LDAP_POOL_TIMEOUT", 5))
+    LDAP_POOL_CHECK_SECONDS = int(getenv("LDAP_POOL_CHECK_SECONDS", 60))
+    LDAP_TIMEOUT = int(getenv("LDAP_TIMEOUT", 5))
+    LDAP_OPERATION_TIMEOUT = int(getenv("LDAP_OPERATION_TIMEOUT", 10))
+    # directory entries and groups are cached per worker; lookups that
+    # found nothing are kept for the shorter negative TTL
+    LDAP_CACHE_SIZE = int(getenv("LDAP_CACHE_SIZE", 1024))
+    LDAP_CACHE_TTL = int(getenv("LDAP_CACHE_TTL", 300))
+    LDAP_CACHE_NEGATIVE_TTL = int(getenv("LDAP_CACHE_NEGATIVE_TTL", 60))
+    # users looked up by one OR-filter search, see create_super_user
+    LDAP_BATCH_SIZE = int(getenv("LDAP_BATCH_SIZE", 50))
+    # after LDAP_BREAKER_THRESHOLD failed or slower than the budget calls
+    # in a row LDAP calls fail fast, until a probe after the reset time
+    LDAP_BREAKER_THRESHOLD = int(getenv("LDAP_BREAKER_THRESHOLD", 5))
+    LDAP_BREAKER_RESET_SECONDS = int(getenv("LDAP_BREAKER_RESET_SECONDS", 30))
+    LDAP_LATENCY_BUDGET = float(getenv("LDAP_LATENCY_BUDGET", 5))
 
     # admin users
     ADMIN_LIST = getenv("ADMIN_LIST")
+    # seconds a worker trusts its cached copy of a user's roles, and a
+    # session the role mask stored in it
+    ROLE_CACHE_TTL = int(getenv("ROLE_CACHE_TTL", 300))
+
+    # search: "sql" queries the database, "memory" serves searches
+    # from an in-process index built at worker start
+    SEARCH_BACKEND = getenv("SEARCH_BACKEND", "sql")
+    SEARCH_INDEX_REFRESH_SECONDS = int(
+        getenv("SEARCH_INDEX_REFRESH_SECONDS", 300))
+    # typo tolerant search used when a query finds nothing
+    FUZZY_SEARCH_THRESHOLD = float(getenv("FUZZY_SEARCH_THRESHOLD", 0.3))
+    FUZZY_SEARCH_LIMIT = 10
+    FUZZY_SEARCH_BUDGET_MS = int(getenv("FUZZY_SEARCH_BUDGET_MS", 50))
+    # "offset" numbers pages, "keyset" pages with cursors over the sort
+    # key so deep pages cost the same as the first one; keyset pages
+    # count at most PAGINATION_COUNT_LIMIT rows (0 disables counting)
+    PAGINATION_MODE = getenv("PAGINATION_MODE", "offset")
+    PAGINATION_COUNT_LIMIT = int(getenv("PAGINATION_COUNT_LIMIT", 1000))
+    # facet counts are cached per (query, filters) until the catalog changes
+    FACET_CACHE_SIZE = int(getenv("FACET_CACHE_SIZE", 256))
+    FACET_CACHE_TTL = int(getenv("FACET_CACHE_TTL", 300))
+    # result pages are cached per (query, page, filters) until the
+    # catalog changes; writes from the cron tasks show up once the TTLs
+    # run out
+    SEARCH_CACHE_SIZE = int(getenv("SEARCH_CACHE_SIZE", 512))
+    SEARCH_CACHE_TTL = int(getenv("SEARCH_CACHE_TTL", 300))
+    # typeahead completions returned by /api/suggest
+    SUGGEST_LIMIT = int(getenv("SUGGEST_LIMIT", 8))
+
+    # rows accepted by one /api/import request, written with one
+    # executemany per IMPORT_CHUNK_SIZE rows and table
+    IMPORT_MAX_ROWS = int(getenv("IMPORT_MAX_ROWS", 50000))
+    IMPORT_CHUNK_SIZE = int(getenv("IMPORT_CHUNK_SIZE", 1000))
 
 
 class DevConfig(Config):
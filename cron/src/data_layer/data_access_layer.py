@@ -13,6 +13,8 @@ class DataAccessLayer:
     copy = None
     rental_log = None
     users = None
+    roles = None
+    user_roles = None
 
     def __init__(self, *args):
         self.metadata = MetaData()
@@ -20,7 +22,11 @@ class DataAccessLayer:
         self.library_item = Table('library_item',
                                   self.metadata,
                                   Column('id', Integer, primary_key=True),
-                                  Column('title', String(256)))
+                                  Column('title', String(256)),
+                                  Column('total_copies', Integer,
+                                         nullable=False, default=0),
+                                  Column('available_copies', Integer,
+                                         nullable=False, default=0))
 
         self.users = Table('users',
                            self.metadata,
@@ -28,7 +34,26 @@ class DataAccessLayer:
                            Column('email', String(128)),
                            Column('first_name', String(64)),
                            Column('surname', String(64)),
-                           Column('employee_id', String(64)))
+                           Column('employee_id', String(64)),
+                           Column('active', Boolean),
+                           Column('role_mask', Integer,
+                                  nullable=False, default=0))
+
+        self.roles = Table('roles',
+                           self.metadata,
+                           Column('id', Integer, primary_key=True),
+                           Column('name', String(16)))
+
+        self.user_roles = Table('user_roles',
+                                self.metadata,
+                                Column('user_id',
+                                       Integer,
+                                       ForeignKey("users.id"),
+                                       primary_key=True),
+                                Column('role_id',
+                                       Integer,
+                                       ForeignKey("roles.id"),
+                                       primary_key=True))
 
         self.copy = Table('copy',
                           self.metadata,
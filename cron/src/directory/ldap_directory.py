@@ -0,0 +1,62 @@
+from logging import debug
+
+import ldap
+from ldap import filter as ldap_filter
+from ldap.controls import SimplePagedResultsControl
+
+EMPLOYEES_FILTER = '(&(objectClass=person)(employeeID=*)(l={}))'
+
+
+def employees_filter(location, modified_within_hours=None):
+    filterstr = ldap_filter.filter_format(EMPLOYEES_FILTER, (location,))
+    if modified_within_hours:
+        filterstr = ldap_filter.time_span_filter(
+            filterstr, from_timestamp=-3600 * int(modified_within_hours))
+    return filterstr
+
+
+class LdapDirectory():
+    def __init__(self, uri, bind_dn, password, base_dn,
+                 page_size=500, timeout=30):
+        self.__uri = uri
+        self.__bind_dn = bind_dn
+        self.__password = password
+        self.__base_dn = base_dn
+        self.__page_size = page_size
+        self.__timeout = timeout
+
+    def pages(self, filterstr, attributes):
+        """Yield the attributes of matching entries, a page at a time.
+
+        Uses the simple paged results control, so directories capping
+        the size of a single search still return every entry.
+        """
+        connection = ldap.initialize(self.__uri)
+        connection.protocol_version = ldap.VERSION3
+        connection.set_option(ldap.OPT_REFERRALS, 0)
+        connection.set_option(ldap.OPT_NETWORK_TIMEOUT, self.__timeout)
+        connection.simple_bind_s(self.__bind_dn, self.__password)
+
+        control = SimplePagedResultsControl(
+            True, size=self.__page_size, cookie='')
+        try:
+            while True:
+                debug('Searching {} page of {}'.format(
+                    self.__base_dn, filterstr))
+                message_id = connection.search_ext(
+                    self.__base_dn, ldap.SCOPE_SUBTREE, filterstr,
+                    attributes, serverctrls=[control])
+                _, entries, _, response_controls = connection.result3(
+                    message_id, timeout=self.__timeout)
+                # referrals come back as entries without a DN
+                yield [entry for dn, entry in entries if dn]
+
+                cookies = [
+                    response.cookie for response in response_controls
+                    if response.controlType ==
+                    SimplePagedResultsControl.controlType]
+                if not cookies or not cookies[0]:
+                    return
+                control.cookie = cookies[0]
+        finally:
+            connection.unbind_s()
@@ -0,0 +1,145 @@
+from collections import namedtuple
+from logging import debug, info
+from datetime import datetime
+from sqlalchemy.sql import select, bindparam
+
+EMPLOYEE_ATTRIBUTES = ['mail', 'givenName', 'sn', 'employeeID']
+
+# RoleEnum.USER in the web application, and its bit in users.role_mask
+USER_ROLE = 'USER'
+USER_ROLE_MASK = 1 << 1
+
+SyncResult = namedtuple('SyncResult', 'inserted updated deactivated')
+
+
+def employee_record(entry):
+    """Map directory attributes to users columns, None if incomplete."""
+    values = {}
+    for attribute, column in zip(
+            EMPLOYEE_ATTRIBUTES,
+            ('email', 'first_name', 'surname', 'employee_id')):
+        value = entry.get(attribute)
+        if not value:
+            return None
+        values[column] = value[0].decode('utf-8')
+    return values
+
+
+class UserSync():
+    """Bring users in line with the directory in a single transaction.
+
+    Directory entries are compared with users by employee id, and each
+    page is written with one insert and one update statement. A full
+    sync also deactivates users no longer returned by the directory;
+    an incremental one (pages of recently modified entries) does not.
+    """
+
+    def __init__(self, data_access_layer, directory):
+        self.__data_access_layer = data_access_layer
+        self.__directory = directory
+
+    def sync(self, filterstr, full=True):
+        connection = self.__data_access_layer.connection
+        users = self.__data_access_layer.users
+
+        inserted = updated = deactivated = 0
+        with connection.begin():
+            existing = {
+                row.employee_id: row for row in connection.execute(
+                    select([users.c.id, users.c.employee_id, users.c.email,
+                            users.c.first_name, users.c.surname,
+                            users.c.active]))}
+            seen = set()
+
+            for page in self.__directory.pages(
+                    filterstr, EMPLOYEE_ATTRIBUTES):
+                new_records = []
+                changed_records = []
+                for record in filter(None, map(employee_record, page)):
+                    employee_id = record['employee_id']
+                    if employee_id in seen:
+                        continue
+                    seen.add(employee_id)
+                    row = existing.get(employee_id)
+                    if row is None:
+                        new_records.append(record)
+                    elif (row.email, row.first_name, row.surname,
+                          row.active) != (record['email'],
+                                          record['first_name'],
+                                          record['surname'], True):
+                        changed_records.append(record)
+
+                self.__insert(connection, new_records)
+                self.__update(connection, changed_records)
+                inserted += len(new_records)
+                updated += len(changed_records)
+
+            if full:
+                missing = [row.id for employee_id, row in existing.items()
+                           if employee_id not in seen and row.active]
+                self.__deactivate(connection, missing)
+                deactivated = len(missing)
+
+        result = SyncResult(inserted, updated, deactivated)
+        info('[{}] Synchronized users with the directory: {} added, '
+             '{} updated, {} deactivated'.format(datetime.now(), *result))
+        return result
+
+    def __insert(self, connection, records):
+        if not records:
+            return
+        users = self.__data_access_layer.users
+        roles = self.__data_access_layer.roles
+        user_roles = self.__data_access_layer.user_roles
+
+        insert_users_stmt = users.insert().values(
+            active=True, role_mask=USER_ROLE_MASK)
+        debug('Executing: \n{}'.format(str(insert_users_stmt)))
+        connection.execute(insert_users_stmt, records)
+
+        role_id = connection.execute(
+            select([roles.c.id]).where(roles.c.name == USER_ROLE)).scalar()
+        user_ids = connection.execute(
+            select([users.c.id]).where(users.c.employee_id.in_(
+                [record['employee_id'] for record in records]))).fetchall()
+
+        insert_roles_stmt = user_roles.insert()
+        debug('Executing: \n{}'.format(str(insert_roles_stmt)))
+        connection.execute(insert_roles_stmt, [
+            {'user_id': user_id, 'role_id': role_id}
+            for user_id, in user_ids])
+
+    def __update(self, connection, records):
+        if not records:
+            return
+        users = self.__data_access_layer.users
+
+        update_stmt = (
+            users
+            .update()
+            .where(users.c.employee_id == bindparam('b_employee_id'))
+            .values(active=True)
+        )
+        debug('Executing: \n{}'.format(str(update_stmt)))
+        connection.execute(update_stmt, [
+            {
+                'b_employee_id': record['employee_id'],
+                'email': record['email'],
+                'first_name': record['first_name'],
+                'surname': record['surname']
+            } for record in records])
+
+    def __deactivate(self, connection, user_ids):
+        if not user_ids:
+            return
+        users = self.__data_access_layer.users
+
+        update_stmt = (
+            users
+            .update()
+            .where(users.c.id == bindparam('user_id'))
+            .values(active=False)
+        )
+        debug('Executing: \n{}'.format(str(update_stmt)))
+        connection.execute(update_stmt,
+                           [{'user_id': user_id} for user_id in user_ids])
@@ -1,19 +1,25 @@
+from contextlib import contextmanager
 from smtplib import SMTP
 
 
 class Smtp():
-    def __init__(self, host, port, user, password, use_tls=False):
+    def __init__(self, host, port, user, password, use_tls=False,
+                 timeout=30, breaker=None):
         self._host = host
         self._port = port
         self._user = user
         self._password = password
         self._use_tls = use_tls
+        self._timeout = timeout
+        # utils.circuit_breaker.CircuitBreaker guarding every send
+        self._breaker = breaker
 
     def send(self, message):
-        with _get_smtp_client(
+        with self._guard(), _get_smtp_client(
             host=self._host,
             port=self._port,
-            use_tls=self._use_tls
+            use_tls=self._use_tls,
+            timeout=self._timeout
         ) as smtp_client:
             if self._use_tls:
                 smtp_client.ehlo()
@@ -23,6 +29,14 @@ class Smtp():
             smtp_client.login(user=self._user, password=self._password)
             smtp_client.send_message(message)
 
+    @contextmanager
+    def _guard(self):
+        if self._breaker is None:
+            yield
+        else:
+            with self._breaker.call():
+                yield
 
-def _get_smtp_client(host, port):
-    return SMTP(host=host, port=port)
+
+def _get_smtp_client(host, port, use_tls=False, timeout=30):
+    return SMTP(host=host, port=port, timeout=timeout)
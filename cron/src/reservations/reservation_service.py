@@ -1,3 +1,4 @@
+from collections import Counter
 from logging import debug, info
 from datetime import datetime
 from sqlalchemy.sql import select, bindparam
@@ -10,9 +11,18 @@ class ReservationService():
         self.__data_access_layer = data_access_layer
 
     def invalidate_overdue_reservations(self):
+        """Return copies whose reservation ended to the shelf.
+
+        The web workers learn about these writes only when their caches
+        expire: search pages and facet counts after SEARCH_CACHE_TTL and
+        FACET_CACHE_TTL, the in-process index after
+        SEARCH_INDEX_REFRESH_SECONDS (300 seconds each by default). Until
+        then searches may still show the copies as reserved.
+        """
         connection = self.__data_access_layer.connection
         rental_log = self.__data_access_layer.rental_log
         copy = self.__data_access_layer.copy
+        library_item = self.__data_access_layer.library_item
 
         connection = connection.execution_options(
             isolation_level="SERIALIZABLE")
@@ -52,15 +62,42 @@ class ReservationService():
             debug('Executing: \n{}'.format(str(update_rental_log_stmt)))
             connection.execute(update_rental_log_stmt, bind_items)
 
-            update_copy_stmt = (
-                copy
+            # several stale logs can point at one copy; only copies still
+            # out are released, once each, so the counters stay exact
+            released_copies = connection.execute(
+                select([copy.c.id, copy.c.library_item_id])
+                .where(copy.c.id.in_(sorted({item[0] for item in items})))
+                .where(copy.c.available_status != BookStatus.RETURNED)
+            ).fetchall()
+            if released_copies:
+                update_copy_stmt = (
+                    copy
+                    .update()
+                    .where(copy.c.id.in_(
+                        [copy_id for copy_id, _ in released_copies]))
+                    .values(available_status=BookStatus.RETURNED)
+                )
+
+                debug('Executing: \n{}'.format(str(update_copy_stmt)))
+                connection.execute(update_copy_stmt)
+
+            released = Counter(
+                item_id for _, item_id in released_copies)
+            bind_counters = [
+                {'item_id': item_id, 'released': count}
+                for item_id, count in released.items()]
+
+            update_counters_stmt = (
+                library_item
                 .update()
-                .where(copy.c.id == bindparam('copy_id'))
-                .values(available_status=BookStatus.RETURNED)
+                .where(library_item.c.id == bindparam('item_id'))
+                .values(available_copies=library_item.c.available_copies +
+                        bindparam('released'))
             )
 
-            debug('Executing: \n{}'.format(str(update_copy_stmt)))
-            connection.execute(update_copy_stmt, bind_items)
+            if bind_counters:
+                debug('Executing: \n{}'.format(str(update_counters_stmt)))
+                connection.execute(update_counters_stmt, bind_counters)
 
         info("[{}] Cancelled reservation for library item id: {}"
              .format(datetime.now(),
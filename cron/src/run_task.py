@@ -4,6 +4,7 @@ from sqlalchemy.engine.url import URL
 from dotenv import load_dotenv
 from os import environ
 from datetime import datetime, timedelta
+from logging import error
 
 from data_layer.data_access_layer import DataAccessLayer
 
@@ -13,6 +14,11 @@ from notifications.smtp_client import Smtp
 
 from reservations.reservation_service import ReservationService
 
+from utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+from directory.ldap_directory import employees_filter, LdapDirectory
+from directory.user_sync import UserSync
+
 
 def send_notifications():
     load_dotenv()
@@ -30,17 +36,32 @@ def send_notifications():
 
     books_catalog = BooksCatalog(data_access_layer)
     message_service = MessageService(sender=smtp_sender)
+    smtp_timeout = environ.get("NOTIFICATIONS_SMPT_TIMEOUT", 30)
     smtp = Smtp(
         host=smtp_host,
         port=smtp_port,
         user=smtp_user,
-        password=smtp_password)
+        password=smtp_password,
+        timeout=float(smtp_timeout),
+        breaker=CircuitBreaker(
+            'Mail server',
+            failure_threshold=3,
+            reset_timeout=float(smtp_timeout),
+            failures=(OSError,)))
 
     with open('notifications/email_template.html') as file_template:
         template = file_template.read()
         records = books_catalog.get_overdue_books(due_date)
         for message in message_service.compose_messages(template, records):
-            smtp.send(message)
+            try:
+                smtp.send(message)
+            except CircuitOpenError:
+                error('[{}] Mail server unavailable, remaining '
+                      'notifications not sent'.format(datetime.now()))
+                return
+            except OSError as e:
+                error('[{}] Notification to {} not sent: {}'.format(
+                    datetime.now(), message['To'], e))
 
 
 def invalidate_overdue_reservations():
@@ -53,6 +74,33 @@ def invalidate_overdue_reservations():
     reservation_service.invalidate_overdue_reservations()
 
 
+def sync_ldap_users():
+    load_dotenv()
+
+    ldap_host = environ["LDAP_HOST"]
+    ldap_user = environ["LDAP_USERNAME"]
+    ldap_password = environ["LDAP_PASSWORD"]
+    ldap_base_dn = environ["LDAP_BASE_DN"]
+    page_size = environ.get("LDAP_SYNC_PAGE_SIZE", 500)
+    location = environ.get("LDAP_SYNC_LOCATION", "Wroclaw")
+    modified_within_hours = environ.get("LDAP_SYNC_MODIFIED_WITHIN_HOURS")
+
+    database_connection_url = __get_database_connection_url()
+    data_access_layer = DataAccessLayer(database_connection_url)
+
+    directory = LdapDirectory(
+        uri='ldap://{}'.format(ldap_host),
+        bind_dn=ldap_user,
+        password=ldap_password,
+        base_dn=ldap_base_dn,
+        page_size=int(page_size))
+
+    user_sync = UserSync(data_access_layer, directory)
+    user_sync.sync(
+        employees_filter(location, modified_within_hours),
+        full=not modified_within_hours)
+
+
 def __get_database_connection_url():
     return URL(
         drivername=environ["DB_ENGINE"],
@@ -67,6 +115,7 @@ if __name__ == '__main__':
     class TaskType(Enum):
         send_notifications = 'send_notifications'
         invalidate_overdue_reservations = 'invalidate_overdue_reservations'
+        sync_ldap_users = 'sync_ldap_users'
 
         def __str__(self):
             return self.value
@@ -80,5 +129,7 @@ if __name__ == '__main__':
 
     if args.task == TaskType.invalidate_overdue_reservations:
         invalidate_overdue_reservations()
+    elif args.task == TaskType.sync_ldap_users:
+        sync_ldap_users()
     else:
         send_notifications()
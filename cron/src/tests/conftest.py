@@ -10,16 +10,28 @@ def prepare_db(dal):
     copy = dal.copy
     rental_log = dal.rental_log
     users = dal.users
+    roles = dal.roles
+
+    connection.execute(
+        roles.insert(), [
+            {'id': 1, 'name': 'ADMIN'},
+            {'id': 2, 'name': 'USER'}
+        ]
+    )
 
     connection.execute(
         library_item.insert(), [
             {
                 'id': 1,
-                'title': 'Very interesing book'
+                'title': 'Very interesing book',
+                'total_copies': 4,
+                'available_copies': 0
             },
             {
                 'id': 2,
-                'title': 'The book part 2'
+                'title': 'The book part 2',
+                'total_copies': 2,
+                'available_copies': 0
             },
         ]
     )
@@ -31,14 +43,16 @@ def prepare_db(dal):
                 'employee_id': '1',
                 'email': 'id_1@example.com',
                 'first_name': 'id_1_first_name',
-                'surname': 'id_1_surname'
+                'surname': 'id_1_surname',
+                'active': True
             },
             {
                 'id': 2,
                 'employee_id': '2',
                 'email': 'id_2@example.com',
                 'first_name': 'id_2_first_name',
-                'surname': 'id_2_surname'
+                'surname': 'id_2_surname',
+                'active': True
             }
         ]
     )
@@ -29,6 +29,21 @@ def test_clears_reservations_for_outdated_positions(data_access_layer):
     assert len(copies) == 1 and len(rentals) == 1
 
 
+@freeze_time(datetime(2030, 5, 6))
+def test_releases_copies_in_item_counters(data_access_layer):
+    library_item = data_access_layer.library_item
+    connection = data_access_layer.connection
+
+    reservation_service = ReservationService(data_access_layer)
+    reservation_service.invalidate_overdue_reservations()
+
+    counters = dict(connection.execute(
+        select([library_item.c.id, library_item.c.available_copies])
+    ).fetchall())
+
+    assert counters == {1: 2, 2: 0}
+
+
 @freeze_time(datetime(2030, 5, 4))
 def test_does_not_clear_valid_reservations(data_access_layer):
     copy = data_access_layer.copy
@@ -65,3 +80,27 @@ def test_sets_repeatable_read_isolation_level(data_access_layer):
     reservation_service.invalidate_overdue_reservations()
 
     assert isolation_level == "SERIALIZABLE"
+
+
+@freeze_time(datetime(2030, 5, 6))
+def test_releases_copy_with_two_stale_logs_once(data_access_layer):
+    library_item = data_access_layer.library_item
+    rental_log = data_access_layer.rental_log
+    connection = data_access_layer.connection
+    connection.execute(rental_log.insert(), {
+        'id': 7,
+        'copy_id': 2,
+        'user_id': 2,
+        'book_status': BookStatus.RESERVED,
+        '_reservation_end': datetime(2030, 5, 3),
+        '_return_time': None
+    })
+
+    reservation_service = ReservationService(data_access_layer)
+    reservation_service.invalidate_overdue_reservations()
+
+    counters = dict(connection.execute(
+        select([library_item.c.id, library_item.c.available_copies])
+    ).fetchall())
+
+    assert counters == {1: 2, 2: 0}
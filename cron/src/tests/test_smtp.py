@@ -1,5 +1,10 @@
 from notifications import smtp_client
+from time import monotonic
 from unittest.mock import Mock
+import pytest
+import socket
+
+original_get_smtp_client = smtp_client._get_smtp_client
 
 
 class TestSmtp():
@@ -11,7 +16,7 @@ class TestSmtp():
             password='password')
         smtp_client_mock = Mock()
 
-        def context_manager_getter(port, host, use_tls):
+        def context_manager_getter(port, host, use_tls, timeout):
             return Mock(
                 __enter__=lambda x: smtp_client_mock,
                 __exit__=Mock())
@@ -35,7 +40,7 @@ class TestSmtp():
             use_tls=True)
         smtp_client_mock = Mock()
 
-        def context_manager_getter(port, host, use_tls):
+        def context_manager_getter(port, host, use_tls, timeout):
             return Mock(
                 __enter__=lambda x: smtp_client_mock,
                 __exit__=Mock())
@@ -46,3 +51,24 @@ class TestSmtp():
 
         smtp_client_mock.ehlo.assert_called_once()
         smtp_client_mock.starttls.assert_called_once()
+
+    def test_send_times_out_on_silent_server(self):
+        # connections are accepted by the backlog, no greeting ever comes
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        host, port = server.getsockname()
+        smtp = smtp_client.Smtp(
+            host=host,
+            port=port,
+            user='user',
+            password='password',
+            timeout=0.05)
+        smtp_client._get_smtp_client = original_get_smtp_client
+
+        started = monotonic()
+        with pytest.raises(OSError):
+            smtp.send('message')
+        server.close()
+
+        assert monotonic() - started < 1
@@ -0,0 +1,78 @@
+from sqlalchemy.sql import select
+
+from directory.user_sync import UserSync, USER_ROLE_MASK
+
+
+class FakeDirectory():
+    def __init__(self, *pages):
+        self.pages_served = 0
+        self.__pages = pages
+
+    def pages(self, filterstr, attributes):
+        for page in self.__pages:
+            self.pages_served += 1
+            yield page
+
+
+def entry(employee_id, email, first_name, surname):
+    return {
+        'employeeID': [employee_id.encode()],
+        'mail': [email.encode()],
+        'givenName': [first_name.encode()],
+        'sn': [surname.encode()]
+    }
+
+
+def users_by_employee_id(data_access_layer):
+    users = data_access_layer.users
+    return {
+        row.employee_id: row for row in
+        data_access_layer.connection.execute(select([users])).fetchall()}
+
+
+def test_adds_and_updates_users_page_by_page(data_access_layer):
+    directory = FakeDirectory(
+        [entry('1', 'id_1@example.com', 'id_1_first_name', 'id_1_surname'),
+         entry('3', 'new@example.com', 'New', 'Employee')],
+        [entry('2', 'renamed@example.com', 'Renamed', 'Employee'),
+         {'employeeID': [b'4'], 'mail': [b'incomplete@example.com']}])
+
+    result = UserSync(data_access_layer, directory).sync('(l=Wroclaw)')
+
+    assert result == (1, 1, 0)
+    assert directory.pages_served == 2
+    users = users_by_employee_id(data_access_layer)
+    assert sorted(users) == ['1', '2', '3']
+    assert users['1'].email == 'id_1@example.com'
+    assert users['2'].email == 'renamed@example.com'
+    assert users['3'].active and users['3'].role_mask == USER_ROLE_MASK
+
+
+def test_new_users_get_the_user_role(data_access_layer):
+    user_roles = data_access_layer.user_roles
+    directory = FakeDirectory(
+        [entry('3', 'new@example.com', 'New', 'Employee')])
+
+    UserSync(data_access_layer, directory).sync('(l=Wroclaw)')
+
+    user_id = users_by_employee_id(data_access_layer)['3'].id
+    assert data_access_layer.connection.execute(
+        select([user_roles.c.role_id])
+        .where(user_roles.c.user_id == user_id)).fetchall() == [(2,)]
+
+
+def test_full_sync_deactivates_missing_users(data_access_layer):
+    directory = FakeDirectory(
+        [entry('1', 'id_1@example.com', 'id_1_first_name', 'id_1_surname')])
+
+    assert UserSync(data_access_layer, directory).sync(
+        '(l=Wroclaw)') == (0, 0, 1)
+    assert users_by_employee_id(data_access_layer)['2'].active is False
+
+    directory = FakeDirectory(
+        [entry('2', 'id_2@example.com', 'id_2_first_name', 'id_2_surname')])
+
+    assert UserSync(data_access_layer, directory).sync(
+        '(l=Wroclaw)', full=False) == (0, 1, 0)
+    users = users_by_employee_id(data_access_layer)
+    assert users['1'].active and users['2'].active
@@ -5,6 +5,7 @@ from wtforms.validators import ValidationError
 from isbnlib import is_isbn10, is_isbn13
 
 from models.books import Book
+from search_engine.analysis import isbn_key
 
 
 def email_regex():
@@ -74,12 +75,16 @@ def check_category(form, field):
         raise ValidationError("This category is unavailable. Select correct!")
 
 
-def check_isbn(form, field):
+def check_isbn_number(form, field):
     field.data = field.data.replace("-", "").replace(" ", "")
     if not is_isbn10(field.data) and not is_isbn13(field.data):
         raise ValidationError("ISBN number is incorrect!")
 
-    if Book.query.filter_by(isbn=field.data).first():
+
+def check_isbn(form, field):
+    check_isbn_number(form, field)
+
+    if Book.query.filter_by(isbn_key=isbn_key(field.data)).first():
         raise ValidationError("This book is already in the database.")
 
 
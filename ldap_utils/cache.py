@@ -0,0 +1,68 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+
+class DirectoryCache:
+    """Bounded LRU cache of directory lookups with expiring entries.
+
+    Lookups that found nothing are cached too, for the shorter
+    negative_ttl, so unknown users do not hit the directory on every
+    request either.
+    """
+
+    MISSING = object()
+
+    def __init__(self, maxsize=1024, ttl=300, negative_ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the cached value of key, or MISSING."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and monotonic() >= entry[1]:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return self.MISSING
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value):
+        ttl = self.ttl if value is not None else self.negative_ttl
+        with self._lock:
+            self._entries[key] = value, monotonic() + ttl
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def lookup(self, key, load, refresh=False):
+        """Return the cached value of key, calling load() on a miss."""
+        if not refresh:
+            value = self.get(key)
+            if value is not self.MISSING:
+                return value
+        return self.set(key, load())
+
+    def discard(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
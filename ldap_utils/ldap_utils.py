@@ -1,10 +1,10 @@
 from flask import g, session
-from flask_simpleldap import LDAP
 
+from ldap_utils.pool import PooledLDAP
 from models.users import User
 
 
-ldap_client = LDAP()
+ldap_client = PooledLDAP()
 
 
 def register_hooks(app):
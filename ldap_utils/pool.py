@@ -0,0 +1,338 @@
+"""Pooled LDAP connections.
+
+Flask-SimpleLDAP opens, binds and unbinds a new connection for every
+lookup, so a login pays for several TCP (and TLS) handshakes. PooledLDAP
+keeps two bounded pools per application instead:
+
+- service connections, bound once with LDAP_USERNAME, serve lookups;
+- auth connections verify user passwords by re-binding as the user,
+  which LDAP allows on an open connection.
+
+Connections idle for longer than LDAP_POOL_CHECK_SECONDS are checked
+with a whoami before reuse, and connections that failed are dropped.
+"""
+from contextlib import contextmanager
+from queue import Empty, LifoQueue
+import re
+from threading import BoundedSemaphore, Lock
+from time import monotonic
+
+from flask import current_app
+from flask_simpleldap import LDAP, LDAPException
+import ldap
+from ldap import filter as ldap_filter
+
+from ldap_utils.cache import DirectoryCache
+from utils.circuit_breaker import CircuitBreaker
+
+
+class ConnectionPool:
+    """Bounded pool of connections made by connect().
+
+    At most size connections exist at once; callers wait up to timeout
+    seconds for one to be handed back.
+    """
+
+    def __init__(self, connect, size=4, timeout=5, check_after=60):
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.check_after = check_after
+        self.created = 0
+        self._idle = LifoQueue()
+        self._slots = BoundedSemaphore(size)
+        self._lock = Lock()
+
+    @contextmanager
+    def connection(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise LDAPException(
+                'No LDAP connection free within {}s'.format(self.timeout))
+        conn = None
+        try:
+            conn = self._checkout()
+            yield conn
+        except ldap.LDAPError:
+            if conn is not None:
+                self._discard(conn)
+                conn = None
+            raise
+        finally:
+            if conn is not None:
+                self._idle.put((conn, monotonic()))
+            self._slots.release()
+
+    def _checkout(self):
+        while True:
+            try:
+                conn, released = self._idle.get_nowait()
+            except Empty:
+                conn = self.connect()
+                with self._lock:
+                    self.created += 1
+                return conn
+            if monotonic() - released < self.check_after or \
+                    self._healthy(conn):
+                return conn
+            self._discard(conn)
+
+    @staticmethod
+    def _healthy(conn):
+        try:
+            conn.whoami_s()
+            return True
+        except ldap.LDAPError:
+            return False
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.unbind_s()
+        except ldap.LDAPError:
+            pass
+
+    def clear(self):
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except Empty:
+                return
+            self._discard(conn)
+
+
+class PooledLDAP(LDAP):
+    """Flask-SimpleLDAP client reusing connections from bounded pools.
+
+    Entries and group memberships are cached per app for LDAP_CACHE_TTL
+    seconds (LDAP_CACHE_NEGATIVE_TTL for lookups that found nothing);
+    pass refresh=True, or forget() a user, to read them again. Password
+    checks always go to the directory.
+    """
+
+    def init_app(self, app):
+        LDAP.init_app(app)
+        app.config.setdefault('LDAP_POOL_SIZE', 4)
+        app.config.setdefault('LDAP_POOL_TIMEOUT', 5)
+        app.config.setdefault('LDAP_POOL_CHECK_SECONDS', 60)
+        app.config.setdefault('LDAP_OPERATION_TIMEOUT', 10)
+        app.config.setdefault('LDAP_CACHE_SIZE', 1024)
+        app.config.setdefault('LDAP_CACHE_TTL', 300)
+        app.config.setdefault('LDAP_CACHE_NEGATIVE_TTL', 60)
+        app.config.setdefault('LDAP_BATCH_SIZE', 50)
+        app.config.setdefault('LDAP_BREAKER_THRESHOLD', 5)
+        app.config.setdefault('LDAP_BREAKER_RESET_SECONDS', 30)
+        app.config.setdefault('LDAP_LATENCY_BUDGET', None)
+        app.extensions.setdefault('circuit_breakers', {})['ldap'] = \
+            CircuitBreaker(
+                'LDAP',
+                failure_threshold=app.config['LDAP_BREAKER_THRESHOLD'],
+                reset_timeout=app.config['LDAP_BREAKER_RESET_SECONDS'],
+                latency_budget=app.config['LDAP_LATENCY_BUDGET'],
+                failures=(ldap.SERVER_DOWN, ldap.TIMEOUT, LDAPException))
+        app.extensions['ldap_cache'] = DirectoryCache(
+            maxsize=app.config['LDAP_CACHE_SIZE'],
+            ttl=app.config['LDAP_CACHE_TTL'],
+            negative_ttl=app.config['LDAP_CACHE_NEGATIVE_TTL'])
+        app.extensions['ldap_pools'] = {
+            name: ConnectionPool(
+                connect,
+                size=app.config['LDAP_POOL_SIZE'],
+                timeout=app.config['LDAP_POOL_TIMEOUT'],
+                check_after=app.config['LDAP_POOL_CHECK_SECONDS'])
+            for name, connect in (('service', self._service_connection),
+                                  ('auth', self._auth_connection))
+        }
+
+    @staticmethod
+    def pool(name):
+        return current_app.extensions['ldap_pools'][name]
+
+    @staticmethod
+    def cache():
+        return current_app.extensions['ldap_cache']
+
+    @staticmethod
+    def breaker():
+        return current_app.extensions['circuit_breakers']['ldap']
+
+    def forget(self, user):
+        """Drop the cached entry and groups of a user."""
+        self.cache().discard(('user', user, True), ('user', user, False),
+                             ('groups', user))
+
+    @property
+    def initialize(self):
+        conn = LDAP.initialize.fget(self)
+        conn.set_option(ldap.OPT_TIMEOUT,
+                        current_app.config['LDAP_OPERATION_TIMEOUT'])
+        return conn
+
+    def _service_connection(self):
+        return self.bind
+
+    def _auth_connection(self):
+        return self.initialize
+
+    def search(self, query, fields):
+        """Run a subtree search on a service connection.
+
+        A pooled connection may have been closed by the server since its
+        last use, so a search failing with SERVER_DOWN is tried once more
+        on a fresh connection. Raises CircuitOpenError without calling
+        the server while the directory is failing.
+        """
+        for attempt in (1, 2):
+            try:
+                with self.breaker().call(), \
+                        self.pool('service').connection() as conn:
+                    return conn.search_s(current_app.config['LDAP_BASE_DN'],
+                                         ldap.SCOPE_SUBTREE, query, fields)
+            except ldap.SERVER_DOWN as e:
+                if attempt == 2:
+                    raise LDAPException(self.error(e.args))
+            except ldap.LDAPError as e:
+                raise LDAPException(self.error(e.args))
+
+    def get_object_details(self, user=None, group=None, dn_only=False,
+                           refresh=False):
+        key = ('user', user, dn_only) if user is not None \
+            else ('group', group, dn_only)
+        return self.cache().lookup(
+            key, lambda: self._object_details(user, group, dn_only), refresh)
+
+    def _object_details(self, user, group, dn_only):
+        query = None
+        fields = None
+        if user is not None:
+            if not dn_only:
+                fields = current_app.config['LDAP_USER_FIELDS']
+            query = ldap_filter.filter_format(
+                current_app.config['LDAP_USER_OBJECT_FILTER'], (user,))
+        elif group is not None:
+            if not dn_only:
+                fields = current_app.config['LDAP_GROUP_FIELDS']
+            query = ldap_filter.filter_format(
+                current_app.config['LDAP_GROUP_OBJECT_FILTER'], (group,))
+        records = self.search(query, fields)
+        if not records:
+            return None
+        if dn_only:
+            if current_app.config['LDAP_OPENLDAP']:
+                return records[0][0]
+            dn = records[0][1].get(current_app.config['LDAP_OBJECTS_DN'])
+            if dn:
+                return dn[0]
+        return dict(records[0][1])
+
+    def get_users_details(self, users, refresh=False):
+        """Look up many users with one OR-filter search per batch.
+
+        Returns a dict of user to entry, or None for users not found.
+        Each entry is matched back to the user whose value it carries,
+        ignoring case, so LDAP_USER_OBJECT_FILTER may search on any
+        attribute.
+        """
+        config = current_app.config
+        cache = self.cache()
+        details = {}
+        pending = []
+        for user in dict.fromkeys(users):
+            entry = cache.MISSING if refresh \
+                else cache.get(('user', user, False))
+            if entry is cache.MISSING:
+                pending.append(user)
+            else:
+                details[user] = entry
+        batch_size = config['LDAP_BATCH_SIZE']
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            query = '(|{})'.format(''.join(
+                ldap_filter.filter_format(config['LDAP_USER_OBJECT_FILTER'],
+                                          (user,))
+                for user in batch))
+            wanted = {user.lower(): user for user in batch}
+            found = {}
+            for dn, entry in self.search(query,
+                                         config['LDAP_USER_FIELDS']) or []:
+                if dn is None:
+                    continue
+                for values in entry.values():
+                    for value in values:
+                        user = wanted.get(
+                            value.decode('utf-8', 'replace').lower())
+                        if user is not None:
+                            found.setdefault(user, dict(entry))
+            for user in batch:
+                details[user] = cache.set(('user', user, False),
+                                          found.get(user))
+        return details
+
+    def _fresh_user_dn(self, username):
+        """Read the entry of username afresh and return its DN.
+
+        The full entry is cached along with the DN, so details read right
+        after a login come from the same search as the bind.
+        """
+        config = current_app.config
+        fields = config['LDAP_USER_FIELDS']
+        records = self.search(
+            ldap_filter.filter_format(config['LDAP_USER_OBJECT_FILTER'],
+                                      (username,)),
+            fields)
+        if not records:
+            self.cache().set(('user', username, False), None)
+            return self.cache().set(('user', username, True), None)
+        dn, entry = records[0]
+        if not config['LDAP_OPENLDAP']:
+            dn = entry.get(config['LDAP_OBJECTS_DN'], [dn])[0]
+        self.cache().set(('user', username, False), dict(entry))
+        return self.cache().set(('user', username, True), dn)
+
+    def bind_user(self, username, password):
+        """Return True if the password is right and None if it is not.
+
+        Raises LDAPException, or CircuitOpenError, when the directory
+        cannot tell.
+        """
+        user_dn = self._fresh_user_dn(username)
+        if user_dn is None:
+            return None
+        if isinstance(user_dn, bytes):
+            user_dn = user_dn.decode('utf-8')
+        try:
+            with self.breaker().call(), \
+                    self.pool('auth').connection() as conn:
+                try:
+                    conn.simple_bind_s(user_dn, password)
+                except ldap.INVALID_CREDENTIALS:
+                    return None
+                return True
+        except (ldap.SERVER_DOWN, ldap.TIMEOUT) as e:
+            raise LDAPException(self.error(e.args))
+        except ldap.LDAPError:
+            return None
+
+    def get_user_groups(self, user, refresh=False):
+        return self.cache().lookup(
+            ('groups', user), lambda: self._user_groups(user), refresh)
+
+    def _user_groups(self, user):
+        config = current_app.config
+        if config['LDAP_OPENLDAP']:
+            field = str(config['LDAP_GROUP_MEMBER_FILTER_FIELD'])
+            records = self.search(
+                ldap_filter.filter_format(
+                    config['LDAP_GROUP_MEMBER_FILTER'],
+                    (self.get_object_details(user, dn_only=True),)),
+                [field])
+            return [record[1][field][0].decode('utf-8')
+                    for record in records or []]
+        field = config['LDAP_USER_GROUPS_FIELD']
+        records = self.search(
+            ldap_filter.filter_format(config['LDAP_USER_OBJECT_FILTER'],
+                                      (user,)),
+            [field])
+        if records and field in records[0][1]:
+            return [re.findall(b'(?:cn=|CN=)(.*?),', group)[0]
+                    .decode('utf-8') for group in records[0][1][field]]
+        return None
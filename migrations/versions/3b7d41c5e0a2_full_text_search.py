@@ -0,0 +1,35 @@
+"""full text search document
+
+Revision ID: 3b7d41c5e0a2
+Revises: f18462873437
+Create Date: 2026-10-17 09:12:40.118304
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '3b7d41c5e0a2'
+down_revision = 'f18462873437'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('library_item',
+                  sa.Column('search_document', sa.Text(), nullable=True))
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(
+            "CREATE INDEX ix_library_item_search_vector ON library_item "
+            "USING gin ((setweight(to_tsvector('simple', "
+            "coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('simple', "
+            "coalesce(search_document, '')), 'B')))"
+        )
+    # documents are filled in by `flask reindex_search`
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_library_item_search_vector')
+    op.drop_column('library_item', 'search_document')
@@ -0,0 +1,35 @@
+"""role mask on users
+
+Revision ID: 5a9e0c3f1b72
+Revises: d41f0a6b93c7
+Create Date: 2026-10-17 17:12:40.118254
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '5a9e0c3f1b72'
+down_revision = 'd41f0a6b93c7'
+branch_labels = None
+depends_on = None
+
+# RoleEnum names and their bits, 1 << RoleEnum value
+ROLE_BITS = {'ADMIN': 1, 'USER': 2}
+
+
+def upgrade():
+    op.add_column('users',
+                  sa.Column('role_mask', sa.Integer(), nullable=False,
+                            server_default='0'))
+    for name, bit in ROLE_BITS.items():
+        op.execute(
+            "UPDATE users SET role_mask = role_mask + {} "
+            "WHERE id IN (SELECT user_roles.user_id FROM user_roles "
+            "JOIN roles ON roles.id = user_roles.role_id "
+            "WHERE roles.name = '{}')".format(bit, name)
+        )
+
+
+def downgrade():
+    op.drop_column('users', 'role_mask')
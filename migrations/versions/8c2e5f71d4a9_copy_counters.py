@@ -0,0 +1,42 @@
+"""copy counters on library items
+
+Revision ID: 8c2e5f71d4a9
+Revises: 3b7d41c5e0a2
+Create Date: 2026-10-17 14:03:22.512870
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '8c2e5f71d4a9'
+down_revision = '3b7d41c5e0a2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('library_item',
+                  sa.Column('total_copies', sa.Integer(), nullable=False,
+                            server_default='0'))
+    op.add_column('library_item',
+                  sa.Column('available_copies', sa.Integer(), nullable=False,
+                            server_default='0'))
+    op.create_index(op.f('ix_library_item_available_copies'),
+                    'library_item', ['available_copies'], unique=False)
+    # available_status 3 is BookStatus.RETURNED
+    op.execute(
+        "UPDATE library_item SET "
+        "total_copies = (SELECT count(*) FROM copy "
+        "WHERE copy.library_item_id = library_item.id), "
+        "available_copies = (SELECT count(*) FROM copy "
+        "WHERE copy.library_item_id = library_item.id "
+        "AND copy.available_status = 3)"
+    )
+
+
+def downgrade():
+    op.drop_index(op.f('ix_library_item_available_copies'),
+                  table_name='library_item')
+    op.drop_column('library_item', 'available_copies')
+    op.drop_column('library_item', 'total_copies')
@@ -0,0 +1,101 @@
+"""unique employee id on users
+
+Revision ID: 9d3b6e2a7c15
+Revises: 5a9e0c3f1b72
+Create Date: 2026-10-17 19:26:04.371520
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '9d3b6e2a7c15'
+down_revision = '5a9e0c3f1b72'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger('alembic.env')
+
+
+def upgrade():
+    users = sa.table('users', sa.column('id'), sa.column('employee_id'),
+                     sa.column('email'), sa.column('active'),
+                     sa.column('role_mask'))
+    user_roles = sa.table('user_roles', sa.column('user_id'),
+                          sa.column('role_id'))
+    rental_log = sa.table('rental_log', sa.column('user_id'))
+    likes = sa.table('wish_list_likes', sa.column('id'),
+                     sa.column('user_id'), sa.column('wish_item_id'))
+    connection = op.get_bind()
+    rows = connection.execute(
+        sa.select([users.c.id, users.c.employee_id, users.c.email,
+                   users.c.active, users.c.role_mask])
+        .order_by(users.c.id)
+    ).fetchall()
+    # NULLs do not collide under a unique constraint and login and the
+    # directory sync never match them, so those accounts are kept as they
+    # are; they are logged for an admin to fill in the employee id
+    unmatched = [row for row in rows if row.employee_id is None]
+    if unmatched:
+        logger.warning('%d users have no employee id and cannot log in '
+                       'until one is set: %s', len(unmatched),
+                       ', '.join('user {} ({})'.format(row.id, row.email)
+                                 for row in unmatched))
+    accounts = {}
+    for row in rows:
+        if row.employee_id is not None:
+            accounts.setdefault(row.employee_id, []).append(row)
+    # the oldest account keeps the employee id; the others are merged into
+    # it, their loans, likes and roles moved over, and then deleted
+    for employee_id, duplicates in accounts.items():
+        if len(duplicates) < 2:
+            continue
+        kept, merged = duplicates[0], [row.id for row in duplicates[1:]]
+        logger.warning('Employee id %s belongs to %d users: %s. Merging '
+                       'them into user %s.', employee_id, len(duplicates),
+                       ', '.join('user {} ({})'.format(row.id, row.email)
+                                 for row in duplicates),
+                       kept.id)
+        connection.execute(
+            rental_log.update()
+            .where(rental_log.c.user_id.in_(merged))
+            .values(user_id=kept.id))
+        liked = sa.select([likes.c.wish_item_id]) \
+            .where(likes.c.user_id == kept.id)
+        held = sa.select([user_roles.c.role_id]) \
+            .where(user_roles.c.user_id == kept.id)
+        for user_id in merged:
+            connection.execute(
+                likes.delete()
+                .where(likes.c.user_id == user_id)
+                .where(likes.c.wish_item_id.in_(liked)))
+            connection.execute(
+                likes.update()
+                .where(likes.c.user_id == user_id)
+                .values(user_id=kept.id))
+            connection.execute(
+                user_roles.delete()
+                .where(user_roles.c.user_id == user_id)
+                .where(user_roles.c.role_id.in_(held)))
+            connection.execute(
+                user_roles.update()
+                .where(user_roles.c.user_id == user_id)
+                .values(user_id=kept.id))
+        role_mask, active = kept.role_mask, kept.active
+        for row in duplicates[1:]:
+            role_mask |= row.role_mask
+            active = active or row.active
+        connection.execute(users.delete().where(users.c.id.in_(merged)))
+        connection.execute(
+            users.update()
+            .where(users.c.id == kept.id)
+            .values(role_mask=role_mask, active=active))
+    # login upserts accounts with ON CONFLICT (employee_id)
+    op.create_unique_constraint('users_employee_id_key', 'users',
+                                ['employee_id'])
+
+
+def downgrade():
+    op.drop_constraint('users_employee_id_key', 'users', type_='unique')
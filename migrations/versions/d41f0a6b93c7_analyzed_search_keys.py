@@ -0,0 +1,43 @@
+"""analyzed search keys
+
+Revision ID: d41f0a6b93c7
+Revises: 8c2e5f71d4a9
+Create Date: 2026-10-17 16:40:51.208417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'd41f0a6b93c7'
+down_revision = '8c2e5f71d4a9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('library_item',
+                  sa.Column('search_title', sa.Text(), nullable=True))
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_library_item_search_vector')
+        op.execute(
+            "CREATE INDEX ix_library_item_search_vector ON library_item "
+            "USING gin ((setweight(to_tsvector('simple', "
+            "coalesce(search_title, '')), 'A') || "
+            "setweight(to_tsvector('simple', "
+            "coalesce(search_document, '')), 'B')))"
+        )
+    # keys are filled in by `flask reindex_search`
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_library_item_search_vector')
+        op.execute(
+            "CREATE INDEX ix_library_item_search_vector ON library_item "
+            "USING gin ((setweight(to_tsvector('simple', "
+            "coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('simple', "
+            "coalesce(search_document, '')), 'B')))"
+        )
+    op.drop_column('library_item', 'search_title')
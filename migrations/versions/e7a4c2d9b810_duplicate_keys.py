@@ -0,0 +1,83 @@
+"""normalized title and isbn keys
+
+Revision ID: e7a4c2d9b810
+Revises: 9d3b6e2a7c15
+Create Date: 2026-10-17 20:12:47.630914
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+from search_engine.analysis import isbn_key, title_key
+
+# revision identifiers, used by Alembic.
+revision = 'e7a4c2d9b810'
+down_revision = '9d3b6e2a7c15'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger('alembic.env')
+
+
+def upgrade():
+    op.add_column('library_item',
+                  sa.Column('title_key', sa.String(length=256),
+                            nullable=True))
+    op.add_column('books',
+                  sa.Column('isbn_key', sa.String(length=128),
+                            nullable=True))
+    library_item = sa.table('library_item', sa.column('id'),
+                            sa.column('title'), sa.column('title_key'))
+    books = sa.table('books', sa.column('id'), sa.column('isbn'),
+                     sa.column('isbn_key'))
+    connection = op.get_bind()
+    titles = connection.execute(
+        sa.select([library_item.c.id, library_item.c.title])).fetchall()
+    if titles:
+        connection.execute(
+            library_item.update()
+            .where(library_item.c.id == sa.bindparam('b_id'))
+            .values(title_key=sa.bindparam('b_key')),
+            [{'b_id': item_id, 'b_key': title_key(title)}
+             for item_id, title in titles])
+    isbns = connection.execute(
+        sa.select([books.c.id, books.c.isbn]).order_by(books.c.id)
+    ).fetchall()
+    # the oldest book keeps a key written in several forms, so the unique
+    # constraint below holds; the others are left for an admin to merge
+    keys, conflicts = {}, {}
+    for book_id, isbn in isbns:
+        key = isbn_key(isbn)
+        if key is None:
+            continue
+        if key in keys:
+            conflicts.setdefault(key, [keys[key]]).append((book_id, isbn))
+        else:
+            keys[key] = (book_id, isbn)
+    for key, duplicates in conflicts.items():
+        logger.warning('ISBN %s is in the catalog %d times: %s. Book %s '
+                       'keeps the ISBN key, merge the others into it.',
+                       key, len(duplicates),
+                       ', '.join('book {} ({})'.format(book_id, isbn)
+                                 for book_id, isbn in duplicates),
+                       duplicates[0][0])
+    if keys:
+        connection.execute(
+            books.update()
+            .where(books.c.id == sa.bindparam('b_id'))
+            .values(isbn_key=sa.bindparam('b_key')),
+            [{'b_id': book_id, 'b_key': key}
+             for key, (book_id, _) in keys.items()])
+    op.create_index(op.f('ix_library_item_title_key'), 'library_item',
+                    ['title_key'], unique=False)
+    op.create_unique_constraint('books_isbn_key_key', 'books', ['isbn_key'])
+
+
+def downgrade():
+    op.drop_constraint('books_isbn_key_key', 'books', type_='unique')
+    op.drop_index(op.f('ix_library_item_title_key'),
+                  table_name='library_item')
+    op.drop_column('books', 'isbn_key')
+    op.drop_column('library_item', 'title_key')
@@ -16,6 +16,9 @@ class Book(LibraryItem):
     __tablename__ = "books"
     id = db.Column(db.ForeignKey("library_item.id"), primary_key=True)
     isbn = db.Column(db.String(128), unique=True)
+    # isbn without separators and an ISBN-10 as its ISBN-13, so one
+    # number entered in two forms collides
+    isbn_key = db.Column(db.String(128), unique=True)
     authors = db.relationship(
         "Author",
         secondary="books_authors",
@@ -0,0 +1,127 @@
+"""Batched lookups for catalog writes.
+
+Forms and importers name authors and tags rather than pass rows. These
+helpers find the existing rows with one query per chunk of names and
+insert the missing ones with a single executemany, inside the caller's
+transaction, so a failed write leaves no orphan authors or tags behind.
+
+Editing an item changes which authors and tags it points at, never the
+shared rows themselves, so other items keep their names.
+"""
+from sqlalchemy import tuple_
+from sqlalchemy.orm.attributes import set_committed_value
+
+from init_db import db
+from models.books import Author, book_author
+from models.library import Tag, item_tags
+
+# names per IN list, below the bound parameter limit of SQLite
+CHUNK_SIZE = 400
+
+
+def chunks(values, size=CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def author_names(pairs):
+    """Return the complete (first_name, last_name) pairs, in order and
+    without repeats."""
+    return list(dict.fromkeys(
+        (first_name, last_name) for first_name, last_name in pairs
+        if first_name and last_name))
+
+
+def resolve_authors(names):
+    """Return {(first_name, last_name): Author} for names, in their
+    order, inserting authors that do not exist yet."""
+    names = author_names(names)
+    found = _load_authors(names)
+    missing = [name for name in names if name not in found]
+    if missing:
+        db.session.execute(Author.__table__.insert(), [
+            {'first_name': first_name, 'last_name': last_name}
+            for first_name, last_name in missing])
+        found.update(_load_authors(missing))
+    return {name: found[name] for name in names}
+
+
+def _load_authors(names):
+    found = {}
+    for chunk in chunks(names):
+        # the oldest author wins where a name was entered twice
+        for author in Author.query.filter(
+                tuple_(Author.first_name, Author.last_name).in_(chunk)
+        ).order_by(Author.id.desc()):
+            found[author.first_name, author.last_name] = author
+    return found
+
+
+def resolve_tags(names):
+    """Return {name: Tag} for names, inserting tags that do not exist
+    yet."""
+    names = list(dict.fromkeys(name for name in names if name))
+    found = _load_tags(names)
+    missing = [name for name in names if name not in found]
+    if missing:
+        db.session.execute(Tag.__table__.insert(),
+                           [{'name': name} for name in missing])
+        found.update(_load_tags(missing))
+    return {name: found[name] for name in names}
+
+
+def _load_tags(names):
+    found = {}
+    for chunk in chunks(names):
+        for tag in Tag.query.filter(Tag.name.in_(chunk)):
+            found[tag.name] = tag
+    return found
+
+
+def set_authors(book, names):
+    """Make the authors named the authors of book.
+
+    The change is worked out against the loaded book.authors and
+    applied with one DELETE and one INSERT on books_authors at most.
+    """
+    names = author_names(names)
+    kept, removed = {}, []
+    for author in book.authors:
+        name = (author.first_name, author.last_name)
+        if name in names and name not in kept:
+            kept[name] = author
+        else:
+            removed.append(author.id)
+    added = resolve_authors(name for name in names if name not in kept)
+    if removed:
+        db.session.execute(book_author.delete().where(
+            (book_author.c.book_id == book.id) &
+            book_author.c.author_id.in_(removed)))
+    if added:
+        db.session.execute(book_author.insert(), [
+            {'book_id': book.id, 'author_id': author.id}
+            for author in added.values()])
+    set_committed_value(book, 'authors', [kept.get(name) or added[name]
+                                          for name in names])
+
+
+def set_tags(item, names):
+    """Make the tags named the tags of item, like set_authors."""
+    names = list(dict.fromkeys(name for name in names if name))
+    kept, removed = {}, []
+    for tag in item.tags:
+        if tag.name in names and tag.name not in kept:
+            kept[tag.name] = tag
+        else:
+            removed.append(tag.id)
+    added = resolve_tags(name for name in names if name not in kept)
+    if removed:
+        db.session.execute(item_tags.delete().where(
+            (item_tags.c.item_id == item.id) &
+            item_tags.c.tag_id.in_(removed)))
+    if added:
+        db.session.execute(item_tags.insert(), [
+            {'item_id': item.id, 'tag_id': tag.id} for tag in added.values()])
+    set_committed_value(item, 'tags', [kept.get(name) or added[name]
+                                       for name in names])
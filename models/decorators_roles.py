@@ -1,6 +1,7 @@
-from flask import session, redirect, url_for, flash
+from flask import g, session, redirect, url_for, flash
 from functools import wraps
-from models.users import User
+from time import time
+from models.users import User, mask_has_role, role_cache
 
 
 # README
@@ -19,6 +20,67 @@ from models.users import User
 #     ...
 
 
+def current_user():
+    """Return the logged in user, loaded once per request."""
+    if 'current_user' not in g:
+        g.current_user = None
+        if 'id' in session:
+            g.current_user = User.query.get(session['id'])
+            if g.current_user is not None:
+                role_cache.set(g.current_user.id, g.current_user.role_mask)
+    return g.current_user
+
+
+def login_session(user):
+    """Store the user and its role mask in the signed session cookie.
+
+    user may be a User or any row with id, email and role_mask.
+    """
+    session['logged_in'] = True
+    session['id'] = user.id
+    session['email'] = user.email
+    store_session_roles(user.role_mask)
+
+
+def store_session_roles(mask):
+    """Store a role mask in the session, with the time it was read."""
+    session['roles'] = mask
+    session['roles_checked'] = time()
+    if mask_has_role(mask, 'ADMIN'):
+        session['admin'] = True
+    else:
+        session.pop('admin', None)
+
+
+def session_roles_stale():
+    """Tell if the session's role mask has to be read again.
+
+    The mask is trusted for role_cache.ttl seconds, unless this process
+    has changed the user's roles since it was read.
+    """
+    checked = session.get('roles_checked')
+    return 'roles' not in session or checked is None or \
+        time() - checked >= role_cache.ttl or \
+        role_cache.changed_since(session['id'], checked)
+
+
+def current_user_has_role(role):
+    """Authorize from the session's role mask, without a query.
+
+    A stale mask, or none at all in sessions from before role masks, is
+    read again from the per-process role cache, which loads it from the
+    database on a miss. Role changes made in this process reach live
+    sessions on their next request; changes made by another process
+    (e.g. `flask create_admin`) within two role_cache.ttl periods, as the
+    cache of each worker may hold the old mask for one of them.
+    """
+    if 'id' not in session:
+        return False
+    if session_roles_stale():
+        store_session_roles(role_cache.role_mask(session['id']))
+    return mask_has_role(session['roles'], role)
+
+
 def require_logged_in(redirect_page="library.login"):
     def decorator(func):
         @wraps(func)
@@ -61,8 +123,7 @@ def require_role(role="USER", redirect_page="library.index"):
         def inner_func(*args, **kwargs):
             not_authorized_msg = "You are not authorized to access this page!"
             if "id" in session:
-                user = User.query.get(session["id"])
-                if user.has_role(role):
+                if current_user_has_role(role):
                     return func(*args, **kwargs)
                 else:
                     flash(not_authorized_msg)
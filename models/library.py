@@ -1,5 +1,8 @@
 from enum import Enum
 import pytz
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
 from sqlalchemy_utils import ChoiceType
 from init_db import db
 
@@ -154,6 +157,20 @@ class LibraryItem(db.Model):
                            backref=db.backref('library_items'))
     description = db.Column(db.Text)
     type = db.Column(db.String(32))
+    # analyzed keys of the title and of title, authors, tags and
+    # description, kept in sync by search_engine.documents and indexed
+    # for full-text search on PostgreSQL
+    search_title = db.Column(db.Text)
+    search_document = db.Column(db.Text)
+    # title without case, diacritics, spaces and punctuation, looked up
+    # to find duplicates; also kept in sync by search_engine.documents
+    title_key = db.Column(db.String(256), index=True)
+    # number of copies and of copies available to reserve, kept in step
+    # with Copy rows by the listeners below (and by the cron service)
+    total_copies = db.Column(db.Integer, nullable=False,
+                             default=0, server_default='0')
+    available_copies = db.Column(db.Integer, nullable=False,
+                                 default=0, server_default='0', index=True)
 
     __mapper_args__ = {
         'polymorphic_identity': 'library_item',
@@ -181,3 +198,92 @@ class LibraryItem(db.Model):
                 'title': self.title,
                 'issue': self.issue,
                 'type': self.type}
+
+
+def _copy_counts(library_item_id, status):
+    """Return the (total, available) contribution of one copy."""
+    if library_item_id is None:
+        return None
+    return library_item_id, 1, int(status == BookStatus.RETURNED)
+
+
+def _adjust_copy_counters(connection, target, old, new):
+    deltas = {}
+    for counts, sign in ((old, -1), (new, 1)):
+        if counts is not None:
+            item_id, total, available = counts
+            item_total, item_available = deltas.get(item_id, (0, 0))
+            deltas[item_id] = (item_total + sign * total,
+                               item_available + sign * available)
+    items = LibraryItem.__table__
+    for item_id, (total, available) in deltas.items():
+        if total or available:
+            connection.execute(
+                items.update()
+                .where(items.c.id == item_id)
+                .values(total_copies=items.c.total_copies + total,
+                        available_copies=items.c.available_copies +
+                        available))
+            session = Session.object_session(target)
+            session.info.setdefault('copy_counter_items', set()).add(item_id)
+
+
+@event.listens_for(Copy, 'after_insert')
+def count_inserted_copy(mapper, connection, target):
+    _adjust_copy_counters(
+        connection, target, None,
+        _copy_counts(target.library_item_id, target.available_status))
+
+
+@event.listens_for(Copy, 'after_delete')
+def count_deleted_copy(mapper, connection, target):
+    _adjust_copy_counters(
+        connection, target,
+        _copy_counts(target.library_item_id, target.available_status), None)
+
+
+@event.listens_for(Copy.available_status, 'set', active_history=True)
+@event.listens_for(Copy.library_item_id, 'set', active_history=True)
+def load_replaced_copy_value(target, value, oldvalue, initiator):
+    # active_history loads the old value of an expired attribute before
+    # it is replaced, so count_updated_copy always knows what changed
+    return value
+
+
+@event.listens_for(Copy, 'after_update')
+def count_updated_copy(mapper, connection, target):
+    item_history = get_history(target, 'library_item_id')
+    status_history = get_history(target, 'available_status')
+    if not (item_history.has_changes() or status_history.has_changes()):
+        return
+    old_item = (item_history.deleted or item_history.unchanged)[0]
+    old_status = (status_history.deleted or status_history.unchanged)[0]
+    _adjust_copy_counters(
+        connection, target,
+        _copy_counts(old_item, old_status),
+        _copy_counts(target.library_item_id, target.available_status))
+
+
+@event.listens_for(Session, 'after_flush')
+def expire_copy_counters(session, flush_context):
+    """Reload counters changed behind the ORM's back on next access.
+
+    The raw UPDATEs fire no LibraryItem events, so the ids are kept in
+    session.info['copy_counters_changed'] until the transaction ends for
+    the search indexes and caches to pick up.
+    """
+    item_ids = session.info.pop('copy_counter_items', ())
+    for item_id in item_ids:
+        item = session.identity_map.get(
+            LibraryItem.__mapper__.identity_key_from_primary_key([item_id]))
+        if item is not None:
+            session.expire(item, ['total_copies', 'available_copies'])
+    if item_ids:
+        session.info.setdefault('copy_counters_changed', set()).update(
+            item_ids)
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_soft_rollback')
+def forget_copy_counters(session, *args):
+    session.info.pop('copy_counters_changed', None)
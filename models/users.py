@@ -1,6 +1,9 @@
 import enum
+from threading import Lock
+from time import monotonic, time
 
-from sqlalchemy import event
+from sqlalchemy import event, literal, literal_column, select, true
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 from flask_user import UserMixin
 
@@ -30,8 +33,11 @@ class User(db.Model, UserMixin):
     email = db.Column(db.String(128), unique=True, nullable=False)
     first_name = db.Column(db.String(64), nullable=False)
     surname = db.Column(db.String(64), nullable=False)
-    employee_id = db.Column(db.String(64), nullable=False)
+    employee_id = db.Column(db.String(64), nullable=False, unique=True)
     active = db.Column(db.Boolean)
+    # RoleEnum bits of the rows in user_roles, see sync_role_mask
+    role_mask = db.Column(db.Integer, nullable=False, default=0,
+                          server_default="0")
     roles = db.relationship(
         "Role",
         secondary=user_roles,
@@ -53,7 +59,8 @@ class User(db.Model, UserMixin):
 
     def __init__(self, **kwargs):
         super(User, self).__init__(**kwargs)
-        role = Role.query.filter_by(name=RoleEnum.USER).first()
+        # found in the session's identity map after the first user
+        role = Role.query.get(role_cache.role_id(RoleEnum.USER))
         self.roles.append(role)
 
     def __repr__(self):
@@ -62,14 +69,22 @@ class User(db.Model, UserMixin):
         )
 
     def has_role(self, role):
-        if type(role) is str:
-            try:
-                role = RoleEnum[role.upper()]
-            except ValueError:
-                raise ValueError("No role with that name.")
-        if type(role) is not RoleEnum:
-            raise ValueError("No such role.")
-        return role in [r.name for r in self.roles]
+        return mask_has_role(self.role_mask, role)
+
+
+def role_enum(role):
+    if type(role) is str:
+        try:
+            role = RoleEnum[role.upper()]
+        except ValueError:
+            raise ValueError("No role with that name.")
+    if type(role) is not RoleEnum:
+        raise ValueError("No such role.")
+    return role
+
+
+def mask_has_role(mask, role):
+    return bool((mask or 0) & role_enum(role).bit)
 
 
 class RoleEnum(enum.Enum):
@@ -79,6 +94,10 @@ class RoleEnum(enum.Enum):
     def __str__(self):
         return self.name
 
+    @property
+    def bit(self):
+        return 1 << self.value
+
 
 class Role(db.Model):
     __tablename__ = "roles"
@@ -89,6 +108,151 @@ class Role(db.Model):
         return "Role: {}".format(self.name)
 
 
+class RoleCache:
+    """Role masks of users kept per process, for permission checks of
+    sessions that do not carry one.
+
+    Role changes made through User.roles invalidate the user's entry and
+    record when it happened, see changed_since; entries also expire after
+    ttl seconds, as roles may be changed by another process (e.g. `flask
+    create_admin`).
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._entries = {}
+        self._changed = {}
+        self._role_ids = {}
+        self._lock = Lock()
+
+    def configure(self, ttl):
+        self.ttl = ttl
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or monotonic() >= entry[1]:
+                return None
+            return entry[0]
+
+    def set(self, user_id, mask):
+        with self._lock:
+            self._entries[user_id] = mask, monotonic() + self.ttl
+        return mask
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._changed[user_id] = time()
+
+    def changed_since(self, user_id, timestamp):
+        """Tell if this process changed the user's roles after timestamp."""
+        return self._changed.get(user_id, 0) > timestamp
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._changed.clear()
+            self._role_ids.clear()
+
+    def role_id(self, role):
+        """Return the id of a role row; roles never change once created."""
+        role = role_enum(role)
+        role_id = self._role_ids.get(role)
+        if role_id is None:
+            role_id = db.session.query(Role.id).filter_by(name=role).scalar()
+            if role_id is not None:
+                with self._lock:
+                    self._role_ids[role] = role_id
+        return role_id
+
+    def role_mask(self, user_id):
+        """Return the role mask of a user, loading it on a miss."""
+        mask = self.get(user_id)
+        if mask is None:
+            mask = self.set(user_id, db.session.query(User.role_mask)
+                            .filter_by(id=user_id).scalar() or 0)
+        return mask
+
+    def has_role(self, user_id, role):
+        return mask_has_role(self.role_mask(user_id), role)
+
+
+role_cache = RoleCache()
+
+
+def upsert_user(email, first_name, surname, employee_id):
+    """Create the account of an employee or update its directory data.
+
+    Returns the (id, email, role_mask) row of the account; new accounts
+    get the USER role. On PostgreSQL this is a single INSERT ... ON
+    CONFLICT (employee_id), whose user_roles insert runs in the same
+    statement. Other databases try an UPDATE first and INSERT when no
+    account matched.
+    """
+    users = User.__table__
+    values = dict(email=email, first_name=first_name, surname=surname)
+    role_id = role_cache.role_id(RoleEnum.USER)
+    if db.session.get_bind().dialect.name == "postgresql":
+        insert = pg_insert(users).values(
+            employee_id=employee_id, active=True,
+            role_mask=RoleEnum.USER.bit, **values)
+        upserted = insert.on_conflict_do_update(
+            index_elements=[users.c.employee_id],
+            set_={name: insert.excluded[name] for name in values},
+        ).returning(
+            users.c.id, users.c.email, users.c.role_mask,
+            literal_column("xmax = 0").label("inserted"),
+        ).cte("upserted")
+        granted = user_roles.insert().from_select(
+            ["user_id", "role_id"],
+            select([upserted.c.id, literal(role_id)])
+            .where(upserted.c.inserted),
+        ).returning(user_roles.c.user_id).cte("granted")
+        return db.session.execute(
+            select([upserted.c.id, upserted.c.email, upserted.c.role_mask])
+            .select_from(upserted.outerjoin(granted, true()))
+        ).first()
+
+    updated = db.session.execute(
+        users.update().where(users.c.employee_id == employee_id)
+        .values(**values)
+    )
+    if not updated.rowcount:
+        user_id = db.session.execute(
+            users.insert().values(employee_id=employee_id, active=True,
+                                  role_mask=RoleEnum.USER.bit, **values)
+        ).inserted_primary_key[0]
+        db.session.execute(
+            user_roles.insert().values(user_id=user_id, role_id=role_id))
+    return db.session.execute(
+        select([users.c.id, users.c.email, users.c.role_mask])
+        .where(users.c.employee_id == employee_id)
+    ).first()
+
+
+@event.listens_for(User.roles, "append")
+def sync_role_mask(target, value, initiator):
+    target.role_mask = (target.role_mask or 0) | value.name.bit
+
+
+@event.listens_for(User.roles, "remove")
+def clear_role_mask(target, value, initiator):
+    target.role_mask = (target.role_mask or 0) & ~value.name.bit
+
+
+@event.listens_for(User.roles, "append")
+@event.listens_for(User.roles, "remove")
+def invalidate_cached_roles(target, value, initiator):
+    if target.id is not None:
+        role_cache.invalidate(target.id)
+
+
+@event.listens_for(User, "after_delete")
+def forget_cached_roles(mapper, connection, target):
+    role_cache.invalidate(target.id)
+
+
 @event.listens_for(Role.__table__, "after_create")
 def insert_initial_values(*args, **kwargs):
     for role in RoleEnum:
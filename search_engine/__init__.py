@@ -0,0 +1,41 @@
+from search_engine.backends import (
+    cache_stats,
+    catalog_index,
+    get_search_backend,
+    search_catalog
+)
+from search_engine.analysis import analyze, analyze_query
+from search_engine.cache import catalog_generation
+from search_engine.documents import build_search_document
+from search_engine.facets import facet_options, parse_filters, toggle_filter
+from search_engine.full_text import search_library_items, query_terms
+from search_engine.fuzzy import fuzzy_search_catalog, fuzzy_search_wishlist
+from search_engine.suggest import suggest
+from search_engine.indexer import (
+    catalog_indexer,
+    init_app as init_search_indexes,
+    wishlist_indexer
+)
+
+
+__all__ = [
+    'analyze',
+    'analyze_query',
+    'build_search_document',
+    'cache_stats',
+    'catalog_generation',
+    'catalog_index',
+    'catalog_indexer',
+    'facet_options',
+    'fuzzy_search_catalog',
+    'fuzzy_search_wishlist',
+    'get_search_backend',
+    'init_search_indexes',
+    'parse_filters',
+    'search_catalog',
+    'search_library_items',
+    'query_terms',
+    'suggest',
+    'toggle_filter',
+    'wishlist_indexer',
+]
@@ -0,0 +1,160 @@
+"""Text analysis shared by catalog indexing and querying.
+
+Text goes through normalization (NFKC, case folding), diacritic folding
+("Łódź" -> "lodz"), tokenization, stop word removal and light suffix
+stripping for Polish and English. Indexing and querying must use the
+same pipeline for their keys to meet. The title and ISBN keys used to
+find duplicate books come from the same normalization.
+"""
+import re
+import unicodedata
+
+
+TOKEN_REGEX = re.compile(r'\w+', re.UNICODE)
+ISBN_SEPARATORS = re.compile(r'[\s-]+')
+
+# letters that do not decompose into a base letter and a combining mark
+FOLDED_LETTERS = str.maketrans({
+    'ł': 'l',
+    'đ': 'd',
+    'ø': 'o',
+    'ß': 'ss',
+    'æ': 'ae',
+    'œ': 'oe',
+})
+
+STOP_WORDS = {
+    'en': {'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from',
+           'in', 'into', 'is', 'it', 'of', 'on', 'or', 'the', 'to', 'with'},
+    # folded, so "się" is "sie" and "że" is "ze"
+    'pl': {'a', 'ale', 'czy', 'dla', 'do', 'i', 'jak', 'jest', 'na', 'nie',
+           'o', 'od', 'oraz', 'po', 'sie', 'to', 'u', 'w', 'we', 'z', 'za',
+           'ze'},
+}
+
+# inflectional endings of folded Polish words, longest first
+POLISH_SUFFIXES = ('owiach', 'owie', 'ami', 'ach', 'owi', 'ego', 'emu',
+                   'ich', 'ych', 'imi', 'ymi', 'iem', 'ow', 'om', 'ie',
+                   'ej', 'em', 'a', 'e', 'i', 'o', 'u', 'y')
+
+MIN_STEM = 3
+
+# LibraryItem.language values and the stemmers they use; other or
+# unknown languages (and queries) get keys for both
+LANGUAGES = {
+    'polish': ('pl',),
+    'english': ('en',),
+}
+ALL_LANGUAGES = ('en', 'pl')
+
+
+def normalize(text):
+    """Return text in NFKC form, case folded, with collapsed whitespace."""
+    text = unicodedata.normalize('NFKC', str(text or '')).casefold()
+    return ' '.join(text.split())
+
+
+def fold(text):
+    """Strip diacritics from normalized text."""
+    decomposed = unicodedata.normalize('NFKD', text.translate(FOLDED_LETTERS))
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def tokens(text):
+    """Split text into normalized, folded tokens."""
+    return TOKEN_REGEX.findall(fold(normalize(text)))
+
+
+def title_key(title):
+    """Return the key under which equal titles meet: the tokens run
+    together, so "Clean Code" and "clean-code." share "cleancode".
+    """
+    return ''.join(tokens(title)).replace('_', '')
+
+
+def isbn_key(isbn):
+    """Return isbn as 13 characters without separators, or None.
+
+    An ISBN-10 gets the 978 prefix and a new check digit, so both forms
+    of a number share the key.
+    """
+    key = ISBN_SEPARATORS.sub('', str(isbn or '')).upper()
+    if len(key) == 10 and key[:9].isdigit():
+        key = '978' + key[:9]
+        check = sum(int(digit) * (3 if i % 2 else 1)
+                    for i, digit in enumerate(key))
+        key += str(-check % 10)
+    return key or None
+
+
+def stem_english(token):
+    if len(token) <= MIN_STEM:
+        return token
+    if token.endswith('ies') and len(token) > 4:
+        return token[:-3] + 'y'
+    if token.endswith(('sses', 'xes', 'zes', 'ches', 'shes')):
+        return token[:-2]
+    if token.endswith('s') and not token.endswith(('ss', 'us', 'is')):
+        return token[:-1]
+    if token.endswith('ing') and len(token) - 3 >= MIN_STEM + 1:
+        return token[:-3]
+    if token.endswith('ed') and len(token) - 2 >= MIN_STEM + 1:
+        return token[:-2]
+    return token
+
+
+def stem_polish(token):
+    for suffix in POLISH_SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= MIN_STEM:
+            return token[:-len(suffix)]
+    return token
+
+
+STEMMERS = {
+    'en': stem_english,
+    'pl': stem_polish,
+}
+
+
+def languages_of(language):
+    return LANGUAGES.get(normalize(language), ALL_LANGUAGES)
+
+
+def _without_stop_words(words, languages):
+    stop_words = set().union(*(STOP_WORDS[lang] for lang in languages))
+    kept = [word for word in words if word not in stop_words]
+    # a query made only of stop words ("The It") still has to match
+    return kept or words
+
+
+def token_keys(token, languages):
+    """Return the distinct stems of a token in the given languages."""
+    keys = []
+    for lang in languages:
+        key = STEMMERS[lang](token)
+        if key not in keys:
+            keys.append(key)
+    return tuple(keys)
+
+
+def analyze(text, language=None):
+    """Return the index keys of text written in language.
+
+    Text in a language without a stemmer is keyed in every supported
+    language, so a query in either one finds it.
+    """
+    languages = languages_of(language)
+    keys = []
+    for token in _without_stop_words(tokens(text), languages):
+        keys.extend(token_keys(token, languages))
+    return keys
+
+
+def analyze_query(text):
+    """Return query terms, each a tuple of alternative keys.
+
+    The language of a query is unknown, so every term carries its stem
+    in each language and matches a document having any of them.
+    """
+    return [token_keys(token, ALL_LANGUAGES)
+            for token in _without_stop_words(tokens(text), ALL_LANGUAGES)]
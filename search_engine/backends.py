@@ -0,0 +1,128 @@
+from flask import abort, current_app, request
+from flask_sqlalchemy import Pagination
+
+from models import LibraryItem
+from search_engine.full_text import (
+    get_full_text_engine,
+    query_terms,
+    search_library_items
+)
+from search_engine.cache import QueryCache, catalog_generation
+from search_engine.facets import (
+    apply_filters,
+    cached_facets,
+    count_document_facets,
+    count_facets,
+    facet_cache,
+    filter_documents
+)
+from search_engine.indexer import catalog_indexer
+from search_engine.inverted_index import InvertedIndex, listing_entry
+from search_engine.listing import listing_entries, listing_query
+from utils.pagination import KeysetPagination, SortKey, keyset_enabled
+
+
+catalog_index = catalog_indexer.register(InvertedIndex())
+page_cache = QueryCache()
+
+
+class SqlSearchBackend:
+    """Answers searches with database queries."""
+
+    def search(self, query_str, page, per_page, filters=None):
+        if keyset_enabled():
+            pagination = self.seek(query_str, per_page, filters)
+        else:
+            query = apply_filters(listing_query(), filters or {})
+            pagination = search_library_items(query_str, query).paginate(
+                page, per_page, error_out=True)
+        pagination.items = listing_entries(pagination.items)
+        return pagination
+
+    def seek(self, query_str, per_page, filters=None):
+        """Keyset page ordered by (rank, title, id), or (title, id) when
+        browsing without a query."""
+        query = apply_filters(listing_query(), filters or {})
+        keys = [SortKey(LibraryItem.title), SortKey(LibraryItem.id)]
+        terms = query_terms(query_str)
+        if terms:
+            query, rank = get_full_text_engine().match(query, terms)
+            keys.insert(0, SortKey(rank, descending=True))
+        return KeysetPagination(query, keys, per_page,
+                                cursor=request.args.get('cursor'))
+
+    def facets(self, query_str, filters):
+        return cached_facets(query_str, filters,
+                             lambda: count_facets(query_str, filters))
+
+
+class MemorySearchBackend:
+    """Answers searches from the in-process catalog index."""
+
+    def search(self, query_str, page, per_page, filters=None):
+        documents = self._documents(query_str, filters)
+        start = (page - 1) * per_page
+        if page < 1 or (page > 1 and start >= len(documents)):
+            abort(404)
+        items = [listing_entry(document)
+                 for document in documents[start:start + per_page]]
+        return Pagination(None, page, per_page, len(documents), items)
+
+    def facets(self, query_str, filters):
+        return cached_facets(
+            query_str, filters,
+            lambda: count_document_facets(
+                self._documents(query_str, filters)))
+
+    def _documents(self, query_str, filters):
+        catalog_indexer.ensure_fresh()
+        documents = catalog_index.search(query_str)
+        if filters:
+            documents = list(filter_documents(documents, filters))
+        return documents
+
+
+SEARCH_BACKENDS = {
+    'sql': SqlSearchBackend,
+    'memory': MemorySearchBackend,
+}
+
+
+def get_search_backend():
+    return SEARCH_BACKENDS[current_app.config['SEARCH_BACKEND']]()
+
+
+def search_catalog(query_str, page, per_page, filters=None):
+    """Return a page of search results.
+
+    Pages are cached by normalized query, page (or cursor) and filters
+    for the current catalog generation, so a write to the catalog makes
+    every cached page unreachable.
+    """
+    config = current_app.config
+    page_cache.configure(config['SEARCH_CACHE_SIZE'],
+                         config['SEARCH_CACHE_TTL'])
+    filters = filters or {}
+    key = (catalog_generation.value,
+           config['SEARCH_BACKEND'],
+           config['PAGINATION_MODE'],
+           tuple(query_terms(query_str)),
+           request.args.get('cursor') if keyset_enabled() else page,
+           per_page,
+           tuple(sorted(filters.items())))
+    pagination = page_cache.get(key)
+    if pagination is None:
+        pagination = get_search_backend().search(query_str, page,
+                                                 per_page, filters)
+        if isinstance(pagination, Pagination):
+            # keep no reference to the query and its session
+            pagination = Pagination(None, pagination.page,
+                                    pagination.per_page, pagination.total,
+                                    pagination.items)
+        page_cache.set(key, pagination)
+    return pagination
+
+
+def cache_stats():
+    """Hit and miss statistics of the search caches of this worker."""
+    return {'pages': page_cache.stats(), 'facets': facet_cache.stats()}
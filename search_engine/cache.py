@@ -0,0 +1,108 @@
+from collections import OrderedDict
+from itertools import chain
+from threading import Lock
+from time import monotonic
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import Author, Copy, LibraryItem, Tag
+
+
+# copies count too, as listings show and filter on copy availability
+CATALOG_MODELS = (LibraryItem, Author, Copy, Tag)
+
+
+class CatalogGeneration:
+    """Counter bumped whenever a transaction touching the catalog commits.
+
+    Cached search data is keyed by the generation it was computed in, so
+    a bump makes every earlier entry unreachable.
+    """
+
+    def __init__(self):
+        self.value = 0
+        self._lock = Lock()
+        event.listen(Session, 'after_flush', self._track_changes)
+        event.listen(Session, 'after_commit', self._bump_on_commit)
+        event.listen(Session, 'after_soft_rollback', self._discard)
+
+    def bump(self):
+        with self._lock:
+            self.value += 1
+
+    def _track_changes(self, session, flush_context):
+        if session.info.get('copy_counters_changed'):
+            session.info['catalog_changed'] = True
+            return
+        # no set union: some models define __eq__ without __hash__
+        for obj in chain(session.new, session.dirty, session.deleted):
+            if isinstance(obj, CATALOG_MODELS):
+                session.info['catalog_changed'] = True
+                return
+
+    def _bump_on_commit(self, session):
+        if session.info.pop('catalog_changed', False):
+            self.bump()
+
+    def _discard(self, session, previous_transaction):
+        session.info.pop('catalog_changed', None)
+
+
+catalog_generation = CatalogGeneration()
+
+
+class QueryCache:
+    """Thread-safe LRU cache whose entries also expire after ttl seconds."""
+
+    def __init__(self, maxsize=256, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def configure(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and monotonic() >= entry[1]:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value, monotonic() + self.ttl
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,114 @@
+from sqlalchemy import DDL, event
+from sqlalchemy.orm import Session, selectinload, with_polymorphic
+
+from models import Author, Book, LibraryItem, Magazine, Tag
+from search_engine.analysis import analyze, isbn_key, title_key
+
+
+SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('simple', coalesce(search_title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(search_document, '')), 'B')"
+)
+
+# GIN index over the weighted search vector; the expression has to match
+# search_engine.full_text.search_vector() for the planner to use it.
+search_index_ddl = DDL(
+    'CREATE INDEX IF NOT EXISTS ix_library_item_search_vector '
+    'ON library_item USING gin (({}))'.format(SEARCH_VECTOR_SQL)
+)
+event.listen(LibraryItem.__table__,
+             'after_create',
+             search_index_ddl.execute_if(dialect='postgresql'))
+
+
+def search_fields(item):
+    fields = [item.title]
+    if isinstance(item, Book):
+        fields.append(item.original_title)
+        fields.extend(author.full_name for author in item.authors)
+    elif isinstance(item, Magazine):
+        fields.append(item.issue)
+    fields.extend(tag.name for tag in item.tags)
+    fields.append(item.description)
+    return fields
+
+
+def analyze_fields(fields, language):
+    text = ' '.join(str(field) for field in fields if field)
+    return ' '.join(analyze(text, language))
+
+
+def build_search_document(item):
+    """Return the analyzed keys indexed for the given library item."""
+    return analyze_fields(search_fields(item), item.language)
+
+
+def build_search_title(item):
+    return ' '.join(analyze(item.title, item.language))
+
+
+def refresh_search_keys(item):
+    document = build_search_document(item)
+    if item.search_document != document:
+        item.search_document = document
+    title = build_search_title(item)
+    if item.search_title != title:
+        item.search_title = title
+    key = title_key(item.title)
+    if item.title_key != key:
+        item.title_key = key
+    if isinstance(item, Book):
+        key = isbn_key(item.isbn)
+        if item.isbn_key != key:
+            item.isbn_key = key
+
+
+@event.listens_for(Session, 'before_flush')
+def refresh_search_documents(session, flush_context, instances):
+    """Rebuild search documents of items touched in the current flush.
+
+    Authors and tags are shared between items, so renaming one of them
+    refreshes every item it is attached to.
+    """
+    items = set()
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, LibraryItem):
+            items.add(obj)
+        elif isinstance(obj, Author):
+            items.update(obj.books)
+        elif isinstance(obj, Tag):
+            items.update(obj.library_items)
+    for item in items:
+        if item in session.deleted:
+            continue
+        refresh_search_keys(item)
+
+
+def iter_library_items(session, batch_size=500):
+    """Yield batches of library items with subclass columns, authors and
+    tags loaded, walking the catalog by primary key."""
+    item = with_polymorphic(LibraryItem, [Book, Magazine])
+    last_id = 0
+    while True:
+        items = session.query(item) \
+            .options(selectinload(item.tags),
+                     selectinload(item.Book.authors)) \
+            .filter(item.id > last_id) \
+            .order_by(item.id.asc()) \
+            .limit(batch_size) \
+            .all()
+        if not items:
+            return
+        last_id = items[-1].id
+        yield items
+
+
+def reindex_search_documents(session, batch_size=500):
+    """Fill search keys for the whole catalog, e.g. after migration."""
+    count = 0
+    for items in iter_library_items(session, batch_size):
+        for library_item in items:
+            refresh_search_keys(library_item)
+        count += len(items)
+        session.commit()
+    return count
@@ -0,0 +1,138 @@
+from collections import Counter
+
+from flask import current_app
+from sqlalchemy import func, literal, select, union_all
+
+from init_db import db
+from models import LibraryItem, Tag
+from models.library import item_tags
+from search_engine.cache import QueryCache, catalog_generation
+from search_engine.full_text import get_full_text_engine, query_terms
+
+
+FACETS = ('language', 'category', 'type', 'tag')
+
+facet_cache = QueryCache()
+
+
+def parse_filters(args):
+    """Return the facet filters selected in request args, plus
+    available=1 when only items with a copy to reserve are wanted."""
+    filters = {}
+    for name in FACETS:
+        value = (args.get(name) or '').strip()
+        if value:
+            filters[name] = value
+    if args.get('available') == '1':
+        filters['available'] = '1'
+    return filters
+
+
+def toggle_filter(filters, name, value):
+    """Return filters with name set to value, or without it if set."""
+    args = dict(filters)
+    if args.get(name) == value:
+        del args[name]
+    else:
+        args[name] = value
+    return args
+
+
+def apply_filters(query, filters):
+    for name in ('language', 'category', 'type'):
+        if name in filters:
+            query = query.filter(
+                getattr(LibraryItem, name) == filters[name])
+    if 'tag' in filters:
+        query = query.filter(LibraryItem.tags.any(Tag.name == filters['tag']))
+    if 'available' in filters:
+        query = query.filter(LibraryItem.available_copies > 0)
+    return query
+
+
+def filter_documents(documents, filters):
+    """Filter catalog documents of the in-memory index like apply_filters."""
+    for document in documents:
+        if all(filters[name] in document['tags'] if name == 'tag'
+               else document['available_copies'] > 0 if name == 'available'
+               else document[name] == filters[name]
+               for name in filters):
+            yield document
+
+
+def _sorted_counts(counts):
+    return {name: sorted(values.items(), key=lambda pair: (-pair[1],
+                                                           pair[0]))
+            for name, values in counts.items()}
+
+
+def count_facets(query_str, filters):
+    """Count matching items per facet value with one grouped query."""
+    matching = db.session.query(LibraryItem.id)
+    terms = query_terms(query_str)
+    if terms:
+        matching, _ = get_full_text_engine().match(matching, terms)
+    matching = apply_filters(matching, filters).subquery()
+    items = LibraryItem.__table__
+    tags = Tag.__table__
+    selects = [
+        select([literal(name).label('facet'),
+                items.c[name].label('value'),
+                func.count().label('count')])
+        .select_from(items.join(matching, matching.c.id == items.c.id))
+        .where(items.c[name].isnot(None))
+        .group_by(items.c[name])
+        for name in ('language', 'category', 'type')]
+    selects.append(
+        select([literal('tag').label('facet'),
+                tags.c.name.label('value'),
+                func.count().label('count')])
+        .select_from(item_tags
+                     .join(matching, matching.c.id == item_tags.c.item_id)
+                     .join(tags, tags.c.id == item_tags.c.tag_id))
+        .group_by(tags.c.name))
+    counts = {name: {} for name in FACETS}
+    for facet, value, count in db.session.execute(union_all(*selects)):
+        counts[facet][value] = count
+    return _sorted_counts(counts)
+
+
+def count_document_facets(documents):
+    counts = {name: Counter() for name in FACETS}
+    for document in documents:
+        for name in ('language', 'category', 'type'):
+            if document[name] is not None:
+                counts[name][document[name]] += 1
+        counts['tag'].update(document['tags'])
+    return _sorted_counts(counts)
+
+
+def cached_facets(query_str, filters, compute):
+    """Return facet counts for a query, computed once per catalog
+    generation for every (query, filters) pair."""
+    config = current_app.config
+    facet_cache.configure(config['FACET_CACHE_SIZE'],
+                          config['FACET_CACHE_TTL'])
+    key = (catalog_generation.value,
+           config['SEARCH_BACKEND'],
+           tuple(query_terms(query_str)),
+           tuple(sorted(filters.items())))
+    facets = facet_cache.get(key)
+    if facets is None:
+        facets = compute()
+        facet_cache.set(key, facets)
+    return facets
+
+
+def facet_options(facets, filters, limit=10):
+    """Return facet values ready to render, each with the filters its
+    link selects; a selected value links to removing it."""
+    options = {}
+    for name in FACETS:
+        options[name] = []
+        for value, count in facets.get(name, [])[:limit]:
+            options[name].append({'value': value, 'count': count,
+                                  'active': filters.get(name) == value,
+                                  'args': toggle_filter(filters, name,
+                                                        value)})
+    return options
@@ -0,0 +1,89 @@
+from sqlalchemy import Numeric, and_, case, cast, func, literal_column, or_
+
+from init_db import db
+from models import LibraryItem
+from search_engine.analysis import analyze_query
+
+
+def query_terms(query_str):
+    """Split a user query into analyzed search terms, each a tuple of
+    alternative keys (see search_engine.analysis)."""
+    return analyze_query(query_str)
+
+
+def search_vector():
+    simple = literal_column("'simple'")
+    title_vector = func.setweight(
+        func.to_tsvector(simple,
+                         func.coalesce(LibraryItem.search_title, '')),
+        literal_column("'A'"))
+    document_vector = func.setweight(
+        func.to_tsvector(simple,
+                         func.coalesce(LibraryItem.search_document, '')),
+        literal_column("'B'"))
+    return title_vector.op('||')(document_vector)
+
+
+class PostgresFullTextSearch:
+    """Ranked search backed by the GIN index on library_item."""
+
+    def match(self, query, terms):
+        """Return query filtered to matching items and the rank
+        expression to order them by."""
+        # every key is matched as a prefix, so incomplete words still hit
+        ts_query = func.to_tsquery(
+            literal_column("'simple'"),
+            ' & '.join(
+                '({})'.format(' | '.join('{}:*'.format(key) for key in term))
+                for term in terms))
+        vector = search_vector()
+        # ts_rank_cd is a real; a fixed numeric survives the round trip
+        # through keyset cursors, so rows tying on rank are not skipped
+        rank = cast(func.ts_rank_cd(vector, ts_query), Numeric(12, 6))
+        return query.filter(vector.op('@@')(ts_query)), rank
+
+    def search(self, query, terms):
+        query, rank = self.match(query, terms)
+        return query.order_by(
+            rank.desc(), LibraryItem.title.asc(), LibraryItem.id.asc())
+
+
+class FallbackFullTextSearch:
+    """Portable search for databases without tsvector support (SQLite)."""
+
+    def match(self, query, terms):
+        conditions = []
+        rank = 0
+        for term in terms:
+            patterns = ['%{}%'.format(key) for key in term]
+            conditions.append(or_(*[LibraryItem.search_document.like(pattern)
+                                    for pattern in patterns]))
+            rank = rank + case(
+                [(or_(*[LibraryItem.search_title.like(pattern)
+                        for pattern in patterns]), 2)],
+                else_=1)
+        return query.filter(and_(*conditions)), rank
+
+    def search(self, query, terms):
+        query, rank = self.match(query, terms)
+        return query.order_by(
+            rank.desc(), LibraryItem.title.asc(), LibraryItem.id.asc())
+
+
+def get_full_text_engine():
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return PostgresFullTextSearch()
+    return FallbackFullTextSearch()
+
+
+def search_library_items(query_str, query=None):
+    """Return library items matching query_str ordered by relevance.
+
+    Title, authors, tags and description are all searched.
+    """
+    if query is None:
+        query = LibraryItem.query
+    terms = query_terms(query_str)
+    if not terms:
+        return query.order_by(LibraryItem.title.asc())
+    return get_full_text_engine().search(query, terms)
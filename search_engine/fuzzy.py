@@ -0,0 +1,31 @@
+from flask import current_app
+
+from search_engine.indexer import catalog_indexer, wishlist_indexer
+from search_engine.inverted_index import listing_entry
+from search_engine.trigram import TrigramIndex
+
+
+catalog_trigrams = catalog_indexer.register(TrigramIndex())
+wishlist_trigrams = wishlist_indexer.register(TrigramIndex())
+
+
+def _search(indexer, index, query_str):
+    indexer.ensure_fresh()
+    config = current_app.config
+    return index.search(query_str,
+                        threshold=config['FUZZY_SEARCH_THRESHOLD'],
+                        limit=config['FUZZY_SEARCH_LIMIT'],
+                        budget=config['FUZZY_SEARCH_BUDGET_MS'] / 1000.0)
+
+
+def fuzzy_search_catalog(query_str):
+    """Return listing entries of items with titles or authors similar to
+    query_str, for queries with typos."""
+    return [listing_entry(document) for document, _ in
+            _search(catalog_indexer, catalog_trigrams, query_str)]
+
+
+def fuzzy_search_wishlist(query_str):
+    """Return ids of wishes with titles or authors similar to query_str."""
+    return [document['id'] for document, _ in
+            _search(wishlist_indexer, wishlist_trigrams, query_str)]
@@ -0,0 +1,223 @@
+from threading import Lock, Thread
+from time import monotonic
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, object_session
+
+from init_db import db
+from models import Book, LibraryItem, Magazine, WishListItem
+from search_engine.documents import iter_library_items
+
+
+def catalog_document(item):
+    """Return a plain dict with the catalog fields of a library item."""
+    return {
+        'id': item.id,
+        'type': item.type,
+        'title': item.title,
+        'authors': [author.full_name for author in item.authors]
+        if isinstance(item, Book) else [],
+        'issue': item.issue if isinstance(item, Magazine) else None,
+        'tags': [tag.name for tag in item.tags],
+        'description': item.description,
+        'language': item.language,
+        'category': item.category,
+        'available_copies': item.available_copies or 0,
+        'total_copies': item.total_copies or 0,
+    }
+
+
+def load_catalog_documents(session, batch_size=500):
+    for items in iter_library_items(session, batch_size):
+        for item in items:
+            yield catalog_document(item)
+
+
+def wish_document(wish):
+    return {
+        'id': wish.id,
+        'title': wish.title,
+        'authors': wish.authors,
+    }
+
+
+def load_wish_documents(session):
+    query = session.query(WishListItem.id,
+                          WishListItem.title,
+                          WishListItem.authors)
+    for wish_id, title, authors in query.yield_per(1000):
+        yield {'id': wish_id, 'title': title, 'authors': authors}
+
+
+class ModelIndexer:
+    """Keeps in-process indexes over a model in sync with the database.
+
+    Indexes are built on first use (or at worker start) and then updated
+    from ORM events once every transaction commits. Writes made by other
+    workers are picked up by a periodic rebuild in a background thread.
+    """
+
+    def __init__(self, name, model, document, load_documents):
+        self.name = name
+        self._tracks_counters = issubclass(model, LibraryItem)
+        self.indexes = []
+        self.built_at = None
+        self._document = document
+        self._load_documents = load_documents
+        self._lock = Lock()
+        self._building = False
+        self._changes_during_build = []
+        self._pending_key = '{}_pending'.format(name)
+        self._changes_key = '{}_changes'.format(name)
+
+        event.listen(model, 'after_insert', self._track_saved,
+                     propagate=True)
+        event.listen(model, 'after_update', self._track_saved,
+                     propagate=True)
+        event.listen(model, 'after_delete', self._track_deleted,
+                     propagate=True)
+        event.listen(Session, 'after_flush', self._collect_changes)
+        event.listen(Session, 'after_commit', self._apply_changes)
+        event.listen(Session, 'after_soft_rollback', self._discard_changes)
+
+    @property
+    def enabled(self):
+        return self._building or self.built_at is not None
+
+    def register(self, index):
+        self.indexes.append(index)
+        return index
+
+    def rebuild(self):
+        with self._lock:
+            self._building = True
+            self._changes_during_build = []
+        try:
+            documents = list(self._load_documents(db.session))
+        except Exception:
+            with self._lock:
+                self._building = False
+            raise
+        with self._lock:
+            for index in self.indexes:
+                index.rebuild(documents)
+            for changes in self._changes_during_build:
+                self._apply(changes)
+            self._building = False
+            self._changes_during_build = []
+            self.built_at = monotonic()
+        return len(documents)
+
+    def invalidate(self):
+        """Rebuild the indexes on next use, after writes the ORM events
+        did not see, e.g. bulk inserts."""
+        with self._lock:
+            if not self._building:
+                self.built_at = None
+
+    def ensure_fresh(self):
+        """Build the indexes if missing, refresh them in the background
+        once they are older than SEARCH_INDEX_REFRESH_SECONDS."""
+        if self.built_at is None:
+            self.rebuild()
+            return
+        max_age = current_app.config['SEARCH_INDEX_REFRESH_SECONDS']
+        if not max_age or monotonic() - self.built_at < max_age:
+            return
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+        app = current_app._get_current_object()
+        Thread(target=self._background_rebuild, args=(app,),
+               daemon=True).start()
+
+    def _background_rebuild(self, app):
+        with app.app_context():
+            try:
+                self.rebuild()
+            except SQLAlchemyError:
+                app.logger.exception('%s index refresh failed', self.name)
+            finally:
+                db.session.remove()
+
+    def apply(self, changes):
+        """Apply committed changes, a dict of id -> document or None for
+        removed rows."""
+        with self._lock:
+            if self._building:
+                self._changes_during_build.append(changes)
+            self._apply(changes)
+
+    def _apply(self, changes):
+        for row_id, document in changes.items():
+            for index in self.indexes:
+                if document is None:
+                    index.remove(row_id)
+                else:
+                    index.add(document)
+
+    def _track_saved(self, mapper, connection, target):
+        if self.enabled:
+            session = object_session(target)
+            session.info.setdefault(self._pending_key, {})[target.id] = target
+
+    def _track_deleted(self, mapper, connection, target):
+        if self.enabled:
+            session = object_session(target)
+            session.info.setdefault(self._pending_key, {})[target.id] = None
+
+    def _collect_changes(self, session, flush_context):
+        pending = session.info.pop(self._pending_key, None) or {}
+        if self.enabled and self._tracks_counters:
+            # copy counters are written with raw UPDATEs, see
+            # models.library.expire_copy_counters, which runs first
+            for item_id in session.info.get('copy_counters_changed', ()):
+                if item_id not in pending:
+                    pending[item_id] = session.query(LibraryItem).get(
+                        item_id)
+        if not pending:
+            return
+        changes = session.info.setdefault(self._changes_key, {})
+        for row_id, target in pending.items():
+            changes[row_id] = None if target is None \
+                else self._document(target)
+
+    def _apply_changes(self, session):
+        changes = session.info.pop(self._changes_key, None)
+        if changes:
+            self.apply(changes)
+
+    def _discard_changes(self, session, previous_transaction):
+        session.info.pop(self._pending_key, None)
+        session.info.pop(self._changes_key, None)
+
+
+catalog_indexer = ModelIndexer('catalog',
+                               LibraryItem,
+                               catalog_document,
+                               load_catalog_documents)
+wishlist_indexer = ModelIndexer('wishlist',
+                                WishListItem,
+                                wish_document,
+                                load_wish_documents)
+
+
+def init_app(app):
+    """Build the in-process indexes at worker start.
+
+    Fuzzy search and /api/suggest are served from them whatever
+    SEARCH_BACKEND is, so they are never built inside a request.
+    """
+    app.config.setdefault('SEARCH_BACKEND', 'sql')
+    app.config.setdefault('SEARCH_INDEX_REFRESH_SECONDS', 300)
+    with app.app_context():
+        for indexer in (catalog_indexer, wishlist_indexer):
+            try:
+                indexer.rebuild()
+            except SQLAlchemyError:
+                app.logger.warning(
+                    '%s index not built, database is not ready',
+                    indexer.name)
@@ -0,0 +1,156 @@
+from bisect import bisect_left
+from collections import defaultdict
+from threading import RLock
+
+from search_engine.analysis import analyze, analyze_query
+
+
+FIELD_WEIGHTS = {
+    'title': 3,
+    'authors': 2,
+    'tags': 2,
+    'issue': 1,
+    'description': 1,
+}
+
+
+def listing_entry(document):
+    """Return the search listing entry, same shape as serialize()."""
+    if document['type'] == 'book':
+        entry = {
+            'id': document['id'],
+            'title': document['title'],
+            'authors': document['authors'] or ['-'],
+            'type': document['type'],
+        }
+    else:
+        entry = {
+            'id': document['id'],
+            'title': document['title'],
+            'issue': document['issue'],
+            'type': document['type'],
+        }
+    entry['available_copies'] = document.get('available_copies', 0)
+    entry['total_copies'] = document.get('total_copies', 0)
+    return entry
+
+
+def title_sort_key(document):
+    return (document['title'] or '').lower(), document['id']
+
+
+class InvertedIndex:
+    """In-memory inverted index over catalog documents.
+
+    Documents are plain dicts produced by search_engine.indexer, so the
+    index can answer searches without touching the database.
+    """
+
+    def __init__(self):
+        self._lock = RLock()
+        self._documents = {}
+        self._postings = defaultdict(dict)
+        self._item_terms = {}
+        self._sorted_terms = []
+        self._title_order = None
+
+    def __len__(self):
+        return len(self._documents)
+
+    def rebuild(self, documents):
+        fresh = InvertedIndex()
+        for document in documents:
+            fresh._index(document)
+        with self._lock:
+            self._documents = fresh._documents
+            self._postings = fresh._postings
+            self._item_terms = fresh._item_terms
+            self._sorted_terms = sorted(fresh._postings)
+            self._title_order = None
+
+    def add(self, document):
+        with self._lock:
+            self.remove(document['id'])
+            for term in self._index(document):
+                self._sorted_terms.insert(
+                    bisect_left(self._sorted_terms, term), term)
+            self._title_order = None
+
+    def _index(self, document):
+        """Add postings of a document and return terms new to the index."""
+        weights = defaultdict(int)
+        for field, weight in FIELD_WEIGHTS.items():
+            value = document.get(field)
+            if isinstance(value, (list, tuple)):
+                value = ' '.join(value)
+            for term in analyze(value, document.get('language')):
+                weights[term] += weight
+        new_terms = []
+        for term, weight in weights.items():
+            if term not in self._postings:
+                new_terms.append(term)
+            self._postings[term][document['id']] = weight
+        self._item_terms[document['id']] = set(weights)
+        self._documents[document['id']] = document
+        return new_terms
+
+    def remove(self, item_id):
+        with self._lock:
+            if item_id not in self._documents:
+                return
+            for term in self._item_terms.pop(item_id):
+                postings = self._postings[term]
+                postings.pop(item_id, None)
+                if not postings:
+                    del self._postings[term]
+                    index = bisect_left(self._sorted_terms, term)
+                    del self._sorted_terms[index]
+            del self._documents[item_id]
+            self._title_order = None
+
+    def _expand(self, prefix):
+        start = bisect_left(self._sorted_terms, prefix)
+        for term in self._sorted_terms[start:]:
+            if not term.startswith(prefix):
+                break
+            yield term
+
+    def _scores(self, terms):
+        scores = None
+        for keys in terms:
+            term_scores = defaultdict(int)
+            for prefix in keys:
+                for term in self._expand(prefix):
+                    for item_id, weight in self._postings[term].items():
+                        term_scores[item_id] = max(term_scores[item_id],
+                                                   weight)
+            if scores is None:
+                scores = dict(term_scores)
+            else:
+                scores = {item_id: score + term_scores[item_id]
+                          for item_id, score in scores.items()
+                          if item_id in term_scores}
+            if not scores:
+                break
+        return scores or {}
+
+    def search(self, query_str):
+        """Return documents matching every query term, best first.
+
+        Terms are matched as prefixes, like the SQL full-text search.
+        """
+        terms = analyze_query(query_str)
+        with self._lock:
+            if not terms:
+                return self.all_by_title()
+            scores = self._scores(terms)
+            return sorted(
+                (self._documents[item_id] for item_id in scores),
+                key=lambda doc: (-scores[doc['id']], title_sort_key(doc)))
+
+    def all_by_title(self):
+        with self._lock:
+            if self._title_order is None:
+                self._title_order = sorted(self._documents.values(),
+                                           key=title_sort_key)
+            return self._title_order
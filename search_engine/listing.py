@@ -0,0 +1,50 @@
+from collections import defaultdict
+
+from init_db import db
+from models import Author, LibraryItem, Magazine
+from models.books import book_author
+from search_engine.inverted_index import listing_entry
+
+
+magazines = Magazine.__table__
+
+
+def listing_query():
+    """Query only the columns the search listing shows.
+
+    Rows carry id, title, type, magazine issue and copy counters; whole
+    items, their subclass rows and tags are never loaded.
+    """
+    return db.session.query(LibraryItem.id,
+                            LibraryItem.title,
+                            LibraryItem.type,
+                            magazines.c.issue,
+                            LibraryItem.available_copies,
+                            LibraryItem.total_copies).outerjoin(
+        magazines, magazines.c.id == LibraryItem.id)
+
+
+def authors_by_book(book_ids):
+    """Return full names of the authors of book_ids in one query."""
+    authors = defaultdict(list)
+    if not book_ids:
+        return authors
+    query = db.session.query(book_author.c.book_id, Author).join(
+        Author, Author.id == book_author.c.author_id).filter(
+        book_author.c.book_id.in_(book_ids)).order_by(Author.id)
+    for book_id, author in query:
+        authors[book_id].append(author.full_name)
+    return authors
+
+
+def listing_entries(rows):
+    """Turn listing_query rows into listing entries."""
+    authors = authors_by_book([row[0] for row in rows if row[2] == 'book'])
+    return [listing_entry({'id': item_id,
+                           'title': title,
+                           'type': item_type,
+                           'issue': issue,
+                           'authors': authors.get(item_id, []),
+                           'available_copies': available,
+                           'total_copies': total})
+            for item_id, title, item_type, issue, available, total in rows]
@@ -0,0 +1,100 @@
+from bisect import bisect_left
+from collections import Counter
+from threading import RLock
+
+from search_engine.analysis import fold, normalize
+
+
+SUGGESTION_KINDS = ('title', 'author', 'tag')
+
+
+def suggestion_keys(text):
+    """Yield folded keys starting at every word of text, so a title can
+    be completed from any of its words, with or without diacritics."""
+    words = fold(normalize(text)).split()
+    for start in range(len(words)):
+        yield ' '.join(words[start:])
+
+
+class PrefixIndex:
+    """Sorted array of completion keys searched with bisect.
+
+    Every key points to the suggestions (kind, text) it completes,
+    counted by how many catalog items carry them.
+    """
+
+    def __init__(self, max_scan=500):
+        self.max_scan = max_scan
+        self._lock = RLock()
+        self._keys = []
+        self._suggestions = {}
+        self._document_entries = {}
+
+    def _entries(self, document):
+        entries = []
+        if document.get('title'):
+            entries.append(('title', document['title']))
+        entries.extend(('author', name) for name in document['authors'])
+        entries.extend(('tag', name) for name in document['tags'])
+        return [(key, kind, ' '.join(text.split()))
+                for kind, text in entries
+                for key in suggestion_keys(text)]
+
+    def rebuild(self, documents):
+        suggestions = {}
+        document_entries = {}
+        for document in documents:
+            entries = self._entries(document)
+            for key, kind, text in entries:
+                suggestions.setdefault(key, Counter())[(kind, text)] += 1
+            document_entries[document['id']] = entries
+        with self._lock:
+            self._suggestions = suggestions
+            self._document_entries = document_entries
+            self._keys = sorted(suggestions)
+
+    def add(self, document):
+        with self._lock:
+            self.remove(document['id'])
+            entries = self._entries(document)
+            for key, kind, text in entries:
+                if key not in self._suggestions:
+                    self._keys.insert(bisect_left(self._keys, key), key)
+                    self._suggestions[key] = Counter()
+                self._suggestions[key][(kind, text)] += 1
+            self._document_entries[document['id']] = entries
+
+    def remove(self, document_id):
+        with self._lock:
+            for key, kind, text in self._document_entries.pop(document_id,
+                                                              []):
+                counter = self._suggestions[key]
+                counter[(kind, text)] -= 1
+                if counter[(kind, text)] <= 0:
+                    del counter[(kind, text)]
+                if not counter:
+                    del self._suggestions[key]
+                    del self._keys[bisect_left(self._keys, key)]
+
+    def complete(self, prefix, limit=8):
+        """Return up to limit suggestions for prefix, most used first.
+
+        At most max_scan keys are looked at, so very short prefixes are
+        answered in bounded time.
+        """
+        prefix = fold(normalize(prefix))
+        if not prefix:
+            return []
+        with self._lock:
+            counts = Counter()
+            start = bisect_left(self._keys, prefix)
+            for key in self._keys[start:start + self.max_scan]:
+                if not key.startswith(prefix):
+                    break
+                counts.update(self._suggestions[key])
+        ranked = sorted(counts.items(),
+                        key=lambda pair: (-pair[1],
+                                          SUGGESTION_KINDS.index(pair[0][0]),
+                                          pair[0][1].lower()))
+        return [{'text': text, 'type': kind}
+                for (kind, text), _ in ranked[:limit]]
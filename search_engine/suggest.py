@@ -0,0 +1,15 @@
+from flask import current_app
+
+from search_engine.indexer import catalog_indexer
+from search_engine.prefix import PrefixIndex
+
+
+catalog_prefixes = catalog_indexer.register(PrefixIndex())
+
+
+def suggest(query_str, limit=None):
+    """Return title, author and tag completions for a typed prefix."""
+    catalog_indexer.ensure_fresh()
+    if limit is None:
+        limit = current_app.config['SUGGEST_LIMIT']
+    return catalog_prefixes.complete(query_str, limit)
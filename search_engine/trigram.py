@@ -0,0 +1,127 @@
+from collections import defaultdict
+from math import ceil
+from threading import RLock
+from time import monotonic
+
+from search_engine.analysis import tokens
+
+
+def trigrams(text):
+    """Return the set of word trigrams of text, padded like pg_trgm."""
+    grams = set()
+    for word in tokens(text):
+        padded = '  {} '.format(word)
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(grams, other_grams):
+    if not grams or not other_grams:
+        return 0.0
+    shared = len(grams & other_grams)
+    return shared / (len(grams) + len(other_grams) - shared)
+
+
+class TrigramIndex:
+    """Trigram similarity index over selected fields of documents.
+
+    Every field value (a title, one author name) is an entry scored on its
+    own; a document scores as its best entry.
+    """
+
+    def __init__(self, fields=('title', 'authors')):
+        self.fields = fields
+        self._lock = RLock()
+        self._entries = {}
+        self._document_entries = {}
+        self._documents = {}
+        self._postings = defaultdict(set)
+        self._next_entry = 0
+
+    def __len__(self):
+        return len(self._documents)
+
+    def _values(self, document):
+        for field in self.fields:
+            value = document.get(field)
+            if not value:
+                continue
+            if isinstance(value, (list, tuple)):
+                yield from value
+            else:
+                yield value
+
+    def rebuild(self, documents):
+        fresh = TrigramIndex(self.fields)
+        for document in documents:
+            fresh.add(document)
+        with self._lock:
+            self._entries = fresh._entries
+            self._document_entries = fresh._document_entries
+            self._documents = fresh._documents
+            self._postings = fresh._postings
+            self._next_entry = fresh._next_entry
+
+    def add(self, document):
+        with self._lock:
+            self.remove(document['id'])
+            entry_ids = []
+            for value in self._values(document):
+                grams = frozenset(trigrams(str(value)))
+                if not grams:
+                    continue
+                entry_id = self._next_entry
+                self._next_entry += 1
+                self._entries[entry_id] = (document['id'], grams)
+                for gram in grams:
+                    self._postings[gram].add(entry_id)
+                entry_ids.append(entry_id)
+            self._document_entries[document['id']] = entry_ids
+            self._documents[document['id']] = document
+
+    def remove(self, document_id):
+        with self._lock:
+            for entry_id in self._document_entries.pop(document_id, []):
+                _, grams = self._entries.pop(entry_id)
+                for gram in grams:
+                    postings = self._postings[gram]
+                    postings.discard(entry_id)
+                    if not postings:
+                        del self._postings[gram]
+            self._documents.pop(document_id, None)
+
+    def search(self, query_str, threshold=0.3, limit=10, budget=0.05):
+        """Return (document, score) pairs at least threshold similar to
+        query_str, best first.
+
+        Candidates only come from the posting lists of the rarest query
+        trigrams: an entry sharing fewer trigrams than the threshold
+        allows cannot qualify, so common trigrams are never scanned.
+        Scoring stops once budget seconds are spent.
+        """
+        deadline = monotonic() + budget
+        grams = trigrams(query_str)
+        if not grams:
+            return []
+        with self._lock:
+            # similarity >= threshold needs at least threshold * |query|
+            # shared trigrams
+            min_shared = max(1, ceil(threshold * len(grams) - 1e-9))
+            rare_first = sorted(grams,
+                                key=lambda g: len(self._postings.get(g, ())))
+            candidates = set()
+            for gram in rare_first[:len(grams) - min_shared + 1]:
+                candidates.update(self._postings.get(gram, ()))
+
+            scores = {}
+            for checked, entry_id in enumerate(candidates):
+                if checked % 64 == 0 and monotonic() >= deadline:
+                    break
+                document_id, entry_grams = self._entries[entry_id]
+                score = similarity(grams, entry_grams)
+                if score >= threshold and \
+                        score > scores.get(document_id, 0.0):
+                    scores[document_id] = score
+            best = sorted(scores.items(), key=lambda pair: -pair[1])[:limit]
+            return [(self._documents[document_id], score)
+                    for document_id, score in best]
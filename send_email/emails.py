@@ -1,10 +1,55 @@
-from flask_mail import Message
+import smtplib
 
+from flask import current_app
+from flask_mail import Connection, Message
 
-def send_email(subject, sender, recipients, text_body, html_body):
-    from app import mail
+from utils.circuit_breaker import CircuitBreaker
+
+
+class TimeoutConnection(Connection):
+    """Flask-Mail connection giving up after MAIL_TIMEOUT seconds."""
+
+    def configure_host(self):
+        timeout = current_app.config['MAIL_TIMEOUT']
+        if self.mail.use_ssl:
+            host = smtplib.SMTP_SSL(self.mail.server, self.mail.port,
+                                    timeout=timeout)
+        else:
+            host = smtplib.SMTP(self.mail.server, self.mail.port,
+                                timeout=timeout)
+        host.set_debuglevel(int(self.mail.debug))
+        if self.mail.use_tls:
+            host.starttls()
+        if self.mail.username and self.mail.password:
+            host.login(self.mail.username, self.mail.password)
+        return host
 
+
+def init_mail(app):
+    app.config.setdefault('MAIL_TIMEOUT', 10)
+    app.config.setdefault('MAIL_BREAKER_THRESHOLD', 3)
+    app.config.setdefault('MAIL_BREAKER_RESET_SECONDS', 60)
+    app.config.setdefault('MAIL_LATENCY_BUDGET', None)
+    # refused addresses are answers of a working server
+    app.extensions.setdefault('circuit_breakers', {})['smtp'] = \
+        CircuitBreaker(
+            'Mail server',
+            failure_threshold=app.config['MAIL_BREAKER_THRESHOLD'],
+            reset_timeout=app.config['MAIL_BREAKER_RESET_SECONDS'],
+            latency_budget=app.config['MAIL_LATENCY_BUDGET'],
+            failures=(OSError,),
+            ignore=(smtplib.SMTPRecipientsRefused,
+                    smtplib.SMTPSenderRefused))
+
+
+def send_email(subject, sender, recipients, text_body, html_body):
+    """Send a message, raising CircuitOpenError at once while the mail
+    server is failing and OSError when it fails or times out.
+    """
     msg = Message(subject, sender=sender, recipients=recipients)
     msg.body = text_body
     msg.html = html_body
-    mail.send(msg)
+    breaker = current_app.extensions['circuit_breakers']['smtp']
+    with breaker.call(), \
+            TimeoutConnection(current_app.extensions['mail']) as connection:
+        connection.send(msg)
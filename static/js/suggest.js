@@ -0,0 +1,29 @@
+$(document).ready(function() {
+    var input = $('#query_form #query');
+    var request = null;
+    input.attr({list: 'query_suggestions', autocomplete: 'off'});
+    input.on('input', function() {
+        var prefix = $(this).val();
+        if (request) {
+            request.abort();
+        }
+        if (prefix.trim().length < 2) {
+            $('#query_suggestions').empty();
+            return;
+        }
+        request = $.ajax({
+            url: '/api/suggest',
+            method: 'GET',
+            data: {
+                q: prefix,
+            },
+            success: function(response) {
+                var list = $('#query_suggestions').empty();
+                $.each(response.suggestions, function(i, suggestion) {
+                    list.append($('<option>').attr('value', suggestion.text)
+                                             .text(suggestion.type));
+                });
+            }
+        });
+    });
+});
@@ -0,0 +1,85 @@
+"""Generate a synthetic catalog and benchmark the busiest views.
+
+    $ python -m tests.benchmarks --size 100k --output bench.json
+    $ python -m tests.benchmarks --skip-generate --compare bench.json
+    $ python -m tests.benchmarks --skip-generate --scenario search --logins 500
+
+Run it against a scratch database: generated rows are committed.
+"""
+import argparse
+import json
+
+import ldap
+
+from app import create_app
+from init_db import db
+from tests.benchmarks.catalog import generate_catalog, SIZES
+from tests.benchmarks.suite import (
+    BenchmarkSuite,
+    compare_results,
+    measure_logins,
+    SCENARIOS,
+    write_results
+)
+from tests.ldap_server import StandInLDAPServer
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python -m tests.benchmarks')
+    parser.add_argument('--size', default='10k',
+                        help='items to generate: {} or a number'.format(
+                            ', '.join(SIZES)))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--skip-generate', action='store_true',
+                        help='benchmark the catalog already in the database')
+    parser.add_argument('--requests', type=int, default=200,
+                        help='measured requests per scenario')
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                        help='scenario to run, repeatable; default all')
+    parser.add_argument('--logins', type=int, default=0,
+                        help='also time this many logins against an '
+                             'in-process stand-in LDAP server')
+    parser.add_argument('--ldap-latency-ms', type=float, default=2.0,
+                        help='stand-in LDAP delay per handshake and bind')
+    parser.add_argument('--output', help='file to write JSON results to')
+    parser.add_argument('--compare', help='earlier results to compare with')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        if not args.skip_generate:
+            counts = generate_catalog(db.session, args.size, args.seed)
+            print('Generated {}'.format(', '.join(
+                '{} {}'.format(n, table) for table, n in counts.items())))
+        suite = BenchmarkSuite(app, db.session, requests=args.requests,
+                               seed=args.seed)
+        results = suite.run(args.scenario or SCENARIOS)
+        if args.logins:
+            server = StandInLDAPServer(app.config['LDAP_USERNAME'],
+                                       app.config['LDAP_PASSWORD'],
+                                       latency=args.ldap_latency_ms / 1000)
+            ldap.initialize = server.initialize
+            app.config['LDAP_USER_OBJECT_FILTER'] = server.USER_FILTER
+            results['scenarios']['login'] = measure_logins(
+                app, server, args.logins)
+    for name, metrics in results['scenarios'].items():
+        print('{:<24} p50 {:>9.2f} ms  p99 {:>9.2f} ms'.format(
+            name, metrics['p50'], metrics['p99']))
+    if args.output:
+        write_results(results, args.output)
+    if args.compare:
+        with open(args.compare) as previous_file:
+            previous = json.load(previous_file)
+        for name, metric, before, after in compare_results(previous,
+                                                           results):
+            print('{:<24} {} {:>9.2f} -> {:>9.2f} ms ({:+.1f}%)'.format(
+                name, metric, before, after,
+                (after - before) / before * 100 if before else 0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,340 @@
+"""Synthetic catalogs for benchmarking.
+
+Rows are written with bulk Core inserts in chunks, with explicit primary
+keys, so a million item catalog loads in minutes instead of the hours the
+ORM would need. Names and words come from small mimesis pools and are
+combined with a seeded random generator, which keeps runs repeatable.
+
+Popularity is skewed the way a real library is: a few authors and tags
+account for most of the catalog, most items have one or two copies and
+a handful of copies carry long rental histories.
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+from itertools import accumulate
+import random
+
+from mimesis import Generic
+from sqlalchemy import func
+
+from models import (
+    Author,
+    Book,
+    Copy,
+    LibraryItem,
+    Like,
+    Magazine,
+    RentalLog,
+    Tag,
+    User,
+    WishListItem
+)
+from models.books import book_author
+from models.library import BookStatus, item_tags
+from models.users import Role, RoleEnum, user_roles
+from search_engine import catalog_generation
+from search_engine.analysis import isbn_key, title_key
+from search_engine.documents import analyze_fields
+
+SIZES = {
+    '10k': 10000,
+    '100k': 100000,
+    '1m': 1000000,
+}
+
+CHUNK_SIZE = 5000
+
+LANGUAGES = ['english'] * 10 + ['polish'] * 9 + ['german']
+CATEGORIES = ['developers'] * 6 + ['managers'] * 3 + ['other']
+MAGAZINE_SHARE = 0.15
+# number of authors of a book and of copies of an item
+AUTHOR_COUNTS = [1] * 15 + [2] * 4 + [3]
+COPY_COUNTS = [1] * 10 + [2] * 6 + [3] * 3 + [5]
+# share of copies that were ever rented, and the state of their last loan
+RENTED_SHARE = 0.4
+LAST_LOAN_STATES = [BookStatus.RETURNED] * 17 + \
+    [BookStatus.BORROWED] * 2 + [BookStatus.RESERVED]
+
+
+def parse_size(size):
+    """Return the item count of a size given as 10k, 100k, 1m or a number."""
+    size = str(size).lower()
+    if size in SIZES:
+        return SIZES[size]
+    return int(size)
+
+
+def zipf_weights(n, exponent=1.1):
+    return list(accumulate(1 / (rank ** exponent)
+                           for rank in range(1, n + 1)))
+
+
+def unique(rows):
+    return list({row['id']: row for row in rows}.values())
+
+
+def chunks(rows, size=CHUNK_SIZE):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+class CatalogGenerator:
+    """Fills the database with a catalog of the given number of items."""
+
+    def __init__(self, session, items, seed=0):
+        self.session = session
+        self.items = items
+        self.random = random.Random(seed)
+        self.fake = Generic('en', seed=seed)
+        self.words = [self.fake.text.word() for _ in range(2000)]
+        self.now = datetime(2019, 6, 1)
+
+    def next_id(self, model):
+        return (self.session.query(func.max(model.id)).scalar() or 0) + 1
+
+    def insert(self, table, rows):
+        for chunk in chunks(rows):
+            self.session.execute(table.insert(), chunk)
+
+    def title(self, words=4):
+        return ' '.join(self.random.choice(self.words)
+                        for _ in range(self.random.randint(1, words))) \
+            .capitalize()
+
+    def generate(self):
+        """Insert the catalog and return the number of rows per table."""
+        users = self.generate_users(max(20, self.items // 50))
+        authors = self.generate_authors(max(50, self.items // 8))
+        tags = self.generate_tags(max(20, self.items // 200))
+        counts = Counter(users=len(users), authors=len(authors),
+                         tags=len(tags))
+        first_item = self.next_id(LibraryItem)
+        first_copy = self.next_id(Copy)
+        for start in range(0, self.items, CHUNK_SIZE):
+            item_ids = range(first_item + start,
+                             first_item + min(start + CHUNK_SIZE, self.items))
+            copies = self.generate_items(item_ids, authors, tags, counts)
+            first_copy += self.generate_copies(
+                first_copy, copies, users, counts)
+        counts['wishes'] = self.generate_wishes(
+            max(10, self.items // 100), users)
+        self.session.commit()
+        self.sync_sequences()
+        catalog_generation.bump()
+        return dict(counts)
+
+    def generate_users(self, n):
+        first_id = self.next_id(User)
+        rows = [{
+            'id': first_id + i,
+            'email': 'bench{}@example.com'.format(first_id + i),
+            'first_name': self.fake.person.name(),
+            'surname': self.fake.person.surname(),
+            'employee_id': str(10000 + first_id + i),
+            'active': True,
+            'role_mask': RoleEnum.USER.bit | (
+                RoleEnum.ADMIN.bit if i == 0 else 0),
+        } for i in range(n)]
+        self.insert(User.__table__, rows)
+        roles = dict(self.session.query(Role.name, Role.id))
+        self.insert(user_roles, [
+            {'user_id': row['id'], 'role_id': roles[RoleEnum.USER]}
+            for row in rows])
+        # the first user administers the benchmark catalog
+        self.insert(user_roles, [
+            {'user_id': first_id, 'role_id': roles[RoleEnum.ADMIN]}])
+        return [row['id'] for row in rows]
+
+    def generate_authors(self, n):
+        first_id = self.next_id(Author)
+        rows = [{
+            'id': first_id + i,
+            'first_name': self.fake.person.name(),
+            'last_name': self.fake.person.last_name(),
+        } for i in range(n)]
+        self.insert(Author.__table__, rows)
+        return rows
+
+    def generate_tags(self, n):
+        first_id = self.next_id(Tag)
+        taken = {name for name, in self.session.query(Tag.name)}
+        rows = []
+        for i in range(n):
+            name = self.random.choice(self.words)
+            if name in taken:
+                name = '{}{}'.format(name, i)
+            taken.add(name)
+            rows.append({'id': first_id + i, 'name': name})
+        self.insert(Tag.__table__, rows)
+        return rows
+
+    def generate_items(self, item_ids, authors, tags, counts):
+        """Insert one chunk of items; return (item id, copy count) pairs."""
+        author_weights = zipf_weights(len(authors))
+        tag_weights = zipf_weights(len(tags))
+        items, books, magazines, book_authors, item_tag_rows = \
+            [], [], [], [], []
+        copies = []
+        for item_id in item_ids:
+            language = self.random.choice(LANGUAGES)
+            title = self.title()
+            description = ' '.join(self.random.choice(self.words)
+                                   for _ in range(12))
+            item_tag_list = unique(self.random.choices(
+                tags, cum_weights=tag_weights,
+                k=self.random.randint(0, 4)))
+            item_tag_rows.extend({'item_id': item_id, 'tag_id': tag['id']}
+                                 for tag in item_tag_list)
+            fields = [title]
+            if self.random.random() < MAGAZINE_SHARE:
+                item_type = 'magazine'
+                issue = str(self.random.randint(1, 12))
+                magazines.append({
+                    'id': item_id,
+                    'year': self.now.date() - timedelta(
+                        days=self.random.randint(0, 3650)),
+                    'issue': issue,
+                })
+                fields.append(issue)
+            else:
+                item_type = 'book'
+                book_author_list = unique(self.random.choices(
+                    authors, cum_weights=author_weights,
+                    k=self.random.choice(AUTHOR_COUNTS)))
+                book_authors.extend(
+                    {'book_id': item_id, 'author_id': author['id']}
+                    for author in book_author_list)
+                original_title = self.title()
+                isbn = 'B{:012d}'.format(item_id)
+                books.append({
+                    'id': item_id,
+                    'isbn': isbn,
+                    'isbn_key': isbn_key(isbn),
+                    'original_title': original_title,
+                    'publisher': self.random.choice(self.words).title(),
+                    'pub_date': self.now.date() - timedelta(
+                        days=self.random.randint(0, 18250)),
+                })
+                fields.append(original_title)
+                fields.extend('{} {}'.format(author['first_name'],
+                                             author['last_name'])
+                              for author in book_author_list)
+            fields.extend(tag['name'] for tag in item_tag_list)
+            fields.append(description)
+            copy_count = self.random.choice(COPY_COUNTS)
+            copies.append((item_id, copy_count))
+            items.append({
+                'id': item_id,
+                'type': item_type,
+                'title': title,
+                'language': language,
+                'category': self.random.choice(CATEGORIES),
+                'description': description,
+                'search_title': analyze_fields([title], language),
+                'search_document': analyze_fields(fields, language),
+                'title_key': title_key(title),
+                'total_copies': copy_count,
+                'available_copies': copy_count,
+            })
+        self.insert(LibraryItem.__table__, items)
+        self.insert(Book.__table__, books)
+        self.insert(Magazine.__table__, magazines)
+        self.insert(book_author, book_authors)
+        self.insert(item_tags, item_tag_rows)
+        counts.update(items=len(items), books=len(books),
+                      magazines=len(magazines))
+        return copies
+
+    def generate_copies(self, first_id, copies, users, counts):
+        """Insert copies with their rental history; return their count.
+
+        Copies whose last loan is still open are unavailable, so the
+        items' available_copies counters are lowered to match.
+        """
+        copy_rows, logs, unavailable = [], [], Counter()
+        user_weights = zipf_weights(len(users), exponent=0.8)
+        copy_id = first_id
+        for item_id, copy_count in copies:
+            for _ in range(copy_count):
+                status = BookStatus.RETURNED
+                if self.random.random() < RENTED_SHARE:
+                    status = self.random.choice(LAST_LOAN_STATES)
+                    history = int(self.random.expovariate(0.5)) + 1
+                    logs.extend(self.rental_history(
+                        copy_id, history, status, users, user_weights))
+                if status != BookStatus.RETURNED:
+                    unavailable[item_id] += 1
+                copy_rows.append({
+                    'id': copy_id,
+                    'asset_code': 'b{:07x}'.format(copy_id),
+                    'library_item_id': item_id,
+                    'shelf': str(self.random.randint(1, 40)),
+                    'has_cd_disk': self.random.random() < 0.05,
+                    'available_status': status,
+                })
+                copy_id += 1
+        self.insert(Copy.__table__, copy_rows)
+        self.insert(RentalLog.__table__, logs)
+        for item_id, count in unavailable.items():
+            self.session.execute(
+                LibraryItem.__table__.update()
+                .where(LibraryItem.id == item_id)
+                .values(available_copies=LibraryItem.available_copies -
+                        count))
+        counts.update(copies=len(copy_rows), rental_logs=len(logs))
+        return len(copy_rows)
+
+    def rental_history(self, copy_id, length, status, users, user_weights):
+        borrowers = self.random.choices(users, cum_weights=user_weights,
+                                        k=length)
+        when = self.now - timedelta(days=30 * length)
+        for i, user_id in enumerate(borrowers):
+            last = i == length - 1
+            log = {
+                'copy_id': copy_id,
+                'user_id': user_id,
+                'book_status': status if last else BookStatus.RETURNED,
+                '_reservation_begin': when,
+                '_reservation_end': when + timedelta(days=2),
+                '_borrow_time': None,
+                '_return_time': None,
+            }
+            if log['book_status'] != BookStatus.RESERVED:
+                log['_borrow_time'] = when + timedelta(days=1)
+                log['_return_time'] = when + timedelta(days=29)
+            yield log
+            when += timedelta(days=30)
+
+    def generate_wishes(self, n, users):
+        first_id = self.next_id(WishListItem)
+        wishes = [{
+            'id': first_id + i,
+            'authors': self.fake.person.full_name(),
+            'title': self.title(),
+            'pub_year': self.now.date(),
+            'item_type': self.random.choice(['book', 'magazine']),
+        } for i in range(n)]
+        self.insert(WishListItem.__table__, wishes)
+        self.insert(Like.__table__, [
+            {'user_id': user_id, 'wish_item_id': wish['id']}
+            for wish in wishes
+            for user_id in self.random.sample(
+                users, self.random.randint(0, min(5, len(users))))])
+        return n
+
+    def sync_sequences(self):
+        """Move Postgres id sequences past the explicitly inserted ids."""
+        bind = self.session.get_bind()
+        if bind.dialect.name != 'postgresql':
+            return
+        for model in (User, Author, Tag, LibraryItem, Copy, WishListItem):
+            table = model.__tablename__
+            self.session.execute(
+                "SELECT setval(pg_get_serial_sequence('{0}', 'id'), "
+                "coalesce(max(id), 1)) FROM {0}".format(table))
+        self.session.commit()
+
+
+def generate_catalog(session, size, seed=0):
+    """Insert a synthetic catalog of size items; return the row counts."""
+    return CatalogGenerator(session, parse_size(size), seed).generate()
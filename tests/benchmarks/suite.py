@@ -0,0 +1,197 @@
+"""Latency benchmarks of the busiest views, run through the test client.
+
+Every scenario requests a view with sampled arguments (search words
+taken from generated titles, random items, random wishlist pages) and
+reports p50/p99 latency in milliseconds. Results are plain JSON tagged
+with the commit they were measured on, so runs can be compared.
+"""
+from datetime import datetime
+import json
+import random
+import subprocess
+from time import perf_counter
+
+from flask import url_for
+from sqlalchemy import func
+
+from models import LibraryItem, RentalLog, User, WishListItem
+from models.library import BookStatus
+from models.users import Role, RoleEnum
+
+SCENARIOS = [
+    'search',
+    'item_description',
+    'book_borrowing_dashboad',
+    'admin_dashboard',
+    'wishlist',
+]
+
+
+def percentile(samples, q):
+    """Return the nearest-rank q-th percentile of samples."""
+    ordered = sorted(samples)
+    rank = max(1, int(round(q / 100 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(timings):
+    return {
+        'requests': len(timings),
+        'p50': round(percentile(timings, 50), 3),
+        'p99': round(percentile(timings, 99), 3),
+        'mean': round(sum(timings) / len(timings), 3),
+        'max': round(max(timings), 3),
+    }
+
+
+def measure_logins(app, server, logins=100, users=10):
+    """Time logins through the view against a StandInLDAPServer.
+
+    Every login starts from a fresh client, as a new browser would, so
+    the measurement covers the LDAP bind and lookups of the view.
+    """
+    credentials = ['bench-login-{}'.format(i) for i in range(users)]
+    for login in credentials:
+        server.add_user(login, login)
+    with app.test_request_context():
+        url = url_for('library.login')
+    connections = server.connections
+    timings = []
+    for i in range(logins):
+        login = credentials[i % users]
+        with app.test_client() as client:
+            start = perf_counter()
+            response = client.post(url, data={'username': login,
+                                              'password': login})
+            timings.append((perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            raise RuntimeError('login returned {}'.format(
+                response.status_code))
+    results = summarize(timings)
+    results['ldap_connections'] = server.connections - connections
+    results['logins_per_second'] = round(
+        len(timings) / (sum(timings) / 1000), 1)
+    return results
+
+
+class BenchmarkSuite:
+    """Runs the scenarios against the catalog in the app's database."""
+
+    def __init__(self, app, session, requests=200, warmup=10, seed=0):
+        self.app = app
+        self.session = session
+        self.requests = requests
+        self.warmup = warmup
+        self.random = random.Random(seed)
+
+    def sample_ids(self, query, n):
+        return [row[0] for row in
+                query.order_by(func.random()).limit(n).all()]
+
+    def prepare(self):
+        n = self.requests + self.warmup
+        self.admin_id = self.session.query(User.id) \
+            .filter(User.roles.any(Role.name == RoleEnum.ADMIN)) \
+            .order_by(User.id).limit(1).scalar()
+        self.borrower_ids = self.sample_ids(
+            self.session.query(RentalLog.user_id).filter(
+                RentalLog.book_status.in_([BookStatus.BORROWED,
+                                           BookStatus.RESERVED])),
+            n) or [self.admin_id]
+        self.item_ids = self.sample_ids(
+            self.session.query(LibraryItem.id), n)
+        titles = self.session.query(LibraryItem.title) \
+            .filter(LibraryItem.id.in_(self.item_ids[:100])).all()
+        self.words = [title.split()[0] for title, in titles if title]
+        self.wish_pages = max(
+            1, self.session.query(func.count(WishListItem.id)).scalar() // 5)
+
+    def login(self, client, user_id):
+        with client.session_transaction() as session:
+            session['logged_in'] = True
+            session['id'] = user_id
+            session['email'] = None
+            session['roles'] = RoleEnum.USER.bit
+            if user_id == self.admin_id:
+                session['roles'] |= RoleEnum.ADMIN.bit
+                session['admin'] = True
+
+    def scenario_urls(self, name, n):
+        """Return (user id, url) pairs requested by a scenario."""
+        choice = self.random.choice
+        if name == 'search':
+            return [(choice(self.borrower_ids),
+                     url_for('library.search', query=choice(self.words)))
+                    for _ in range(n)]
+        if name == 'item_description':
+            return [(choice(self.borrower_ids),
+                     url_for('library.item_description',
+                             item_id=choice(self.item_ids)))
+                    for _ in range(n)]
+        if name == 'book_borrowing_dashboad':
+            return [(choice(self.borrower_ids),
+                     url_for('library_book_borrowing_dashboard.'
+                             'book_borrowing_dashboad'))
+                    for _ in range(n)]
+        if name == 'admin_dashboard':
+            return [(self.admin_id, url_for('library.admin_dashboard'))
+                    for _ in range(n)]
+        if name == 'wishlist':
+            return [(choice(self.borrower_ids),
+                     url_for('library.wishlist', page=self.random.randint(
+                         1, min(self.wish_pages, 10))))
+                    for _ in range(n)]
+        raise ValueError('Unknown scenario: {}'.format(name))
+
+    def measure(self, name):
+        with self.app.test_request_context():
+            urls = self.scenario_urls(name, self.warmup + self.requests)
+        timings = []
+        with self.app.test_client() as client:
+            for i, (user_id, url) in enumerate(urls):
+                self.login(client, user_id)
+                start = perf_counter()
+                response = client.get(url)
+                elapsed = (perf_counter() - start) * 1000
+                if response.status_code != 200:
+                    raise RuntimeError('{} returned {}'.format(
+                        url, response.status_code))
+                if i >= self.warmup:
+                    timings.append(elapsed)
+        return summarize(timings)
+
+    def run(self, scenarios=SCENARIOS):
+        """Return the JSON-ready results of the given scenarios."""
+        self.prepare()
+        return {
+            'commit': current_commit(),
+            'created': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'items': self.session.query(func.count(LibraryItem.id)).scalar(),
+            'config': {key: self.app.config[key] for key in
+                       ('SEARCH_BACKEND', 'PAGINATION_MODE')},
+            'scenarios': {name: self.measure(name) for name in scenarios},
+        }
+
+
+def write_results(results, path):
+    with open(path, 'w') as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
+
+
+def compare_results(previous, current):
+    """Yield (scenario, metric, before, after) for shared scenarios."""
+    for name, metrics in sorted(current['scenarios'].items()):
+        before = previous['scenarios'].get(name)
+        if before is None:
+            continue
+        for metric in ('p50', 'p99'):
+            yield name, metric, before[metric], metrics[metric]
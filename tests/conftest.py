@@ -4,6 +4,7 @@ from random import choice, randint
 import string
 from os import getenv
 
+import ldap
 import pytest
 from mimesis import Generic
 from sqlalchemy import event
@@ -24,7 +25,7 @@ from models import (
     Tag,
     LibraryItem
 )
-from models.users import Role, RoleEnum
+from models.users import Role, RoleEnum, role_cache
 from forms.copy import CopyAddForm, CopyEditForm
 from forms.forms import (
     SearchForm,
@@ -32,6 +33,8 @@ from forms.forms import (
     LoginForm,
     EditPasswordForm
 )
+from tests.ldap_server import StandInLDAPServer
+from tests.smtp_server import StandInSMTPServer
 from tests.populate import (
     populate_copies,
     populate_authors,
@@ -55,6 +58,8 @@ def app():
     app.config["WTF_CSRF_ENABLED"] = False
     app.config["TESTING"] = True
     _mail.init_app(app)
+    # ids are reused once a module's transaction is rolled back
+    role_cache.clear()
     ctx = app.app_context()
     ctx.push()
 
@@ -98,12 +103,58 @@ def session(db):
             sess2.expire_all()
             sess.begin_nested()
 
+    original_session = db.session
     db.session = sess
     yield sess
 
     sess.remove()
     txn.rollback()
     conn.close()
+    db.session = original_session
+
+
+class StatementLog:
+    """Statements sent to the database inside a `with` block, without the
+    savepoints of the test session."""
+
+    class Statement:
+        def __init__(self, sql, executemany):
+            self.sql = sql
+            self.executemany = executemany
+            self.verb = sql.split(None, 1)[0].upper()
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.executed = []
+
+    def __enter__(self):
+        self.executed = []
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+
+    def __len__(self):
+        return len(self.executed)
+
+    def _record(self, conn, cursor, statement, parameters, context,
+                executemany):
+        if not statement.startswith(('SAVEPOINT', 'RELEASE', 'ROLLBACK TO')):
+            self.executed.append(self.Statement(statement, executemany))
+
+    def of(self, *verbs):
+        """Return the statements starting with one of verbs."""
+        return [statement for statement in self.executed
+                if statement.verb in verbs]
+
+
+@pytest.fixture
+def statement_log(db):
+    """
+    Returns a StatementLog recording the statements of the test database.
+    """
+    return StatementLog(db.engine)
 
 
 @pytest.fixture
@@ -141,6 +192,10 @@ def mock_ldap(db, session):
                 return True
             return None
 
+        # nothing is cached
+        def forget(self, user):
+            pass
+
         # return employee data
         def get_object_details(self, user):
             users = [self.user, self.admin, self.user_not_wroc]
@@ -211,6 +266,50 @@ def mock_ldap(db, session):
     )
 
 
+@pytest.fixture
+def ldap_server(app, monkeypatch):
+    """
+    Serves LDAP connections of the real client from an in-memory
+    directory; the pools and the directory cache start empty.
+    """
+    server = StandInLDAPServer(app.config['LDAP_USERNAME'],
+                               app.config['LDAP_PASSWORD'])
+    monkeypatch.setattr(ldap, 'initialize', server.initialize)
+    monkeypatch.setitem(app.config, 'LDAP_USER_OBJECT_FILTER',
+                        server.USER_FILTER)
+    pools = app.extensions['ldap_pools'].values()
+    breaker = app.extensions['circuit_breakers']['ldap']
+    for pool in pools:
+        pool.clear()
+    app.extensions['ldap_cache'].clear()
+    breaker.reset()
+    yield server
+    for pool in pools:
+        pool.clear()
+    app.extensions['ldap_cache'].clear()
+    breaker.reset()
+
+
+@pytest.fixture
+def smtp_server(app, monkeypatch):
+    """
+    Sends the app's mail to a stand-in SMTP server on localhost.
+    """
+    server = StandInSMTPServer()
+    state = app.extensions['mail']
+    monkeypatch.setattr(state, 'suppress', False)
+    monkeypatch.setattr(state, 'server', server.host)
+    monkeypatch.setattr(state, 'port', server.port)
+    monkeypatch.setattr(state, 'username', None)
+    monkeypatch.setattr(state, 'use_tls', False)
+    monkeypatch.setattr(state, 'use_ssl', False)
+    breaker = app.extensions['circuit_breakers']['smtp']
+    breaker.reset()
+    yield server
+    server.close()
+    breaker.reset()
+
+
 @pytest.fixture(scope='module')
 def text_generator(chars=string.ascii_letters + 'ąćęłóżź \n\t'):
     size = random.randint(25, 40)
@@ -252,7 +351,7 @@ def db_user(session):
     u = User(email=g.person.email(),
              first_name=g.person.name(),
              surname=g.person.surname(),
-             employee_id=g.person.identifier(mask='#####'),
+             employee_id=g.person.identifier(mask='########'),
              active=g.development.boolean(),
              roles=[])
     session.add(u)
@@ -0,0 +1,154 @@
+"""In-process stand-in for the company LDAP directory.
+
+StandInLDAPServer.initialize replaces ldap.initialize, so the real client
+code (pools, filters, binds) runs against an in-memory directory without
+network access. latency adds a delay to every connection handshake and
+bind, to benchmark login throughput offline; binds slower than the
+connection's OPT_TIMEOUT fail with ldap.TIMEOUT, as they would against
+a slow server.
+"""
+import re
+from threading import Lock
+from time import sleep
+
+import ldap
+
+FILTER_TERM = re.compile(r'\(([A-Za-z]+)=([^()]*)\)')
+
+
+def alternatives(filterstr):
+    """Split an (|...) filter into its terms, one filter otherwise."""
+    if not filterstr.startswith('(|'):
+        return [filterstr]
+    terms, depth, start = [], 0, 2
+    for position, char in enumerate(filterstr[2:-1], 2):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth == 0:
+                terms.append(filterstr[start:position + 1])
+                start = position + 1
+    return terms
+
+
+def unescape(value):
+    return re.sub(r'\\([0-9a-fA-F]{2})',
+                  lambda m: chr(int(m.group(1), 16)), value)
+
+
+class StandInLDAPServer:
+    USER_FILTER = '(&(objectclass=Person)(sAMAccountName={}))'
+    MAIL_FILTER = '(&(objectclass=Person)(mail={}))'
+
+    def __init__(self, service_dn, service_password, latency=0.0):
+        self.service_dn = service_dn
+        self.service_password = service_password
+        self.latency = latency
+        self.entries = {}
+        self.down = False
+        self.epoch = 0
+        self.connections = 0
+        self.binds = 0
+        self.searches = 0
+        self._lock = Lock()
+
+    def add_user(self, login, password, location='Wroclaw', **attributes):
+        """Add a person entry; return its attributes as LDAP returns them."""
+        dn = 'CN={},OU=Users,DC=example,DC=com'.format(login)
+        values = {
+            'sAMAccountName': login,
+            'distinguishedName': dn,
+            'mail': '{}@example.com'.format(login),
+            'givenName': login.capitalize(),
+            'sn': 'Standin',
+            'employeeID': str(abs(hash(login)) % 100000),
+            'l': location,
+        }
+        values.update(attributes)
+        entry = {key: [str(value).encode()] for key, value in values.items()}
+        self.entries[dn] = password, entry
+        return entry
+
+    def restart(self):
+        """Drop every open connection, as a server restart would."""
+        self.epoch += 1
+
+    def initialize(self, uri):
+        if self.down:
+            raise ldap.SERVER_DOWN({'desc': "Can't contact LDAP server"})
+        sleep(self.latency)
+        with self._lock:
+            self.connections += 1
+        return StandInConnection(self)
+
+    def bind(self, who, password, timeout=None):
+        if timeout is not None and self.latency > timeout:
+            sleep(timeout)
+            raise ldap.TIMEOUT({'desc': 'Timed out'})
+        sleep(self.latency)
+        with self._lock:
+            self.binds += 1
+        if who == self.service_dn and password == self.service_password:
+            return
+        entry = self.entries.get(who)
+        if entry is None or not password or entry[0] != password:
+            raise ldap.INVALID_CREDENTIALS({'desc': 'Invalid credentials'})
+
+    def search(self, filterstr, attrlist):
+        with self._lock:
+            self.searches += 1
+        choices = [[(attr.lower(), unescape(value))
+                    for attr, value in FILTER_TERM.findall(term)
+                    if attr.lower() != 'objectclass']
+                   for term in alternatives(filterstr)]
+        results = []
+        for dn, (_, entry) in sorted(self.entries.items()):
+            # attributes and, as for mail or account names, values are
+            # matched ignoring case
+            lowered = {key.lower(): [value.lower() for value in values]
+                       for key, values in entry.items()}
+            if any(all(value.lower().encode() in lowered.get(attr, [])
+                       for attr, value in terms) for terms in choices):
+                results.append((dn, {key: value
+                                     for key, value in entry.items()
+                                     if not attrlist or key in attrlist}))
+        return results
+
+
+class StandInConnection:
+
+    def __init__(self, server):
+        self.server = server
+        self.epoch = server.epoch
+        self.options = {}
+        self.protocol_version = None
+        self.who = None
+        self.closed = False
+
+    def _check(self):
+        if self.closed or self.server.down or \
+                self.epoch != self.server.epoch:
+            raise ldap.SERVER_DOWN({'desc': "Can't contact LDAP server"})
+
+    def set_option(self, option, value):
+        self.options[option] = value
+
+    def start_tls_s(self):
+        self._check()
+
+    def simple_bind_s(self, who, password):
+        self._check()
+        self.server.bind(who, password, self.options.get(ldap.OPT_TIMEOUT))
+        self.who = who
+
+    def search_s(self, base, scope, filterstr, attrlist=None):
+        self._check()
+        return self.server.search(filterstr, attrlist)
+
+    def whoami_s(self):
+        self._check()
+        return 'dn:{}'.format(self.who or '')
+
+    def unbind_s(self):
+        self.closed = True
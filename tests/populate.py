@@ -24,7 +24,7 @@ def populate_users(n=20, role=None):
         email=g.person.email(),
         first_name=g.person.name(),
         surname=g.person.surname(),
-        employee_id=g.person.identifier(mask='#####'),
+        employee_id=g.person.identifier(mask='########'),
         active=g.development.boolean(),
         roles=[role] if role else []
     ) for _ in range(n)]
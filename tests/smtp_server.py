@@ -0,0 +1,62 @@
+"""Stand-in SMTP server on a local port.
+
+It speaks just enough SMTP for smtplib to deliver messages, which are
+kept in messages. latency delays the greeting and every reply, so
+clients can be tested against a slow mail server.
+"""
+import socket
+from threading import Thread
+from time import sleep
+
+
+class StandInSMTPServer:
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.messages = []
+        self.connections = 0
+        self._socket = socket.socket()
+        self._socket.bind(('127.0.0.1', 0))
+        self._socket.listen(8)
+        self.host, self.port = self._socket.getsockname()
+        self._thread = Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._socket.close()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self._socket.accept()
+            except OSError:
+                return
+            self.connections += 1
+            Thread(target=self._session, args=(conn,), daemon=True).start()
+
+    def _session(self, conn):
+        with conn, conn.makefile('rb') as lines:
+            try:
+                self._reply(conn, '220 stand-in ESMTP')
+                for line in lines:
+                    command = line[:4].upper()
+                    if command == b'DATA':
+                        self._reply(conn, '354 End data with .')
+                        data = []
+                        for data_line in lines:
+                            if data_line.rstrip(b'\r\n') == b'.':
+                                break
+                            data.append(data_line)
+                        self.messages.append(b''.join(data))
+                        self._reply(conn, '250 Queued')
+                    elif command == b'QUIT':
+                        self._reply(conn, '221 Bye')
+                        return
+                    else:
+                        self._reply(conn, '250 OK')
+            except OSError:
+                return
+
+    def _reply(self, conn, reply):
+        sleep(self.latency)
+        conn.sendall(reply.encode() + b'\r\n')
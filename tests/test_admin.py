@@ -4,6 +4,7 @@ from unittest import mock
 
 from config import Config
 from models.users import User
+from utils.create_admin_user import create_super_user
 
 
 def test_admin_list_empty():
@@ -22,3 +23,33 @@ def test_create_admin(mock_ldap):
             except AttributeError:
                 assert False, 'Admin accounts not created'
         assert check
+
+
+def test_create_admins_with_one_directory_search(app, session, ldap_server,
+                                                 monkeypatch):
+    monkeypatch.setitem(app.config, 'LDAP_USER_OBJECT_FILTER',
+                        ldap_server.MAIL_FILTER)
+    emails = []
+    for number in range(5):
+        ldap_server.add_user('jadmin{}'.format(number), 'secret',
+                             employeeID='9900{}'.format(number))
+        emails.append('jadmin{}@example.com'.format(number))
+    create_super_user(emails + ['jnobody@example.com'])
+    assert ldap_server.searches == 1
+    for email in emails:
+        user = User.query.filter_by(email=email).one()
+        assert user.has_role('ADMIN') and not user.has_role('USER')
+
+
+def test_create_admin_updates_existing_user(app, session, ldap_server,
+                                            monkeypatch):
+    monkeypatch.setitem(app.config, 'LDAP_USER_OBJECT_FILTER',
+                        ldap_server.MAIL_FILTER)
+    ldap_server.add_user('jpromoted', 'secret', employeeID='99100',
+                         sn='Renamed')
+    session.add(User(email='jpromoted@example.com', first_name='J',
+                     surname='Old', employee_id='99100', active=True))
+    session.commit()
+    create_super_user(['JPromoted@example.com'])
+    user = User.query.filter_by(employee_id='99100').one()
+    assert user.surname == 'Renamed' and user.has_role('ADMIN')
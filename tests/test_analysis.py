@@ -0,0 +1,37 @@
+import pytest
+from flask import url_for
+
+from models import Author, Book
+from search_engine import analyze, analyze_query, catalog_indexer
+from search_engine.analysis import fold, normalize
+
+
+def test_fold_strips_polish_diacritics():
+    assert fold(normalize('Łódź')) == 'lodz'
+    assert fold(normalize('ZAŻÓŁĆ GĘŚLĄ JAŹŃ')) == 'zazolc gesla jazn'
+
+
+def test_inflected_forms_share_a_key():
+    assert analyze('książka', 'polish') == analyze('książki', 'polish')
+    assert analyze('libraries', 'english') == analyze('library', 'english')
+    assert analyze('Książka', 'polish')[0] in analyze_query('KSIĄŻKI')[0]
+
+
+def test_stop_words_are_dropped_unless_nothing_else_is_left():
+    assert analyze('The Lord of the Rings', 'english') == ['lord', 'ring']
+    assert analyze('Pan na zamku', 'polish') == ['pan', 'zamk']
+    assert analyze_query('the it') == [('the',), ('it',)]
+
+
+@pytest.mark.parametrize('backend', ['sql', 'memory'])
+def test_search_view_folds_diacritics(app, client, app_session, session,
+                                      monkeypatch, backend):
+    monkeypatch.setitem(app.config, 'SEARCH_BACKEND', backend)
+    monkeypatch.setattr(catalog_indexer, 'built_at', None)
+    author = Author(first_name='Julian', last_name='Tuwim')
+    session.add(Book(title='Kwiaty polskie z Łodzi ' + backend,
+                     authors=[author], tags=[], language='polish'))
+    session.commit()
+    resp = client.get(url_for('library.search', query='lodzi kwiat'))
+    assert resp.status_code == 200
+    assert 'Kwiaty polskie z Łodzi {}'.format(backend).encode() in resp.data
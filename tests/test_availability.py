@@ -0,0 +1,100 @@
+from flask import url_for
+import pytest
+
+from models import Book, Copy
+from models.library import BookStatus
+from search_engine import catalog_generation, catalog_indexer
+
+
+def counters(item):
+    return item.total_copies, item.available_copies
+
+
+@pytest.fixture
+def counted_book(session):
+    book = Book(title='Counted book', authors=[], tags=[])
+    session.add(book)
+    session.commit()
+    return book
+
+
+def test_counters_follow_copy_changes(session, counted_book):
+    assert counters(counted_book) == (0, 0)
+    first = Copy(asset_code='cn000001', library_item=counted_book)
+    second = Copy(asset_code='cn000002', library_item=counted_book,
+                  available_status=BookStatus.BORROWED)
+    session.add_all([first, second])
+    session.commit()
+    assert counters(counted_book) == (2, 1)
+
+    first.available_status = BookStatus.RESERVED
+    session.commit()
+    assert counters(counted_book) == (2, 0)
+
+    second.available_status = BookStatus.RETURNED
+    session.commit()
+    assert counters(counted_book) == (2, 1)
+
+    session.delete(second)
+    session.commit()
+    assert counters(counted_book) == (1, 0)
+
+
+def test_counters_follow_moved_copy(session, counted_book):
+    other = Book(title='Other counted book', authors=[], tags=[])
+    copy = Copy(asset_code='cn000003', library_item=counted_book)
+    session.add_all([other, copy])
+    session.commit()
+    copy.library_item = other
+    session.commit()
+    assert counters(counted_book) == (0, 0)
+    assert counters(other) == (1, 1)
+
+
+def test_reserve_takes_copy_out_of_available(client, app_session, session,
+                                             counted_book):
+    copy = Copy(asset_code='cn000004', library_item=counted_book)
+    session.add(copy)
+    session.commit()
+    assert counters(counted_book) == (1, 1)
+    client.get(url_for('library.reserve', copy_id=copy.id))
+    assert counters(counted_book) == (1, 0)
+
+
+@pytest.mark.parametrize('backend', ['sql', 'memory'])
+def test_search_only_available(app, client, app_session, session,
+                               monkeypatch, backend):
+    monkeypatch.setitem(app.config, 'SEARCH_BACKEND', backend)
+    monkeypatch.setattr(catalog_indexer, 'built_at', None)
+    on_shelf = Book(title='Availbook on shelf', authors=[], tags=[])
+    lent = Book(title='Availbook lent', authors=[], tags=[])
+    session.add_all([
+        Copy(asset_code='av{}01'.format(backend[:4]), library_item=on_shelf),
+        Copy(asset_code='av{}02'.format(backend[:4]), library_item=lent,
+             available_status=BookStatus.BORROWED),
+    ])
+    session.commit()
+    resp = client.get(url_for('library.search', query='availbook',
+                              available='1'))
+    assert b'Availbook on shelf' in resp.data
+    assert b'Availbook lent' not in resp.data
+
+
+def test_reserve_updates_memory_index(app, client, app_session, session,
+                                      monkeypatch):
+    monkeypatch.setitem(app.config, 'SEARCH_BACKEND', 'memory')
+    monkeypatch.setattr(catalog_indexer, 'built_at', None)
+    book = Book(title='Availbook reserved', authors=[], tags=[])
+    copy = Copy(asset_code='avres01', library_item=book)
+    session.add(copy)
+    session.commit()
+    resp = client.get(url_for('library.search', query='availbook reserved',
+                              available='1'))
+    assert b'Availbook reserved' in resp.data
+    generation = catalog_generation.value
+    client.get(url_for('library.reserve', copy_id=copy.id))
+    assert counters(book) == (1, 0)
+    assert catalog_generation.value > generation
+    resp = client.get(url_for('library.search', query='availbook reserved',
+                              available='1'))
+    assert b'Availbook reserved' not in resp.data
@@ -0,0 +1,51 @@
+import json
+
+from models import Book, Copy, LibraryItem
+from tests.benchmarks.catalog import generate_catalog, parse_size
+from tests.benchmarks.suite import (
+    BenchmarkSuite,
+    compare_results,
+    percentile,
+    SCENARIOS,
+    write_results
+)
+
+
+def test_parse_size():
+    assert parse_size('100k') == 100000
+    assert parse_size('1M') == 1000000
+    assert parse_size(250) == 250
+
+
+def test_percentile():
+    samples = list(range(1, 101))
+    assert percentile(samples, 50) == 50
+    assert percentile(samples, 99) == 99
+    assert percentile([7], 99) == 7
+
+
+def test_generated_catalog_is_consistent(app, session):
+    counts = generate_catalog(session, 120, seed=1)
+    assert counts['items'] == 120
+    assert counts['books'] + counts['magazines'] == 120
+    book = Book.query.order_by(Book.id.desc()).first()
+    assert book.search_document
+    item = LibraryItem.query.filter(LibraryItem.total_copies > 0).first()
+    assert item.total_copies == Copy.query.filter_by(
+        library_item_id=item.id).count()
+
+
+def test_suite_reports_percentiles(app, session, tmpdir):
+    generate_catalog(session, 60, seed=2)
+    suite = BenchmarkSuite(app, session, requests=3, warmup=1)
+    results = suite.run()
+    assert set(results['scenarios']) == set(SCENARIOS)
+    for metrics in results['scenarios'].values():
+        assert metrics['requests'] == 3
+        assert 0 < metrics['p50'] <= metrics['p99']
+
+    path = str(tmpdir.join('bench.json'))
+    write_results(results, path)
+    with open(path) as results_file:
+        stored = json.load(results_file)
+    assert len(list(compare_results(stored, results))) == 2 * len(SCENARIOS)
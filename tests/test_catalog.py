@@ -0,0 +1,148 @@
+from unittest import mock
+
+from flask import url_for
+
+from init_db import db
+from forms.book import BookForm
+from models import Author, Book, Tag
+from models.catalog import author_names, resolve_authors, resolve_tags
+from search_engine.analysis import isbn_key, title_key
+from views.book import book_exists
+
+
+def test_author_names_skips_incomplete_and_repeated():
+    assert author_names([('Jan', 'Kowalski'), ('', 'Nowak'),
+                         ('Jan', 'Kowalski'), ('Anna', '')]) == \
+        [('Jan', 'Kowalski')]
+
+
+def test_resolve_authors_inserts_missing_in_one_statement(session,
+                                                          statement_log):
+    existing = Author(first_name='Existing', last_name='Author')
+    session.add(existing)
+    session.commit()
+    with statement_log:
+        authors = resolve_authors([('New', 'Second'),
+                                   ('Existing', 'Author'),
+                                   ('New', 'Third')])
+    assert list(authors) == [('New', 'Second'), ('Existing', 'Author'),
+                             ('New', 'Third')]
+    assert authors['Existing', 'Author'] is existing
+    assert authors['New', 'Third'].id is not None
+    assert [(statement.verb, statement.executemany)
+            for statement in statement_log.of('SELECT', 'INSERT')] == \
+        [('SELECT', False), ('INSERT', True), ('SELECT', False)]
+
+
+def test_resolve_tags_reuses_existing(session):
+    session.add(Tag(name='catalog-tag'))
+    session.commit()
+    tags = resolve_tags(['catalog-tag', '', 'catalog-new'])
+    assert list(tags) == ['catalog-tag', 'catalog-new']
+    assert Tag.query.filter(Tag.name.like('catalog-%')).count() == 2
+
+
+def test_add_book_commits_once(view_book, client,
+                               login_form_admin_credentials, mock_ldap):
+    with mock.patch('views.index.ldap_client', mock_ldap):
+        client.post(url_for('library.login'),
+                    data=login_form_admin_credentials.data)
+    view_book.first_name_1.data = 'Second'
+    view_book.surname_1.data = 'Author'
+    with mock.patch.object(db.session, 'commit',
+                           wraps=db.session.commit) as commit:
+        client.post(url_for('library_books.add_book'),
+                    data=view_book.data)
+    assert commit.call_count == 1
+    book = Book.query.filter_by(title=view_book.title.data).one()
+    assert [author.last_name for author in book.authors] == \
+        [view_book.surname.data, 'Author']
+
+
+def test_title_key_ignores_case_spaces_and_punctuation():
+    assert title_key('Clean Code') == title_key('clean_code.') == \
+        title_key(' Clean-Code, ') == 'cleancode'
+    assert title_key('Żółć') == 'zolc'
+
+
+def test_isbn_key_gives_both_forms_one_key():
+    assert isbn_key('0-306-40615-2') == isbn_key('978 0306406157') == \
+        '9780306406157'
+    assert isbn_key('080442957x') == '9780804429573'
+    assert isbn_key('') is None
+
+
+def test_book_exists_looks_keys_up_in_one_statement(session,
+                                                    statement_log):
+    session.add(Book(title='Duplicate Detection', isbn='0306406152'))
+    session.commit()
+    with statement_log:
+        assert book_exists(Book(title='duplicate-detection.',
+                                isbn='9780804429573'))
+        assert book_exists(Book(title='Another title',
+                                isbn='978-0-306-40615-7'))
+        assert not book_exists(Book(title='Duplicate Detection 2',
+                                    isbn='9780804429573'))
+    assert len(statement_log.of('SELECT')) == 3
+
+
+def test_duplicate_book_leaves_no_authors_behind(view_book, client,
+                                                 login_form_admin_credentials,
+                                                 mock_ldap):
+    with mock.patch('views.index.ldap_client', mock_ldap):
+        client.post(url_for('library.login'),
+                    data=login_form_admin_credentials.data)
+    db.session.add(Book(title='Already Catalogued'))
+    db.session.commit()
+    view_book.title.data = 'already catalogued.'
+    view_book.isbn.data = '9780470059029'
+    view_book.surname.data = 'Orphan'
+    resp = client.post(url_for('library_books.add_book'),
+                       data=view_book.data)
+    assert b'This book already exists.' in resp.data
+    assert Author.query.filter_by(last_name='Orphan').count() == 0
+
+
+def test_edit_book_relinks_instead_of_renaming(client, session,
+                                               login_form_admin_credentials,
+                                               mock_ldap, statement_log):
+    shared = Author(first_name='Shared', last_name='Writer')
+    tag = Tag(name='shared-tag')
+    book = Book(title='Edited Book', isbn='9780131103627',
+                publisher='Prentice', language='english',
+                category='developers', authors=[shared], tags=[tag])
+    other = Book(title='Untouched Book', authors=[shared], tags=[tag])
+    session.add_all([book, other])
+    session.commit()
+    with mock.patch('views.index.ldap_client', mock_ldap):
+        client.post(url_for('library.login'),
+                    data=login_form_admin_credentials.data)
+    form = BookForm(radio='book', title='Edited Book', isbn=book.isbn,
+                    publisher='Prentice', language='english',
+                    category='developers', pub_date='1988',
+                    tag='shared-tag, edited-tag',
+                    first_name='Shared', surname='Writer',
+                    first_name_1='Second', surname_1='Writer')
+    with statement_log, mock.patch.object(
+            db.session, 'commit', wraps=db.session.commit) as commit:
+        client.post(url_for('library_books.edit_book', item_id=book.id),
+                    data=form.data)
+    assert commit.call_count == 1
+    writes = [statement.sql.split('(')[0].strip()
+              for statement in statement_log.of('INSERT', 'DELETE')]
+    assert sorted(writes) == ['INSERT INTO authors',
+                              'INSERT INTO books_authors',
+                              'INSERT INTO item_tags', 'INSERT INTO tags']
+
+    form.first_name.data, form.surname.data = 'Renamed', 'Writer'
+    form.tag.data = 'edited-tag'
+    client.post(url_for('library_books.edit_book', item_id=book.id),
+                data=form.data)
+    book = Book.query.get(book.id)
+    assert sorted(author.first_name for author in book.authors) == \
+        ['Renamed', 'Second']
+    assert [tag.name for tag in book.tags] == ['edited-tag']
+    assert 'renam' in book.search_document
+    other = Book.query.get(other.id)
+    assert [str(author) for author in other.authors] == ['Shared Writer']
+    assert [tag.name for tag in other.tags] == ['shared-tag']
@@ -0,0 +1,139 @@
+from unittest import mock
+
+import pytest
+from flask import url_for
+
+from init_db import db
+from models import Author, Book, Copy, Magazine, Tag
+from utils.catalog_import import import_catalog
+
+SURNAMES = ['Nowak', 'Kowalski', 'Wrona']
+
+
+def isbn13(number):
+    digits = '978{:09d}'.format(number)
+    check = sum(int(digit) * (3 if i % 2 else 1)
+                for i, digit in enumerate(digits))
+    return digits + str(-check % 10)
+
+
+def book_row(title, isbn, **fields):
+    row = {
+        'type': 'book',
+        'title': title,
+        'isbn': isbn,
+        'authors': ['Jan Importowany'],
+        'tags': ['imported'],
+        'language': 'polish',
+        'category': 'developers',
+        'publisher': 'Helion',
+        'pub_date': '2015',
+    }
+    row.update(fields)
+    return row
+
+
+@pytest.fixture
+def admin_client(client, login_form_admin_credentials, mock_ldap):
+    with mock.patch('views.index.ldap_client', mock_ldap):
+        client.post(url_for('library.login'),
+                    data=login_form_admin_credentials.data)
+    return client
+
+
+def test_import_reports_every_row(admin_client):
+    rows = [
+        book_row('Imported Book', '978-0-306-40615-7',
+                 authors=['Jan Importowany', 'Anna Importowana'],
+                 copies=['imp-1@A1', {'asset_code': 'imp-2',
+                                      'has_cd_disk': True}]),
+        book_row('imported-book.', '9780470059029'),
+        book_row('Second Imported Book', '0-306-40615-2',
+                 tags=['imported', 'second']),
+        book_row('Broken Book', '978-1', language='klingon'),
+        {'type': 'magazine', 'title': 'Imported Monthly', 'issue': '3',
+         'year': '2018', 'language': 'english', 'category': 'magazines'},
+        {'type': 'copy', 'isbn': '0306406152', 'asset_code': 'imp-3'},
+        {'type': 'copy', 'item_id': '999999', 'asset_code': 'imp-4'},
+    ]
+    resp = admin_client.post(url_for('library_ingest.api_import'),
+                             json=rows)
+    assert resp.status_code == 200
+    report = resp.get_json()
+    assert (report['created'], report['duplicate'], report['invalid']) == \
+        (3, 2, 2)
+    results = report['rows']
+    assert [result['status'] for result in results] == [
+        'created', 'duplicate', 'duplicate', 'invalid', 'created',
+        'created', 'invalid']
+    book = Book.query.get(results[0]['id'])
+    assert results[1]['id'] == results[2]['id'] == results[5]['id'] == \
+        book.id
+    assert set(results[3]['errors']) == {'isbn', 'language'}
+
+    assert [author.full_name for author in book.authors] == \
+        ['Jan Importowany', 'Anna Importowana']
+    assert Author.query.filter_by(last_name='Importowany').count() == 1
+    assert Tag.query.filter_by(name='imported').count() == 1
+    assert sorted(copy.asset_code for copy in book.copies) == \
+        ['imp-1', 'imp-2', 'imp-3']
+    assert (book.total_copies, book.available_copies) == (3, 3)
+    assert book.isbn == '9780306406157'
+    assert book.title_key == 'importedbook'
+    assert 'importowan' in book.search_document.split()
+    magazine = Magazine.query.get(results[4]['id'])
+    assert magazine.year.year == 2018
+
+
+def test_import_adds_copies_and_skips_repeats(admin_client):
+    magazine = Magazine(title='Copied Quarterly', issue='1')
+    db.session.add(magazine)
+    db.session.commit()
+    rows = [{'type': 'copy', 'item_id': str(magazine.id),
+             'asset_code': 'cq-1', 'shelf': 'B2'},
+            {'type': 'copy', 'item_id': str(magazine.id),
+             'asset_code': 'cq-1'}]
+    results = import_catalog(rows)
+    db.session.commit()
+    assert [result['status'] for result in results] == ['created',
+                                                        'invalid']
+    assert results[1]['errors'] == {'copies': ['Asset code cq-1 is in use.']}
+    db.session.refresh(magazine)
+    assert magazine.total_copies == 1
+    assert Copy.query.filter_by(asset_code='cq-1').one().shelf == 'B2'
+
+
+def test_import_csv_in_export_format(admin_client):
+    document = (
+        'type,title,isbn,authors,tags,copies,language,category,publisher,'
+        'pub_date\n'
+        'book,CSV Book,9781861972712,Ewa Csv; Piotr Csv,csv,csv-1@C3,'
+        'english,other,Wiley,2011-01-01\n')
+    resp = admin_client.post(url_for('library_ingest.api_import'),
+                             data=document, content_type='text/csv')
+    assert resp.get_json()['created'] == 1
+    book = Book.query.filter_by(title='CSV Book').one()
+    assert [author.last_name for author in book.authors] == ['Csv', 'Csv']
+    assert book.pub_date.year == 2011
+    assert book.copies[0].shelf == 'C3'
+
+
+def test_import_statements_do_not_grow_with_the_batch(admin_client,
+                                                      statement_log):
+    def statements(first, count, first_name):
+        rows = [book_row('Bulk book {}'.format(number), isbn13(number),
+                         authors=[first_name + ' ' + SURNAMES[number % 3]],
+                         copies=['bb{}'.format(number)])
+                for number in range(first, first + count)]
+        with statement_log:
+            results = import_catalog(rows)
+        db.session.commit()
+        assert {result['status'] for result in results} == {'created'}, results
+        return len(statement_log.of('SELECT', 'INSERT'))
+
+    assert statements(500000, 5, 'Ola') == statements(600000, 300, 'Ewa')
+
+
+def test_import_requires_admin(client):
+    resp = client.post(url_for('library_ingest.api_import'), json=[])
+    assert resp.status_code == 302
@@ -0,0 +1,120 @@
+from time import monotonic, sleep
+from unittest import mock
+import smtplib
+
+import pytest
+from flask import url_for
+
+from ldap_utils.ldap_utils import ldap_client
+from send_email.emails import send_email
+from utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+def fail(breaker, error=OSError('down')):
+    with pytest.raises(type(error)):
+        with breaker.call():
+            raise error
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=60)
+    fail(breaker)
+    with breaker.call():
+        pass
+    fail(breaker)
+    assert breaker.state == CircuitBreaker.CLOSED
+    fail(breaker)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        with breaker.call():
+            pass
+    assert breaker.stats()['rejected_calls'] == 1
+    assert breaker.stats()['trips'] == 1
+
+
+def test_breaker_probes_when_half_open():
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0)
+    fail(breaker)
+    with breaker.call():
+        # only the probe is let through
+        with pytest.raises(CircuitOpenError):
+            with breaker.call():
+                pass
+    assert breaker.state == CircuitBreaker.CLOSED
+    fail(breaker)
+    assert breaker.stats()['trips'] == 2
+
+
+def test_breaker_ignores_answers_and_counts_slow_calls():
+    breaker = CircuitBreaker('test', failure_threshold=1,
+                             latency_budget=0.01,
+                             ignore=(smtplib.SMTPRecipientsRefused,))
+    fail(breaker, smtplib.SMTPRecipientsRefused({}))
+    assert breaker.state == CircuitBreaker.CLOSED
+    with breaker.call():
+        sleep(0.02)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.stats()['slow_calls'] == 1
+
+
+def test_slow_directory_fails_login_fast(app, session, ldap_server,
+                                         monkeypatch):
+    ldap_server.add_user('jslow', 'secret')
+    monkeypatch.setitem(app.config, 'LDAP_OPERATION_TIMEOUT', 0.01)
+    ldap_server.latency = 0.05
+    breaker = ldap_client.breaker()
+    monkeypatch.setattr(breaker, 'failure_threshold', 2)
+    login = {'username': 'jslow', 'password': 'secret'}
+    for _ in range(2):
+        resp = app.test_client().post(url_for('library.login'), data=login)
+        assert b'temporarily unavailable' in resp.data
+    assert breaker.state == CircuitBreaker.OPEN
+
+    connections = ldap_server.connections
+    started = monotonic()
+    resp = app.test_client().post(url_for('library.login'), data=login)
+    assert b'temporarily unavailable' in resp.data
+    assert monotonic() - started < ldap_server.latency
+    assert ldap_server.connections == connections
+
+    # the server recovers, and the next probe closes the circuit
+    ldap_server.latency = 0
+    breaker.opened_at -= breaker.reset_timeout
+    with app.test_client() as client:
+        client.post(url_for('library.login'), data=login)
+        assert client.get(url_for('library.index')).status_code == 200
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_send_email_through_stand_in_server(app, smtp_server):
+    send_email('Subject', 'library@example.com', ['reader@example.com'],
+               'Hello', None)
+    assert len(smtp_server.messages) == 1
+    assert b'Subject: Subject' in smtp_server.messages[0]
+
+
+def test_slow_mail_server_trips_the_breaker(app, smtp_server, monkeypatch):
+    monkeypatch.setitem(app.config, 'MAIL_TIMEOUT', 0.01)
+    smtp_server.latency = 0.05
+    breaker = app.extensions['circuit_breakers']['smtp']
+    for _ in range(breaker.failure_threshold):
+        with pytest.raises(OSError):
+            send_email('Subject', 'library@example.com',
+                       ['reader@example.com'], 'Hello', None)
+    connections = smtp_server.connections
+    with pytest.raises(CircuitOpenError):
+        send_email('Subject', 'library@example.com',
+                   ['reader@example.com'], 'Hello', None)
+    assert smtp_server.connections == connections
+    assert smtp_server.messages == []
+
+
+def test_service_stats(app, client, login_form_admin_credentials,
+                       mock_ldap, smtp_server):
+    with mock.patch('views.index.ldap_client', mock_ldap):
+        client.post(url_for('library.login'),
+                    data=login_form_admin_credentials.data)
+        resp = client.get(url_for('library.api_service_stats'))
+    assert resp.status_code == 200
+    assert resp.get_json()['smtp']['state'] == CircuitBreaker.CLOSED
+    assert set(resp.get_json()) == {'ldap', 'smtp'}
@@ -2,11 +2,13 @@ import pytest
 from mimesis import Generic
 from flask import session
 from models.decorators_roles import (
+    current_user,
+    login_session,
     require_logged_in,
     require_not_logged_in,
     require_role
 )
-from models.users import Role, RoleEnum
+from models.users import Role, RoleEnum, User, role_cache
 
 g = Generic('en')
 
@@ -123,3 +125,93 @@ def test_role_decorator_custom_redirect(
         else:
             if func_role() != 'ok':
                 assert False
+
+
+def test_current_user_is_loaded_once_per_request(db, db_user,
+                                                 statement_log):
+    session['id'] = db_user.id
+    db.session.expire_all()
+    role_cache.clear()
+    with statement_log:
+        user = current_user()
+        assert current_user() is user
+        assert not user.has_role('ADMIN')
+
+        @require_role(role='USER')
+        def func_role():
+            return 'ok'
+
+        assert func_role() == 'ok'
+    # the user with its role mask, nothing more
+    assert len(statement_log) == 1
+
+
+def test_role_change_invalidates_cached_roles(db_user):
+    assert role_cache.role_mask(db_user.id) == RoleEnum.USER.bit
+    role_admin = Role.query.filter_by(name=RoleEnum.ADMIN).first()
+    db_user.roles.append(role_admin)
+    assert role_cache.get(db_user.id) is None
+    assert role_cache.has_role(db_user.id, 'ADMIN')
+
+
+def test_role_mask_follows_user_roles(session, db_user):
+    role_admin = Role.query.filter_by(name=RoleEnum.ADMIN).first()
+    role_user = Role.query.filter_by(name=RoleEnum.USER).first()
+    db_user.roles.append(role_admin)
+    db_user.roles.remove(role_user)
+    session.commit()
+    session.expire(db_user)
+    assert db_user.role_mask == RoleEnum.ADMIN.bit
+    assert db_user.has_role('ADMIN') and not db_user.has_role('USER')
+
+
+def test_role_decorator_trusts_session_mask(db_user, statement_log):
+    login_session(db_user)
+
+    @require_role(role='ADMIN')
+    def func_admin():
+        return 'ok'
+
+    @require_role(role='USER')
+    def func_user():
+        return 'ok'
+
+    with statement_log:
+        assert func_admin() != 'ok'
+        assert func_user() == 'ok'
+    assert len(statement_log) == 0
+
+
+def test_role_change_reaches_live_session(db, db_user):
+    role_admin = Role.query.filter_by(name=RoleEnum.ADMIN).first()
+    db_user.roles.append(role_admin)
+    db.session.commit()
+    login_session(db_user)
+
+    @require_role(role='ADMIN')
+    def func_admin():
+        return 'ok'
+
+    assert func_admin() == 'ok'
+    db_user.roles.remove(role_admin)
+    db.session.commit()
+    assert func_admin() != 'ok'
+    assert 'admin' not in session
+
+
+def test_stale_session_mask_is_read_again(db, db_user):
+    role_cache.clear()
+    login_session(db_user)
+    # a role granted by another process does not invalidate this one
+    db.session.execute(User.__table__.update()
+                       .where(User.__table__.c.id == db_user.id)
+                       .values(role_mask=RoleEnum.ADMIN.bit))
+
+    @require_role(role='ADMIN')
+    def func_admin():
+        return 'ok'
+
+    assert func_admin() != 'ok'
+    session['roles_checked'] -= role_cache.ttl
+    assert func_admin() == 'ok'
+    assert session['roles'] == RoleEnum.ADMIN.bit
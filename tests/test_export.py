@@ -0,0 +1,65 @@
+import csv
+import io
+import json
+from unittest import mock
+
+from flask import session as flask_session, url_for
+import pytest
+
+from models import Author, Book, Copy, Magazine, Tag
+from views.export import csv_lines, iter_items
+
+
+@pytest.fixture(scope='module')
+def export_items(session):
+    book = Book(title='Exported book', isbn='978-0-00-000000-1',
+                authors=[Author(first_name='Ex', last_name='Porter')],
+                tags=[Tag(name='exported')])
+    magazine = Magazine(title='Exported magazine', issue='7', tags=[])
+    session.add_all([book, magazine])
+    session.add(Copy(asset_code='ex000001', shelf='A1', library_item=book))
+    session.commit()
+    return book, magazine
+
+
+def test_item_rows_include_authors_tags_and_copies(app, export_items):
+    rows = {row['title']: row for row in iter_items()}
+    book = rows['Exported book']
+    assert book['authors'] == ['Ex Porter']
+    assert book['tags'] == ['exported']
+    assert book['copies'] == [{'asset_code': 'ex000001', 'shelf': 'A1',
+                               'available_status': 'RETURNED'}]
+    assert rows['Exported magazine']['issue'] == '7'
+
+
+def test_csv_lines_are_streamed_row_by_row():
+    lines = csv_lines(['id', 'tags'], iter([{'id': 1, 'tags': ['a', 'b']},
+                                            {'id': 2, 'tags': []}]))
+    assert next(lines) == 'id,tags\r\n'
+    assert next(lines) == '1,a; b\r\n'
+    assert list(lines) == ['2,\r\n']
+
+
+@pytest.mark.parametrize('resource', ['items', 'copies', 'rental_logs'])
+def test_export_endpoint(client, export_items, login_form_admin_credentials,
+                         mock_ldap, resource):
+    with mock.patch('views.index.ldap_client', mock_ldap):
+        client.post(url_for('library.login'),
+                    data=login_form_admin_credentials.data)
+        resp = client.get(url_for('library_export.export',
+                                  resource=resource, fmt='ndjson'))
+        assert resp.status_code == 200
+        assert resp.is_streamed
+        rows = [json.loads(line) for line in resp.data.decode().splitlines()]
+        assert all('id' in row for row in rows)
+        resp = client.get(url_for('library_export.export',
+                                  resource=resource, fmt='csv'))
+        header = next(csv.reader(io.StringIO(resp.data.decode())))
+        assert header[0] == 'id'
+        flask_session.clear()
+
+
+def test_export_requires_admin(client, app_session):
+    resp = client.get(url_for('library_export.export',
+                              resource='items', fmt='csv'))
+    assert resp.status_code == 302
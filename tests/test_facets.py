@@ -0,0 +1,77 @@
+from flask import url_for
+import pytest
+
+from models import Book, Magazine, Tag
+from search_engine import catalog_indexer
+from search_engine.cache import QueryCache, catalog_generation
+from search_engine.facets import count_facets, facet_cache
+
+
+@pytest.fixture(scope='module')
+def faceted_items(session):
+    poetry = Tag(name='facetpoetry')
+    drama = Tag(name='facetdrama')
+    session.add_all([
+        Book(title='Facetbook one', language='polish', category='poetry',
+             authors=[], tags=[poetry]),
+        Book(title='Facetbook two', language='polish', category='drama',
+             authors=[], tags=[poetry, drama]),
+        Book(title='Facetbook three', language='english',
+             category='poetry', authors=[], tags=[]),
+        Magazine(title='Facetbook weekly', language='english',
+                 category='news', issue='1', tags=[drama]),
+    ])
+    session.commit()
+
+
+def test_count_facets(app_session, faceted_items):
+    facets = count_facets('facetbook', {})
+    assert facets['language'] == [('english', 2), ('polish', 2)]
+    assert facets['type'] == [('book', 3), ('magazine', 1)]
+    assert facets['tag'] == [('facetdrama', 2), ('facetpoetry', 2)]
+    filtered = count_facets('facetbook', {'language': 'polish',
+                                          'tag': 'facetpoetry'})
+    assert filtered['category'] == [('drama', 1), ('poetry', 1)]
+    assert filtered['language'] == [('polish', 2)]
+
+
+@pytest.mark.parametrize('backend', ['sql', 'memory'])
+def test_search_view_filters_by_facet(app, client, app_session,
+                                      faceted_items, monkeypatch, backend):
+    monkeypatch.setitem(app.config, 'SEARCH_BACKEND', backend)
+    monkeypatch.setattr(catalog_indexer, 'built_at', None)
+    resp = client.get(url_for('library.search', query='facetbook',
+                              category='poetry', language='english'))
+    assert resp.status_code == 200
+    assert b'Facetbook three' in resp.data
+    assert b'Facetbook one' not in resp.data
+    assert b'english (1)' in resp.data
+
+
+def test_facet_counts_are_cached_until_catalog_changes(
+        app, client, app_session, session, faceted_items):
+    facet_cache.clear()
+    client.get(url_for('library.search', query='facetbook'))
+    assert len(facet_cache) == 1
+    client.get(url_for('library.search', query='facetbook'))
+    assert len(facet_cache) == 1
+    generation = catalog_generation.value
+    session.add(Book(title='Facetbook four', language='german',
+                     authors=[], tags=[]))
+    session.commit()
+    assert catalog_generation.value == generation + 1
+    resp = client.get(url_for('library.search', query='facetbook'))
+    assert b'german (1)' in resp.data
+
+
+def test_query_cache_evicts_least_recently_used():
+    cache = QueryCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    expired = QueryCache(ttl=0)
+    expired.set('a', 1)
+    assert expired.get('a') is None
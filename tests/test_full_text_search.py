@@ -0,0 +1,63 @@
+from flask import url_for
+
+from models import Author, Book, Magazine, Tag
+from search_engine import build_search_document, search_library_items
+
+
+def test_search_document_contains_all_fields(session):
+    author = Author(first_name='Stanisław', last_name='Lem')
+    tag = Tag(name='scifi')
+    book = Book(title='Solaris',
+                authors=[author],
+                tags=[tag],
+                description='Ocean planet contact story')
+    session.add(book)
+    session.commit()
+    assert book.search_document == build_search_document(book)
+    for word in ['solaris', 'stanislaw', 'lem', 'scifi', 'ocean']:
+        assert word in book.search_document.split(), \
+            '{} missing in search document'.format(word)
+
+
+def test_search_document_follows_author_rename(session):
+    author = Author(first_name='Janusz', last_name='Zajdel')
+    book = Book(title='Limes inferior', authors=[author], tags=[])
+    session.add(book)
+    session.commit()
+    author.last_name = 'Zajdelski'
+    session.commit()
+    assert 'zajdelski' in book.search_document.split()
+
+
+def test_search_by_author_and_tag(session):
+    author = Author(first_name='Arkady', last_name='Strugatsky')
+    tag = Tag(name='roadsideclassic')
+    book = Book(title='Picnic', authors=[author], tags=[tag])
+    magazine = Magazine(title='Picnic weekly', tags=[], issue='3')
+    session.add_all([book, magazine])
+    session.commit()
+
+    assert book in search_library_items('strugatsky').all()
+    assert book in search_library_items('roadsideclassic').all()
+    assert magazine not in search_library_items('strugatsky picnic').all()
+
+
+def test_search_ranks_title_matches_first(session):
+    in_title = Book(title='Quantum gardening', authors=[], tags=[])
+    in_description = Book(title='Botany basics',
+                          authors=[],
+                          tags=[],
+                          description='Touches quantum effects briefly')
+    session.add_all([in_description, in_title])
+    session.commit()
+    results = search_library_items('quantum').all()
+    assert results.index(in_title) < results.index(in_description)
+
+
+def test_search_view_finds_author(client, app_session, session):
+    author = Author(first_name='Olga', last_name='Tokarczuk')
+    session.add(Book(title='Bieguni', authors=[author], tags=[]))
+    session.commit()
+    resp = client.get(url_for('library.search', query='tokarczuk'))
+    assert resp.status_code == 200
+    assert b'Bieguni' in resp.data
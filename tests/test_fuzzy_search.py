@@ -0,0 +1,88 @@
+from datetime import date
+from unittest import mock
+
+from flask import url_for
+import pytest
+
+from models import Author, Book, WishListItem
+from search_engine import (
+    catalog_indexer,
+    init_search_indexes,
+    wishlist_indexer
+)
+from search_engine.trigram import TrigramIndex, similarity, trigrams
+
+
+def test_trigrams_are_padded():
+    assert trigrams('Cat') == {'  c', ' ca', 'cat', 'at '}
+    assert similarity(trigrams('word'), trigrams('word')) == 1.0
+
+
+def test_trigram_index_tolerates_typos():
+    index = TrigramIndex()
+    index.rebuild([
+        {'id': 1, 'title': 'Pan Tadeusz', 'authors': ['Adam Mickiewicz']},
+        {'id': 2, 'title': 'Harry Potter', 'authors': ['J. K. Rowling']},
+        {'id': 3, 'title': 'Lalka', 'authors': ['Bolesław Prus']},
+    ])
+    assert [d['id'] for d, _ in index.search('Hary Poter')] == [2]
+    assert [d['id'] for d, _ in index.search('mickiewitz')] == [1]
+    assert index.search('zzzz qqqq') == []
+
+
+def test_trigram_index_remove():
+    index = TrigramIndex()
+    index.add({'id': 1, 'title': 'Solaris', 'authors': []})
+    index.remove(1)
+    assert index.search('solaris') == []
+    assert len(index) == 0
+
+
+def test_trigram_index_respects_budget():
+    index = TrigramIndex()
+    index.rebuild({'id': i, 'title': 'Title number {}'.format(i)}
+                  for i in range(2000))
+    assert index.search('title number', budget=0) == []
+
+
+@pytest.fixture
+def fresh_indexes(monkeypatch):
+    monkeypatch.setattr(catalog_indexer, 'built_at', None)
+    monkeypatch.setattr(wishlist_indexer, 'built_at', None)
+
+
+def test_search_view_shows_similar_titles(fresh_indexes, client,
+                                          app_session, session):
+    author = Author(first_name='Henryk', last_name='Sienkiewicz')
+    session.add(Book(title='Krzyżacy', authors=[author], tags=[]))
+    session.commit()
+    resp = client.get(url_for('library.search', query='Sienkiewich'))
+    assert resp.status_code == 200
+    assert 'Krzyżacy'.encode() in resp.data
+
+
+def test_wishlist_view_shows_similar_wishes(fresh_indexes, client,
+                                            app_session, session,
+                                            db_wishlist_item):
+    wish = WishListItem(authors='Andrzej Sapkowski',
+                        title='Ostatnie życzenie',
+                        pub_year=date(1993, 1, 1),
+                        item_type='book')
+    session.add(wish)
+    session.commit()
+    resp = client.get(url_for('library.wishlist', query='Ostatnie zyczenie'))
+    assert resp.status_code == 200
+    assert 'Ostatnie życzenie'.encode() in resp.data
+
+
+def test_fuzzy_search_uses_indexes_built_at_start(app, client, app_session,
+                                                  session, monkeypatch):
+    monkeypatch.setitem(app.config, 'SEARCH_BACKEND', 'sql')
+    monkeypatch.setattr(catalog_indexer, 'built_at', None)
+    init_search_indexes(app)
+    session.add(Book(title='Quo vadis', authors=[], tags=[]))
+    session.commit()
+    with mock.patch.object(catalog_indexer, 'rebuild') as rebuild:
+        resp = client.get(url_for('library.search', query='Quo vadsi'))
+    assert not rebuild.called
+    assert b'Quo vadis' in resp.data
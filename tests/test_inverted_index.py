@@ -0,0 +1,85 @@
+import pytest
+from flask import url_for
+
+from models import Author, Book
+from search_engine import catalog_index, catalog_indexer
+from search_engine.inverted_index import InvertedIndex
+
+
+def document(item_id, title, authors=(), description=None):
+    return {
+        'id': item_id,
+        'type': 'book',
+        'title': title,
+        'authors': list(authors),
+        'issue': None,
+        'tags': [],
+        'description': description,
+        'language': 'english',
+        'category': 'developers',
+    }
+
+
+def test_index_ranks_and_matches_prefixes():
+    index = InvertedIndex()
+    index.rebuild([
+        document(1, 'Clean Code', ['Robert Martin']),
+        document(2, 'Refactoring', description='code smells'),
+        document(3, 'Domain Driven Design'),
+    ])
+    assert [d['id'] for d in index.search('cod')] == [1, 2]
+    assert [d['id'] for d in index.search('code martin')] == [1]
+    assert index.search('nothing') == []
+
+
+def test_index_incremental_update_and_remove():
+    index = InvertedIndex()
+    index.add(document(1, 'Working Effectively'))
+    index.add(document(1, 'Legacy Code'))
+    assert index.search('working') == []
+    assert [d['id'] for d in index.search('legacy')] == [1]
+    index.remove(1)
+    assert len(index) == 0
+    assert index.search('legacy') == []
+
+
+def test_index_lists_all_by_title():
+    index = InvertedIndex()
+    index.rebuild([document(1, 'b'), document(2, 'A'), document(3, 'c')])
+    assert [d['id'] for d in index.search('')] == [2, 1, 3]
+
+
+@pytest.fixture
+def memory_backend(app, session, monkeypatch):
+    monkeypatch.setitem(app.config, 'SEARCH_BACKEND', 'memory')
+    monkeypatch.setattr(catalog_indexer, 'built_at', None)
+    catalog_indexer.rebuild()
+    yield catalog_index
+
+
+def test_commits_update_memory_index(memory_backend, session):
+    author = Author(first_name='Ursula', last_name='Leguin')
+    book = Book(title='Earthsea', authors=[author], tags=[])
+    session.add(book)
+    session.commit()
+    assert book.id in [d['id'] for d in memory_backend.search('leguin')]
+
+    book.title = 'The Dispossessed'
+    session.commit()
+    assert [d['id'] for d in memory_backend.search('dispossessed')] \
+        == [book.id]
+
+    book_id = book.id
+    session.delete(book)
+    session.commit()
+    assert book_id not in [d['id'] for d in memory_backend.search('leguin')]
+
+
+def test_search_view_uses_memory_index(memory_backend, client, app_session,
+                                       session):
+    book = Book(title='Memory Only Title', authors=[], tags=[])
+    session.add(book)
+    session.commit()
+    resp = client.get(url_for('library.search', query='memory only'))
+    assert resp.status_code == 200
+    assert b'Memory Only Title' in resp.data
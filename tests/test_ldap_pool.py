@@ -0,0 +1,118 @@
+import pytest
+from flask import session, url_for
+from flask_simpleldap import LDAPException
+
+from ldap_utils.cache import DirectoryCache
+from ldap_utils.ldap_utils import ldap_client
+from ldap_utils.pool import ConnectionPool
+from models.users import User
+from tests.benchmarks.suite import measure_logins
+
+
+@pytest.mark.usefixtures('session')
+def test_login_reuses_pooled_connections(app, ldap_server):
+    ldap_server.add_user('jpool', 'secret')
+    for _ in range(5):
+        with app.test_client() as client:
+            client.post(url_for('library.login'),
+                        data={'username': 'jpool', 'password': 'secret'})
+            assert session['logged_in'] is True
+    assert User.query.filter_by(email='jpool@example.com').count() == 1
+    # one service and one auth connection, the service bound once
+    assert ldap_server.connections == 2
+    assert ldap_server.binds == 1 + 5
+
+
+def test_wrong_password_keeps_auth_connection(app, ldap_server):
+    ldap_server.add_user('jwrong', 'secret')
+    assert ldap_client.bind_user('jwrong', 'nope') is None
+    assert ldap_client.bind_user('jwrong', 'secret') is True
+    assert ldap_client.bind_user('nobody', 'secret') is None
+    assert ldap_server.connections == 2
+
+
+def test_lookup_survives_server_restart(app, ldap_server):
+    ldap_server.add_user('jrestart', 'secret')
+    assert ldap_client.get_object_details(user='jrestart')
+    ldap_server.restart()
+    details = ldap_client.get_object_details(user='jrestart', refresh=True)
+    assert details['mail'] == [b'jrestart@example.com']
+    assert ldap_server.connections == 2
+
+
+def test_idle_connections_are_health_checked(ldap_server):
+    pool = ConnectionPool(lambda: ldap_server.initialize('ldap://stand-in'),
+                          size=2, check_after=0)
+    with pool.connection() as conn:
+        conn.simple_bind_s(ldap_server.service_dn,
+                           ldap_server.service_password)
+    ldap_server.restart()
+    with pool.connection() as conn:
+        assert conn.whoami_s() == 'dn:'
+    assert pool.created == 2
+
+
+def test_pool_is_bounded(ldap_server):
+    pool = ConnectionPool(lambda: ldap_server.initialize('ldap://stand-in'),
+                          size=1, timeout=0.01)
+    with pool.connection():
+        with pytest.raises(LDAPException):
+            with pool.connection():
+                pass
+    with pool.connection():
+        pass
+    assert pool.created == 1
+
+
+@pytest.mark.usefixtures('session')
+def test_login_benchmark_counts_connections(app, ldap_server):
+    results = measure_logins(app, ldap_server, logins=6, users=3)
+    assert results['requests'] == 6
+    assert results['ldap_connections'] <= 2
+    assert results['logins_per_second'] > 0
+
+
+def test_lookups_are_cached(app, ldap_server):
+    ldap_server.add_user('jcache', 'secret',
+                         memberOf='CN=Devs,OU=Groups,DC=example,DC=com')
+    for _ in range(3):
+        assert ldap_client.get_object_details(user='jcache')
+        assert ldap_client.get_user_groups('jcache') == ['Devs']
+        assert ldap_client.get_object_details(user='jghost') is None
+    assert ldap_server.searches == 3
+    ldap_client.get_object_details(user='jcache', refresh=True)
+    assert ldap_server.searches == 4
+
+
+@pytest.mark.usefixtures('session')
+def test_login_refreshes_cached_entry(app, ldap_server):
+    ldap_server.add_user('jfresh', 'secret')
+    assert ldap_client.get_object_details(user='jfresh')['mail'] == \
+        [b'jfresh@example.com']
+    ldap_server.add_user('jfresh', 'secret', mail='jfresh@new.example.com')
+    with app.test_client() as client:
+        client.post(url_for('library.login'),
+                    data={'username': 'jfresh', 'password': 'secret'})
+        assert session['email'] == 'jfresh@new.example.com'
+
+
+def test_directory_cache_expires_entries():
+    cache = DirectoryCache(maxsize=2, ttl=60, negative_ttl=0)
+    cache.set('found', {'mail': [b'x']})
+    cache.set('missing', None)
+    assert cache.get('found') == {'mail': [b'x']}
+    assert cache.get('missing') is DirectoryCache.MISSING
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('found') is DirectoryCache.MISSING
+    assert len(cache) == 2
+
+
+@pytest.mark.usefixtures('session')
+def test_login_searches_directory_once(app, ldap_server):
+    ldap_server.add_user('jonce', 'secret')
+    with app.test_client() as client:
+        client.post(url_for('library.login'),
+                    data={'username': 'jonce', 'password': 'secret'})
+        assert session['email'] == 'jonce@example.com'
+    assert ldap_server.searches == 1
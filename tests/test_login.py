@@ -1,8 +1,11 @@
 from unittest import mock
 
+import pytest
 from flask import url_for
 from flask import session
 
+from models.users import RoleEnum, upsert_user, User
+
 
 def test_login_status_code_for_get(client, login_form, mock_ldap):
     with mock.patch('views.index.ldap_client', mock_ldap):
@@ -29,6 +32,8 @@ def test_login_valid_data_inserted(login_form, mock_ldap, app):
         c.post(url_for('library.login'), data=login_form.data)
         assert session['logged_in'] is True, \
             "Login view, user with valid data hasn't logged in"
+        assert session['roles'] == RoleEnum.USER.bit, \
+            "Login view, role mask missing in session"
         session.clear()
 
 
@@ -42,3 +47,61 @@ def test_login_invalid_data_inserted(app, login_form_invalid, mock_ldap):
         assert 'logged_in' not in session, \
             "Login view, user with invalid data logged in"
         session.clear()
+
+
+@pytest.mark.usefixtures('session')
+def test_login_writes_only_changed_users(app, ldap_server, statement_log):
+    ldap_server.add_user('jupsert', 'secret', employeeID='99200')
+    for _ in range(2):
+        with statement_log, app.test_client() as client:
+            client.post(url_for('library.login'),
+                        data={'username': 'jupsert', 'password': 'secret'})
+            assert session['roles'] == RoleEnum.USER.bit
+    user = User.query.filter_by(employee_id='99200').one()
+    assert [role.name for role in user.roles] == [RoleEnum.USER]
+    # the second login finds the account unchanged
+    assert statement_log.of('INSERT', 'UPDATE', 'DELETE') == []
+
+
+@pytest.mark.usefixtures('session')
+def test_login_leaves_profile_changes_to_sync(app, ldap_server,
+                                              statement_log):
+    ldap_server.add_user('jrename', 'secret', employeeID='99210')
+    with app.test_client() as client:
+        client.post(url_for('library.login'),
+                    data={'username': 'jrename', 'password': 'secret'})
+    ldap_server.add_user('jrename', 'secret', employeeID='99210',
+                         sn='Renamed')
+    with statement_log, app.test_client() as client:
+        client.post(url_for('library.login'),
+                    data={'username': 'jrename', 'password': 'secret'})
+        assert session['logged_in']
+    assert statement_log.of('INSERT', 'UPDATE', 'DELETE') == []
+    assert User.query.filter_by(employee_id='99210').one().surname == \
+        'Standin'
+
+
+@pytest.mark.usefixtures('session')
+def test_login_refuses_inactive_user(app, db, ldap_server):
+    ldap_server.add_user('jleft', 'secret', employeeID='99220')
+    upsert_user(email='jleft@example.com', first_name='Jleft',
+                surname='Standin', employee_id='99220')
+    User.query.filter_by(employee_id='99220').update({'active': False})
+    db.session.commit()
+    with app.test_client() as client:
+        response = client.post(url_for('library.login'),
+                               data={'username': 'jleft',
+                                     'password': 'secret'})
+        assert 'logged_in' not in session
+    assert b'no longer active' in response.data
+
+
+@pytest.mark.usefixtures('session')
+def test_upsert_user_updates_directory_data(app, db):
+    first = upsert_user(email='jnew@example.com', first_name='J',
+                        surname='New', employee_id='99300')
+    second = upsert_user(email='jnew@example.com', first_name='J',
+                         surname='Renamed', employee_id='99300')
+    db.session.commit()
+    assert first.id == second.id
+    assert User.query.get(first.id).surname == 'Renamed'
@@ -2,9 +2,12 @@ from sqlalchemy import func
 
 import flask
 from flask import url_for
+import pytest
 
+from models import Author, Book, Magazine, Tag
 from models.users import RoleEnum, Role
 from models.library import LibraryItem
+from search_engine import get_search_backend
 
 
 def test_search_get(client, app_session):
@@ -104,3 +107,28 @@ def test_search_serializer(app):
                                               max_per_page=10)
         output = [d.serialize() for d in paginate_query.items]
         assert len(output) == len(paginate_query.items)
+
+
+@pytest.mark.parametrize('mode', ['offset', 'keyset'])
+def test_search_listing_statement_count(app, session, monkeypatch,
+                                        statement_log, mode):
+    monkeypatch.setitem(app.config, 'SEARCH_BACKEND', 'sql')
+    monkeypatch.setitem(app.config, 'PAGINATION_MODE', mode)
+    tag = Tag(name='statements-{}'.format(mode))
+    for i in range(6):
+        session.add(Book(title='Statements book {}'.format(i),
+                         authors=[Author(first_name='First{}'.format(i),
+                                         last_name='Last')],
+                         tags=[tag]))
+        session.add(Magazine(title='Statements magazine {}'.format(i),
+                             issue=str(i), tags=[tag]))
+    session.commit()
+    session.expire_all()
+    with app.test_request_context('/search?query=statements'):
+        with statement_log:
+            pagination = get_search_backend().search('statements', 1, 10)
+    assert len(pagination.items) == 10
+    # count, page and the authors of its books
+    assert len(statement_log) == 3
+    books = [item for item in pagination.items if item['type'] == 'book']
+    assert all(item['authors'][0].startswith('First') for item in books)
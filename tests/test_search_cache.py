@@ -0,0 +1,70 @@
+from datetime import datetime
+from unittest import mock
+
+from flask import session as flask_session, url_for
+import pytest
+
+from models import Book, Copy, WishListItem
+from search_engine import cache_stats, catalog_generation, search_catalog
+from search_engine.backends import page_cache
+
+
+@pytest.fixture
+def empty_page_cache():
+    page_cache.clear()
+    yield page_cache
+    page_cache.clear()
+
+
+def test_search_pages_are_cached(app, session, empty_page_cache):
+    session.add(Book(title='Cachedbook one', authors=[], tags=[]))
+    session.commit()
+    with app.test_request_context('/search?query=cachedbook'):
+        first = search_catalog('Cachedbook', 1, 10)
+        second = search_catalog('  cachedbook ', 1, 10)
+    assert second is first
+    assert [item['title'] for item in first.items] == ['Cachedbook one']
+    assert cache_stats()['pages']['hits'] == 1
+    assert cache_stats()['pages']['misses'] == 1
+
+
+def test_catalog_write_invalidates_cached_pages(app, session,
+                                                empty_page_cache):
+    with app.test_request_context('/search?query=cachedbook'):
+        search_catalog('cachedbook', 1, 10)
+        session.add(Book(title='Cachedbook two', authors=[], tags=[]))
+        session.commit()
+        page = search_catalog('cachedbook', 1, 10)
+    assert 'Cachedbook two' in [item['title'] for item in page.items]
+    assert cache_stats()['pages']['misses'] == 2
+
+
+def test_remove_copy_bumps_catalog_generation(
+        client, session, db_book, login_form_admin_credentials, mock_ldap):
+    copy = Copy(asset_code='cc100200', library_item=db_book)
+    session.add(copy)
+    session.commit()
+    with mock.patch('views.index.ldap_client', mock_ldap):
+        client.post(url_for('library.login'),
+                    data=login_form_admin_credentials.data)
+        generation = catalog_generation.value
+        client.post(url_for('library.remove_copy', item_id=db_book.id,
+                            copy_id=copy.id))
+        assert Copy.query.get(copy.id) is None
+        assert catalog_generation.value > generation
+        resp = client.get(url_for('library.api_search_stats'))
+        assert resp.status_code == 200
+        assert set(resp.get_json()) == {'pages', 'facets'}
+        flask_session.clear()
+
+
+def test_committing_a_wish_does_not_hash_it(session):
+    generation = catalog_generation.value
+    wish = WishListItem(authors='Anna Wish', title='Unhashable wish',
+                        pub_year=datetime(2001, 1, 1), item_type='book')
+    session.add(wish)
+    session.commit()
+    wish.title = 'Unhashable wish, edited'
+    session.commit()
+    assert WishListItem.query.get(wish.id).title == 'Unhashable wish, edited'
+    assert catalog_generation.value == generation
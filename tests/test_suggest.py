@@ -0,0 +1,74 @@
+from flask import url_for
+import pytest
+
+from models import Author, Book
+from search_engine import (
+    catalog_indexer,
+    init_search_indexes,
+    wishlist_indexer
+)
+from search_engine.prefix import PrefixIndex
+
+
+@pytest.fixture
+def prefix_index():
+    index = PrefixIndex()
+    index.rebuild([
+        {'id': 1, 'title': 'Pan Tadeusz', 'authors': ['Adam Mickiewicz'],
+         'tags': ['poetry']},
+        {'id': 2, 'title': 'Dziady', 'authors': ['Adam Mickiewicz'],
+         'tags': ['poetry', 'drama']},
+        {'id': 3, 'title': 'Python Tricks', 'authors': ['Dan Bader'],
+         'tags': ['python']},
+    ])
+    return index
+
+
+def test_prefix_index_completes_any_word(prefix_index):
+    assert prefix_index.complete('tad') == [
+        {'text': 'Pan Tadeusz', 'type': 'title'}]
+    assert prefix_index.complete('mick') == [
+        {'text': 'Adam Mickiewicz', 'type': 'author'}]
+
+
+def test_prefix_index_ranks_by_usage(prefix_index):
+    assert prefix_index.complete('p') == [
+        {'text': 'poetry', 'type': 'tag'},
+        {'text': 'Pan Tadeusz', 'type': 'title'},
+        {'text': 'Python Tricks', 'type': 'title'},
+        {'text': 'python', 'type': 'tag'},
+    ]
+    assert len(prefix_index.complete('p', limit=2)) == 2
+    assert prefix_index.complete('') == []
+
+
+def test_prefix_index_add_and_remove(prefix_index):
+    prefix_index.remove(3)
+    assert prefix_index.complete('pyth') == []
+    prefix_index.add({'id': 3, 'title': 'Fluent Python', 'authors': [],
+                      'tags': []})
+    assert prefix_index.complete('pyth') == [
+        {'text': 'Fluent Python', 'type': 'title'}]
+    prefix_index.remove(1)
+    assert prefix_index.complete('mick') == [
+        {'text': 'Adam Mickiewicz', 'type': 'author'}]
+
+
+def test_api_suggest(monkeypatch, client, app_session, session):
+    monkeypatch.setattr(catalog_indexer, 'built_at', None)
+    author = Author(first_name='Bolesław', last_name='Prus')
+    session.add(Book(title='Lalka', authors=[author], tags=[]))
+    session.commit()
+    resp = client.get(url_for('library.api_suggest', q='lal'))
+    assert resp.status_code == 200
+    assert resp.get_json() == {
+        'suggestions': [{'text': 'Lalka', 'type': 'title'}]}
+
+
+def test_indexes_are_built_at_worker_start(app, session, monkeypatch):
+    monkeypatch.setitem(app.config, 'SEARCH_BACKEND', 'sql')
+    monkeypatch.setattr(catalog_indexer, 'built_at', None)
+    monkeypatch.setattr(wishlist_indexer, 'built_at', None)
+    init_search_indexes(app)
+    assert catalog_indexer.built_at is not None
+    assert wishlist_indexer.built_at is not None
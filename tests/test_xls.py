@@ -1,4 +1,9 @@
-from utils.xlsx_reader import (get_books, get_magazines)
+from datetime import date
+from unittest import mock
+
+from init_db import db
+from utils.xlsx_reader import (CatalogLoader, commit, get_books,
+                               get_magazines, load_workbook)
 from models import (
     Author,
     Book,
@@ -30,3 +35,48 @@ def test_loading_from_xlsx(session):
         'db does not contain magazine from 2000'
     assert Magazine.query.filter(
         Magazine.issue == '7'), 'db does not contain issue 7'
+
+
+def test_load_workbook_writes_in_one_transaction(session):
+    with mock.patch.object(db.session, 'commit',
+                           wraps=db.session.commit) as commit:
+        stats = load_workbook('./library_testfile.xlsx', chunk_size=2)
+    assert commit.call_count == 1
+    assert stats['rows'] > 0
+    assert stats['rows_per_second'] > 0
+    for item in Book.query.all() + Magazine.query.all():
+        assert item.total_copies == item.available_copies == \
+            len(item.copies)
+        assert item.title_key
+    book = Book.query.filter(Book.authors.any()).first()
+    assert book.authors[0].last_name.lower() in book.search_document
+
+
+def test_load_workbook_again_adds_nothing(session):
+    load_workbook('./library_testfile.xlsx')
+    counts = Book.query.count(), Magazine.query.count(), Copy.query.count()
+    stats = load_workbook('./library_testfile.xlsx')
+    assert stats['rows'] > 0
+    assert (stats['authors'], stats['books'], stats['magazines'],
+            stats['copies']) == (0, 0, 0, 0)
+    assert (Book.query.count(), Magazine.query.count(),
+            Copy.query.count()) == counts
+
+
+def test_empty_load_reports_zero_counts(session):
+    stats = CatalogLoader().finish()
+    assert (stats['rows'], stats['authors'], stats['books'],
+            stats['magazines'], stats['copies']) == (0, 0, 0, 0, 0)
+
+
+def test_magazine_without_year_matches_any_year(session):
+    loader = CatalogLoader()
+    loader.add_magazine('Yearless Monthly', '4', date(2001, 1, 1))
+    loader.add_magazine('Yearless Monthly', '4', None)
+    loader.add_magazine('Yearless Monthly', '5', None)
+    loader.add_magazine('Yearless Monthly', '5', date(2002, 1, 1))
+    stats = commit(loader)
+    assert stats['magazines'] == 3
+    loader = CatalogLoader()
+    loader.add_magazine('Yearless Monthly', '5', None)
+    assert commit(loader)['magazines'] == 0
@@ -0,0 +1,480 @@
+"""Bulk import of books, magazines and copies.
+
+Rows are checked with the validators of the add item forms, looked up
+against the catalog with one query per chunk of keys and written with
+one executemany per chunk of rows and table, inside the caller's
+transaction. Authors and tags named by several rows are found or
+inserted once for the whole batch.
+
+Rows are dicts with the fields of the items export: type ("book",
+"magazine" or "copy"), title, isbn, authors, tags, copies and so on.
+Authors, tags and copies are lists or "; " separated strings; authors
+are "First Last" names or (first_name, last_name) pairs, copies are
+"asset_code@shelf" strings or dicts. A copy row adds one copy to the
+book with its isbn or to the item with its item_id.
+
+Every row gets a result: "created" with the id of the item, "duplicate"
+with the id of the item it repeats, or "invalid" with the errors of its
+fields, shaped like the errors of a form. Books repeat each other when
+their title or ISBN keys meet, as in views.book.book_exists, magazines
+when their title keys, issues and years do.
+
+Rows are written around the ORM, so the search keys and copy counters
+the session events keep for single items are filled in here.
+"""
+from collections import Counter
+from datetime import date
+
+from sqlalchemy import bindparam, func
+from wtforms.validators import ValidationError
+
+from forms.custom_validators import (
+    check_author,
+    check_category,
+    check_isbn_number,
+    check_language,
+    check_pub_date
+)
+from init_db import db
+from models import Author, Book, Copy, LibraryItem, Magazine, Tag
+from models.books import book_author
+from models.catalog import author_names, chunks, resolve_authors, \
+    resolve_tags
+from models.library import item_tags
+from search_engine.analysis import isbn_key, title_key
+from search_engine.documents import analyze_fields
+
+CREATED = 'created'
+DUPLICATE = 'duplicate'
+INVALID = 'invalid'
+
+ITEM_TYPES = ('book', 'magazine', 'copy')
+
+# rows per executemany
+INSERT_CHUNK_SIZE = 1000
+
+
+class Field:
+    """The part of a form field the custom validators look at."""
+
+    def __init__(self, data):
+        self.data = data
+
+
+def required(form, field):
+    if not field.data:
+        raise ValidationError('This field is required.')
+
+
+def fits(column):
+    def check_length(form, field):
+        if field.data and len(field.data) > column.type.length:
+            raise ValidationError(
+                'Field cannot be longer than {} characters.'.format(
+                    column.type.length))
+    return check_length
+
+
+def text(value):
+    return '' if value is None else str(value).strip()
+
+
+def listed(value):
+    """Return a list given as a list or as a "; " separated string."""
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [part for part in text(value).split(';') if part.strip()]
+
+
+def author_name(author):
+    """Return (first_name, last_name) of an author given as a pair, a
+    dict or a "First Last" name, the way the export writes it."""
+    if isinstance(author, dict):
+        return text(author.get('first_name')), text(author.get('last_name'))
+    if isinstance(author, (list, tuple)) and len(author) == 2:
+        return text(author[0]), text(author[1])
+    first_name, _, last_name = text(author).rpartition(' ')
+    return first_name.strip(), last_name
+
+
+def copy_values(copy):
+    """Return the columns of a copy given as a dict or as the
+    "asset_code@shelf" the export writes."""
+    if isinstance(copy, dict):
+        asset_code = copy.get('asset_code')
+        shelf = copy.get('shelf')
+        has_cd_disk = copy.get('has_cd_disk')
+    else:
+        asset_code, _, shelf = text(copy).partition('@')
+        has_cd_disk = False
+    return {
+        'asset_code': text(asset_code) or None,
+        'shelf': text(shelf) or None,
+        'has_cd_disk': has_cd_disk is True or
+        text(has_cd_disk).lower() in ('1', 'true', 'yes'),
+    }
+
+
+def year_of(value):
+    """Return the year of a date given as 2015 or 2015-01-01."""
+    return text(value)[:4]
+
+
+class Record:
+    """One row of a batch: its columns, then its fate."""
+
+    def __init__(self, number, row):
+        self.number = number
+        self.type = text(row.get('type')).lower()
+        self.errors = {}
+        self.item = {}
+        self.details = {}
+        self.authors = []
+        self.tags = []
+        self.copies = []
+        self.status = None
+        # the item created, repeated or copied, or the record of the
+        # batch that writes it
+        self.id = None
+        self.same_as = None
+        if self.type not in ITEM_TYPES:
+            self.errors['type'] = ['Not a valid choice.']
+        elif self.type == 'copy':
+            self.read_copy_row(row)
+        else:
+            self.read_item(row)
+            if self.type == 'book':
+                self.read_book(row)
+            else:
+                self.read_magazine(row)
+        if self.errors:
+            self.status = INVALID
+
+    def validate(self, name, value, validators):
+        """Run form validators on value; return the value they leave, or
+        None after recording the error under name."""
+        field = Field(value)
+        for validator in validators:
+            try:
+                validator(None, field)
+            except ValidationError as e:
+                self.errors.setdefault(name, []).append(str(e))
+                return None
+            except (TypeError, ValueError):
+                self.errors.setdefault(name, []).append('Not a valid value.')
+                return None
+        return field.data
+
+    def invalidate(self, name, message):
+        self.errors.setdefault(name, []).append(message)
+        self.status = INVALID
+
+    def read_copy_row(self, row):
+        self.isbn_key = None
+        if text(row.get('isbn')):
+            self.isbn_key = isbn_key(self.validate(
+                'isbn', text(row['isbn']), [check_isbn_number]))
+        elif text(row.get('item_id')).isdigit():
+            self.id = int(text(row['item_id']))
+        else:
+            self.errors['item_id'] = ['Give the isbn or the item_id of '
+                                      'the item to add the copy to.']
+        self.copies = [self.read_copy(row)]
+
+    def read_copy(self, copy):
+        copy = copy_values(copy)
+        columns = Copy.__table__.c
+        self.validate('copies', copy['asset_code'],
+                      [fits(columns.asset_code)])
+        self.validate('copies', copy['shelf'], [fits(columns.shelf)])
+        return copy
+
+    def read_item(self, row):
+        columns = LibraryItem.__table__.c
+        self.item = {
+            'type': self.type,
+            'title': self.validate('title', text(row.get('title')),
+                                   [required, fits(columns.title)]),
+            'language': self.validate('language', text(row.get('language')),
+                                      [check_language]),
+            'category': self.validate('category', text(row.get('category')),
+                                      [check_category]),
+            'table_of_contents': self.validate(
+                'table_of_contents', text(row.get('table_of_contents')),
+                [fits(columns.table_of_contents)]),
+            'description': text(row.get('description')),
+        }
+        tag_name = fits(Tag.__table__.c.name)
+        self.tags = [self.validate('tags', text(tag), [tag_name])
+                     for tag in listed(row.get('tags'))]
+        self.copies = [self.read_copy(copy)
+                       for copy in listed(row.get('copies'))]
+
+    def read_book(self, row):
+        columns = Book.__table__.c
+        isbn = self.validate('isbn', text(row.get('isbn')),
+                             [required, check_isbn_number])
+        self.details = {
+            'isbn': isbn,
+            'isbn_key': isbn_key(isbn),
+            'original_title': self.validate(
+                'original_title', text(row.get('original_title')),
+                [fits(columns.original_title)]),
+            'publisher': self.validate(
+                'publisher', text(row.get('publisher')),
+                [required, fits(columns.publisher)]),
+        }
+        year = self.validate('pub_date', year_of(row.get('pub_date')),
+                             [required, check_pub_date])
+        if year:
+            self.details['pub_date'] = date(int(year), 1, 1)
+        self.authors = [author_name(author)
+                        for author in listed(row.get('authors'))]
+        if not self.authors:
+            self.errors['authors'] = ['This field is required.']
+        author_part = fits(Author.__table__.c.last_name)
+        for name in self.authors:
+            for part in name:
+                self.validate('authors', part,
+                              [required, check_author, author_part])
+
+    def read_magazine(self, row):
+        title = self.item['title']
+        if title and len(title) < 3:
+            self.errors['title'] = [
+                'Field must be at least 3 characters long.']
+        self.details = {
+            'issue': self.validate('issue', text(row.get('issue')),
+                                   [fits(Magazine.__table__.c.issue)]),
+        }
+        year = self.validate('year',
+                             year_of(row.get('year') or row.get('pub_date')),
+                             [required, check_pub_date])
+        if year:
+            self.details['year'] = date(int(year), 1, 1)
+
+    def keys(self):
+        """Return the keys under which the item meets its duplicates."""
+        key = title_key(self.item['title'])
+        if self.type == 'book':
+            return [('title', key), ('isbn', self.details['isbn_key'])]
+        return [('magazine',
+                 (key, self.details['issue'], self.details['year']))]
+
+    def search_fields(self):
+        """Return the fields search_engine.documents indexes."""
+        fields = [self.item['title']]
+        if self.type == 'book':
+            fields.append(self.details['original_title'])
+            fields.extend('{} {}'.format(*name) for name in self.authors)
+        else:
+            fields.append(self.details['issue'])
+        fields.extend(self.tags)
+        fields.append(self.item['description'])
+        return fields
+
+    def result(self):
+        result = {'row': self.number, 'status': self.status}
+        if self.status == INVALID:
+            result['errors'] = self.errors
+        else:
+            result['id'] = self.same_as.id if self.same_as else self.id
+        return result
+
+
+def import_catalog(rows, chunk_size=INSERT_CHUNK_SIZE):
+    """Write the valid, new rows and return the results of all rows, in
+    their order. The caller commits."""
+    records = [Record(number, row) for number, row in enumerate(rows, 1)]
+    items = [record for record in records
+             if not record.status and record.type != 'copy']
+    copy_rows = [record for record in records
+                 if not record.status and record.type == 'copy']
+    mark_duplicates(items)
+    asset_codes = AssetCodes(items + copy_rows)
+    items = [record for record in items
+             if not record.status and asset_codes.claim(record)]
+    find_copied_items(copy_rows, items)
+    copy_rows = [record for record in copy_rows
+                 if not record.status and asset_codes.claim(record)]
+    write_items(items, copy_rows, chunk_size)
+    write_copies(items + copy_rows, chunk_size)
+    add_copy_counts(Counter(row.id for row in copy_rows if not row.same_as))
+    for record in items + copy_rows:
+        record.status = CREATED
+    return [record.result() for record in records]
+
+
+def mark_duplicates(items):
+    """Mark items already in the catalog or earlier in the batch."""
+    found = existing_items(key for item in items for key in item.keys())
+    seen = {}
+    for item in items:
+        keys = [key for key in item.keys() if key[1]]
+        for key in keys:
+            if key in found:
+                item.status, item.id = DUPLICATE, found[key]
+                break
+            if key in seen:
+                item.status, item.same_as = DUPLICATE, seen[key]
+                break
+        else:
+            seen.update((key, item) for key in keys)
+
+
+def existing_items(keys):
+    """Return {(kind, key): item id} of the keys found in the catalog,
+    with one query per chunk of keys of each kind."""
+    by_kind = {}
+    for kind, key in keys:
+        if key:
+            by_kind.setdefault(kind, set()).add(key)
+    queries = {
+        'title': lambda chunk: db.session.query(
+            LibraryItem.title_key, LibraryItem.id).filter(
+            LibraryItem.type == 'book', LibraryItem.title_key.in_(chunk)),
+        'isbn': lambda chunk: db.session.query(
+            Book.isbn_key, Book.id).filter(Book.isbn_key.in_(chunk)),
+        'magazine': lambda chunk: db.session.query(
+            Magazine.title_key, Magazine.issue, Magazine.year,
+            Magazine.id).filter(Magazine.title_key.in_(
+                [key[0] for key in chunk])),
+    }
+    found = {}
+    for kind, kind_keys in by_kind.items():
+        for chunk in chunks(kind_keys):
+            for row in queries[kind](chunk):
+                key = row[0] if len(row) == 2 else tuple(row[:-1])
+                if key in kind_keys:
+                    found.setdefault((kind, key), row[-1])
+    return found
+
+
+class AssetCodes:
+    """Asset codes in use, loaded for the codes a batch brings."""
+
+    def __init__(self, records):
+        codes = {copy['asset_code'] for record in records
+                 for copy in record.copies if copy['asset_code']}
+        self.taken = set()
+        for chunk in chunks(codes):
+            self.taken.update(code for code, in db.session.query(
+                Copy.asset_code).filter(Copy.asset_code.in_(chunk)))
+
+    def claim(self, record):
+        """Take the asset codes of record's copies, or invalidate it
+        when one is in use already."""
+        codes = [copy['asset_code'] for copy in record.copies
+                 if copy['asset_code']]
+        repeated = Counter(codes)
+        for code in codes:
+            if code in self.taken or repeated[code] > 1:
+                record.invalidate(
+                    'copies', 'Asset code {} is in use.'.format(code))
+                return False
+        self.taken.update(codes)
+        return True
+
+
+def find_copied_items(copy_rows, items):
+    """Point copy rows at the book with their isbn, from the batch or
+    from the catalog, or check that their item_id exists."""
+    batch_books = {item.details['isbn_key']: item for item in items
+                   if item.type == 'book'}
+    isbns = existing_items(('isbn', row.isbn_key) for row in copy_rows
+                           if row.isbn_key not in batch_books)
+    item_ids = set()
+    for chunk in chunks({row.id for row in copy_rows if row.id}):
+        item_ids.update(item_id for item_id, in db.session.query(
+            LibraryItem.id).filter(LibraryItem.id.in_(chunk)))
+    for row in copy_rows:
+        if row.isbn_key in batch_books:
+            row.same_as = batch_books[row.isbn_key]
+        elif row.isbn_key:
+            row.id = isbns.get(('isbn', row.isbn_key))
+            if row.id is None:
+                row.invalidate('isbn', 'No book has this ISBN number.')
+        elif row.id not in item_ids:
+            row.invalidate('item_id', 'No item has this id.')
+
+
+def insert(table, rows, chunk_size):
+    for chunk in chunks(rows, chunk_size):
+        db.session.execute(table.insert(), chunk)
+
+
+def write_items(items, copy_rows, chunk_size):
+    """Insert items with their authors and tags, under ids reserved up
+    front, as executemany cannot return generated keys."""
+    authors = resolve_authors(name for item in items
+                              for name in item.authors)
+    tags = resolve_tags(tag for item in items for tag in item.tags)
+    copied = Counter(row.same_as for row in copy_rows if row.same_as)
+    library_items, books, magazines, book_authors, item_tag_rows = \
+        [], [], [], [], []
+    for item, item_id in zip(items, reserve_ids(LibraryItem.__table__,
+                                                len(items))):
+        item.id = item_id
+        language = item.item['language']
+        copies = len(item.copies) + copied[item]
+        library_items.append(dict(
+            item.item,
+            id=item_id,
+            search_title=analyze_fields([item.item['title']], language),
+            search_document=analyze_fields(item.search_fields(), language),
+            title_key=title_key(item.item['title']),
+            total_copies=copies,
+            available_copies=copies))
+        if item.type == 'book':
+            books.append(dict(item.details, id=item_id))
+            book_authors.extend(
+                {'book_id': item_id, 'author_id': authors[name].id}
+                for name in author_names(item.authors))
+        else:
+            magazines.append(dict(item.details, id=item_id))
+        item_tag_rows.extend({'item_id': item_id, 'tag_id': tags[name].id}
+                             for name in dict.fromkeys(item.tags))
+    insert(LibraryItem.__table__, library_items, chunk_size)
+    insert(Book.__table__, books, chunk_size)
+    insert(Magazine.__table__, magazines, chunk_size)
+    insert(book_author, book_authors, chunk_size)
+    insert(item_tags, item_tag_rows, chunk_size)
+
+
+def write_copies(records, chunk_size):
+    insert(Copy.__table__, [
+        dict(copy, library_item_id=(record.same_as or record).id)
+        for record in records for copy in record.copies], chunk_size)
+
+
+def add_copy_counts(added):
+    """Count copies added to items, given as {item id: copies}, with one
+    statement for all of them."""
+    if not added:
+        return
+    items = LibraryItem.__table__
+    db.session.execute(
+        items.update()
+        .where(items.c.id == bindparam('b_id'))
+        .values(total_copies=items.c.total_copies + bindparam('b_count'),
+                available_copies=items.c.available_copies +
+                bindparam('b_count')),
+        [{'b_id': item_id, 'b_count': count}
+         for item_id, count in added.items()])
+
+
+def reserve_ids(table, count):
+    """Return count new ids of table.
+
+    Postgres draws them from the id sequence; elsewhere they follow the
+    highest id, which is only safe while nobody else writes the table.
+    """
+    if not count:
+        return []
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return [item_id for item_id, in db.session.execute(
+            "SELECT nextval(pg_get_serial_sequence(:name, 'id')) "
+            "FROM generate_series(1, :count)",
+            {'name': table.name, 'count': count})]
+    first = (db.session.query(func.max(table.c.id)).scalar() or 0) + 1
+    return list(range(first, first + count))
@@ -0,0 +1,115 @@
+"""Circuit breakers for calls to the directory and mail servers.
+
+A slow or unreachable server would otherwise hold a worker for the whole
+network timeout on every request. After failure_threshold consecutive
+failed calls a breaker opens and calls fail at once with
+CircuitOpenError. After reset_timeout seconds one probe call is let
+through (half-open): if it succeeds the breaker closes, otherwise it
+opens again. Calls slower than latency_budget count as failures even
+when they succeed.
+
+The module has no Flask dependency, the cron image uses it as well.
+"""
+from contextlib import contextmanager
+from threading import Lock
+from time import monotonic
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a service whose circuit is open."""
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30,
+                 latency_budget=None, failures=(Exception,), ignore=()):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.latency_budget = latency_budget
+        # exceptions counting as failed calls; ignored ones, e.g. wrong
+        # credentials, show the server is answering
+        self.failures = failures
+        self.ignore = ignore
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self.probing = False
+            self.calls = 0
+            self.failed_calls = 0
+            self.slow_calls = 0
+            self.rejected_calls = 0
+            self.trips = 0
+
+    @contextmanager
+    def call(self):
+        """Guard one call to the service:
+
+            with breaker.call():
+                smtp.send_message(message)
+        """
+        probe = self._admit()
+        started = monotonic()
+        try:
+            yield
+        except BaseException as e:
+            self._record(probe, monotonic() - started, e)
+            raise
+        self._record(probe, monotonic() - started)
+
+    def _admit(self):
+        with self._lock:
+            probe = False
+            if self.state == self.OPEN and \
+                    monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self.probing:
+                self.probing = probe = True
+            elif self.state != self.CLOSED:
+                self.rejected_calls += 1
+                raise CircuitOpenError(
+                    '{} is unavailable'.format(self.name))
+            self.calls += 1
+            return probe
+
+    def _record(self, probe, elapsed, error=None):
+        slow = self.latency_budget is not None and \
+            elapsed > self.latency_budget
+        failed = isinstance(error, self.failures) and \
+            not isinstance(error, self.ignore)
+        with self._lock:
+            if probe:
+                self.probing = False
+            if slow:
+                self.slow_calls += 1
+            if failed or slow:
+                self.failed_calls += 1
+                self.consecutive_failures += 1
+                if probe or self.state == self.CLOSED and \
+                        self.consecutive_failures >= self.failure_threshold:
+                    self.state = self.OPEN
+                    self.opened_at = monotonic()
+                    self.trips += 1
+            elif probe or self.state == self.CLOSED:
+                self.consecutive_failures = 0
+                self.state = self.CLOSED
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'calls': self.calls,
+                'failed_calls': self.failed_calls,
+                'slow_calls': self.slow_calls,
+                'rejected_calls': self.rejected_calls,
+                'trips': self.trips,
+            }
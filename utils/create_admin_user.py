@@ -1,73 +1,85 @@
 from config import Config
 from init_db import db
 from ldap_utils.ldap_utils import ldap_client, refine_data
-from models.users import User, Role, RoleEnum
+from models.users import User, Role, RoleEnum, role_cache
 
 
-def create_super_user():
-    try:
-        email_list = Config.ADMIN_LIST.split()
-    except AttributeError:
-        print(
-            'No admins specified in ./docker/.env app will not work properly!'
-        )
-    for email_data in email_list:
-        user_ldap = ldap_client.get_object_details(user=email_data)
-        if user_ldap:
-            if refine_data(user_ldap, 'l') != 'Wroclaw':
-                print(
-                    'Error - employee {} do not work in Wroclaw'.format(
-                        email_data)
-                )
+def create_super_user(email_list=None):
+    """Grant admin privileges to employees, ADMIN_LIST by default.
 
-            user_ldap_data = {
-                'mail': refine_data(user_ldap, 'mail'),
-                'givenName': refine_data(user_ldap, 'givenName'),
-                'sn': refine_data(user_ldap, 'sn'),
-                'employeeID': refine_data(user_ldap, 'employeeID')
-            }
-            user_db = User.query.filter_by(
-                employee_id=user_ldap_data['employeeID']
-            ).first()
-            if user_db:
-                user_db_data = {
-                    'mail': user_db.email,
-                    'givenName': user_db.first_name,
-                    'sn': user_db.surname,
-                    'employeeID': user_db.employee_id
-                }
-                if user_db_data != user_ldap_data:
-                    user_db.email = user_ldap_data['mail']
-                    user_db.first_name = user_ldap_data['givenName']
-                    user_db.surname = user_db_data['sn']
-            else:
-                new_user = User(
-                    email=user_ldap_data['mail'],
-                    first_name=user_ldap_data['givenName'],
-                    surname=user_ldap_data['sn'],
-                    employee_id=user_ldap_data['employeeID'],
-                    active=True
-                )
-                db.session.add(new_user)
-                db.session.commit()
-            user = User.query.filter_by(email=email_data).first()
-            if not user.has_role('ADMIN'):
-                role = Role.query.filter_by(name=RoleEnum.USER).first()
-                user.roles.remove(role)
-                role = Role.query.filter_by(name=RoleEnum.ADMIN).first()
-                user.roles.append(role)
-                db.session.commit()
-                print(
-                    "Employee {} granted with admin privileges".format(
-                        email_data)
-                )
-            else:
-                print(
-                    "Employee {} already have admin privileges".format(
-                        email_data)
-                )
-        else:
+    All employees are looked up with a few batched directory searches,
+    and their accounts and roles are written in a single transaction.
+    """
+    if email_list is None:
+        try:
+            email_list = Config.ADMIN_LIST.split()
+        except AttributeError:
+            print(
+                'No admins specified in ./docker/.env '
+                'app will not work properly!'
+            )
+            return
+    users_ldap = ldap_client.get_users_details(email_list)
+    found = {}
+    for email_data, user_ldap in users_ldap.items():
+        if not user_ldap:
             print(
                 'Error - employee {} not present in Tieto ldap.'.format(
                     email_data)
             )
+            continue
+        if refine_data(user_ldap, 'l') != 'Wroclaw':
+            print(
+                'Error - employee {} do not work in Wroclaw'.format(
+                    email_data)
+            )
+        found[email_data] = {
+            'mail': refine_data(user_ldap, 'mail'),
+            'givenName': refine_data(user_ldap, 'givenName'),
+            'sn': refine_data(user_ldap, 'sn'),
+            'employeeID': refine_data(user_ldap, 'employeeID')
+        }
+    if not found:
+        return
+
+    users_db = {
+        user.employee_id: user for user in User.query.filter(
+            User.employee_id.in_(
+                [data['employeeID'] for data in found.values()])
+        ).options(db.selectinload(User.roles))
+    }
+    roles = {role.name: role for role in Role.query}
+    granted = []
+    for email_data, user_ldap_data in found.items():
+        user = users_db.get(user_ldap_data['employeeID'])
+        if user:
+            user.email = user_ldap_data['mail']
+            user.first_name = user_ldap_data['givenName']
+            user.surname = user_ldap_data['sn']
+        else:
+            user = User(
+                email=user_ldap_data['mail'],
+                first_name=user_ldap_data['givenName'],
+                surname=user_ldap_data['sn'],
+                employee_id=user_ldap_data['employeeID'],
+                active=True
+            )
+            db.session.add(user)
+            users_db[user.employee_id] = user
+        if user.has_role('ADMIN'):
+            print(
+                "Employee {} already have admin privileges".format(
+                    email_data)
+            )
+            continue
+        if roles[RoleEnum.USER] in user.roles:
+            user.roles.remove(roles[RoleEnum.USER])
+        user.roles.append(roles[RoleEnum.ADMIN])
+        granted.append((email_data, user))
+    db.session.commit()
+    for email_data, user in granted:
+        role_cache.invalidate(user.id)
+        print(
+            "Employee {} granted with admin privileges".format(
+                email_data)
+        )
@@ -0,0 +1,156 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+import binascii
+import json
+
+import pytz
+
+from flask import abort, current_app, request
+from sqlalchemy import and_, or_
+
+
+class SortKey:
+    """One column of a keyset ordering."""
+
+    def __init__(self, expression, descending=False):
+        self.expression = expression
+        self.descending = descending
+
+    def order_by(self, backwards=False):
+        if self.descending != backwards:
+            return self.expression.desc()
+        return self.expression.asc()
+
+    def after(self, value, backwards=False):
+        if self.descending != backwards:
+            return self.expression < value
+        return self.expression > value
+
+    def accepts(self, value):
+        """Whether value, read from a cursor, can stand for this key."""
+        if value is None:
+            return True
+        try:
+            python_type = self.expression.type.python_type
+        except (AttributeError, NotImplementedError):
+            return isinstance(value, (str, int, float, datetime))
+        if python_type is float:
+            python_type = (int, float)
+        if isinstance(value, bool) and python_type is not bool:
+            return False
+        return isinstance(value, python_type)
+
+
+DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(pytz.utc).replace(tzinfo=None)
+        return {'dt': value.strftime(DATETIME_FORMAT)}
+    if isinstance(value, Decimal):
+        return {'n': str(value)}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'n' in value:
+            return Decimal(value['n'])
+        return datetime.strptime(value['dt'], DATETIME_FORMAT)
+    return value
+
+
+def encode_cursor(values, backwards=False):
+    payload = json.dumps({'k': [_encode_value(v) for v in values],
+                          'b': backwards}, separators=(',', ':'))
+    return urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, keys):
+    """Return (values, backwards) for a cursor made by encode_cursor,
+    aborting with 400 unless it holds a value of the right type for
+    every key."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(urlsafe_b64decode(padded.encode()).decode())
+        if not isinstance(payload['k'], list):
+            raise TypeError('cursor keys are not a list')
+        values = [_decode_value(v) for v in payload['k']]
+        backwards = bool(payload['b'])
+    except (binascii.Error, InvalidOperation, ValueError, KeyError,
+            TypeError):
+        abort(400)
+    if len(values) != len(keys) or \
+            not all(key.accepts(value) for key, value in zip(keys, values)):
+        abort(400)
+    return values, backwards
+
+
+class KeysetPagination:
+    """Page of a query positioned by the sort key of its edge rows
+    instead of an OFFSET, so every page costs the same to fetch.
+
+    Exposes the same has_prev/has_next/items interface as Flask-SQLAlchemy
+    Pagination; links carry opaque cursors in cursor_arg. total is None
+    when counting is disabled and is capped at count_limit otherwise,
+    with total_is_estimate set when the cap was hit.
+    """
+
+    keyset = True
+
+    def __init__(self, query, keys, per_page, cursor=None,
+                 cursor_arg='cursor', count_limit=None):
+        self.per_page = per_page
+        self.cursor_arg = cursor_arg
+        self.total = None
+        self.total_is_estimate = False
+        if count_limit is None:
+            count_limit = current_app.config['PAGINATION_COUNT_LIMIT']
+        if count_limit:
+            total = query.order_by(None).limit(count_limit + 1).count()
+            self.total = min(total, count_limit)
+            self.total_is_estimate = total > count_limit
+
+        backwards = False
+        seek = query
+        if cursor:
+            values, backwards = decode_cursor(cursor, keys)
+            seek = seek.filter(or_(*[
+                and_(*([key.expression == value
+                        for key, value in zip(keys[:i], values[:i])] +
+                       [keys[i].after(values[i], backwards)]))
+                for i in range(len(keys))]))
+        rows = (seek.add_columns(*[key.expression for key in keys])
+                .order_by(None)
+                .order_by(*[key.order_by(backwards) for key in keys])
+                .limit(per_page + 1)
+                .all())
+        more = len(rows) > per_page
+        rows = rows[:per_page]
+        if backwards:
+            rows.reverse()
+        # rows are the query's own entities followed by the sort keys
+        width = len(query.column_descriptions)
+        self.items = [row[0] if width == 1 else row[:width] for row in rows]
+        edge_keys = [tuple(row[width:]) for row in rows]
+
+        self.has_next = more if not backwards else bool(cursor)
+        self.has_prev = more if backwards else bool(cursor)
+        self.next_cursor = encode_cursor(edge_keys[-1]) \
+            if self.has_next and edge_keys else None
+        self.prev_cursor = encode_cursor(edge_keys[0], backwards=True) \
+            if self.has_prev and edge_keys else None
+
+    def url_args(self, cursor):
+        """Current request args with this pagination's cursor replaced."""
+        args = request.args.to_dict()
+        args.pop('page', None)
+        args[self.cursor_arg] = cursor
+        return args
+
+
+def keyset_enabled():
+    return current_app.config['PAGINATION_MODE'] == 'keyset'
@@ -1,12 +1,23 @@
 import xlrd
 
+from collections import Counter, defaultdict
 from datetime import datetime
 from random import choice, randint
+from time import monotonic
 
 from nameparser import HumanName
 
-from models import (Book, Author, Copy, Magazine)
+from models import (Book, Author, Copy, LibraryItem, Magazine)
+from models.books import book_author
+from models.catalog import chunks
 from init_db import db
+from search_engine import catalog_generation, catalog_indexer
+from search_engine.analysis import title_key
+from search_engine.documents import analyze_fields, refresh_search_keys
+from utils.catalog_import import add_copy_counts, insert, reserve_ids
+
+# spreadsheet rows written per executemany
+CHUNK_SIZE = 1000
 
 
 def load_file(file_location):
@@ -32,46 +43,6 @@ def get_full_name(author):
     return first_name, last_name
 
 
-# checking if element exist, creates new if not
-def create_library_item(session, model, **kwargs):
-    library_item = session.query(model).filter_by(**kwargs).first()
-    if library_item:
-        return library_item
-    else:
-        language = choice(['polish', 'other', 'english'])
-        if model.__name__ == "Book":
-            rand_date = datetime.\
-                strptime(str(randint(1978, int(datetime.today().year))),
-                         '%Y')
-            instance = model(language=language, pub_date=rand_date, **kwargs)
-        elif model.__name__ == "Magazine":
-            instance = model(language=language, **kwargs)
-        else:
-            instance = model(**kwargs)
-        session.add(instance)
-        session.commit()
-        return instance
-
-
-def create_copy(book, asset):
-    if not asset:
-        create_library_item(db.session, Copy,
-                            library_item_id=book.id,
-                            library_item=book)
-
-    elif "płyta" in asset:
-        create_library_item(db.session, Copy,
-                            library_item_id=book.id,
-                            library_item=book,
-                            has_cd_disk=True)
-
-    else:
-        create_library_item(db.session, Copy,
-                            library_item_id=book.id,
-                            library_item=book,
-                            asset_code=asset)
-
-
 # reading author's data from file
 def get_authors_data(authors):
     if (',' in authors and 'Jr.' not in authors) \
@@ -90,128 +61,303 @@ def get_authors_data(authors):
     return authors_names
 
 
-# reads book's data from file
-def get_book_data(file_location):
-    book_list = []
+# reads book's data from file, one row at a time
+def read_books(file_location):
     workbook = load_file(file_location)
 
     # excluding sheets with unnecessary data
     for sheet_index in range(workbook.nsheets - 2):
         current_sheet = workbook.sheet_by_index(sheet_index)
-        rows = current_sheet.nrows
+        current_shelf = current_sheet.name
 
         # excluding data from the title of the column
-        for row_index in range(1, rows):
-            current_shelf = current_sheet.name
+        for row_index in range(1, current_sheet.nrows):
             title = (current_sheet.cell_value(row_index, 1)).strip()
             authors = current_sheet.cell_value(row_index, 2)
-            author = get_authors_data(authors)
-
-            if current_shelf == 'General':
-                author = get_authors_data(authors)
-                asset = str(current_sheet.cell_value(row_index, 3))
-                book_properties = {
-                    'authors': author,
-                    'title': title,
-                    'asset': asset
-                }
-                book_list.append(book_properties)
-
-            else:
-                asset = str(current_sheet.cell_value(row_index, 3))
-                book_properties = {
-                    'authors': author,
-                    'current_shelf': current_shelf,
-                    'title': title,
-                    'asset': asset
-                }
-                book_list.append(book_properties)
-
-    return book_list
-
-
-# reading magazine's data from file
-def get_magazine_data(file_location):
+            asset = str(current_sheet.cell_value(row_index, 3))
+            book_properties = {
+                'authors': get_authors_data(authors),
+                'title': title,
+                'asset': asset
+            }
+            if current_shelf != 'General':
+                book_properties['current_shelf'] = current_shelf
+            yield book_properties
+
+
+# reading magazine's data from file, one row at a time
+def read_magazines(file_location):
     workbook = load_file(file_location)
-    magazines_list = []
     current_sheet = workbook.sheet_by_index(2)
-    rows = current_sheet.nrows
 
     # reading rows except the title of the column
-    for row_index in range(1, rows):
+    for row_index in range(1, current_sheet.nrows):
         title = (current_sheet.cell_value(row_index, 1)).strip()
         year = current_sheet.cell_value(row_index, 2)
         issue = current_sheet.cell_value(row_index, 3)
-        magazine_properties = {'title': title, 'year': year, 'issue': issue}
-        magazines_list.append(magazine_properties)
-    return magazines_list
+        yield {'title': title, 'year': year, 'issue': issue}
+
+
+def author_pairs(authors):
+    """Return the (first_name, last_name) pairs get_authors_data read."""
+    if isinstance(authors, tuple):
+        authors = [authors]
+    return [(str(first_name), str(last_name))
+            for first_name, last_name in authors]
+
+
+class CatalogLoader:
+    """Writes spreadsheet rows to the catalog in one transaction.
+
+    Authors by name, books by title, magazines by title, issue and year
+    and copies by asset code are loaded once, and rows are checked
+    against them in memory. New rows are inserted with executemany, one
+    statement per table for every chunk_size spreadsheet rows.
+
+    As before, a row adds a copy unless its asset code is taken, a row
+    without an asset code adds one only to an item without copies and a
+    "płyta" (CD) row adds one only to an item without a CD copy.
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.counts = Counter(dict.fromkeys(
+            ('rows', 'authors', 'books', 'magazines', 'copies'), 0))
+        self.started = monotonic()
+        self.authors = {
+            (first_name, last_name): {'id': author_id}
+            for author_id, first_name, last_name in db.session.query(
+                Author.id, Author.first_name, Author.last_name)
+            .order_by(Author.id.desc())}
+        with_copies = set()
+        with_cd = set()
+        for item_id, has_cd_disk in db.session.query(
+                Copy.library_item_id, Copy.has_cd_disk).distinct():
+            with_copies.add(item_id)
+            if has_cd_disk:
+                with_cd.add(item_id)
+
+        author_names = defaultdict(set)
+        for book_id, first_name, last_name in db.session.query(
+                book_author.c.book_id, Author.first_name, Author.last_name
+        ).join(Author, Author.id == book_author.c.author_id):
+            author_names[book_id].add((first_name, last_name))
+
+        def loaded(item_id, **columns):
+            return dict(columns, id=item_id, copies=item_id in with_copies,
+                        cd=item_id in with_cd)
+
+        self.books = {
+            title: loaded(book_id, author_names=author_names[book_id])
+            for book_id, title in db.session.query(Book.id, Book.title)
+            .order_by(Book.id.desc())}
+        self.magazines = {
+            (title, issue, year): loaded(magazine_id)
+            for magazine_id, title, issue, year in db.session.query(
+                Magazine.id, Magazine.title, Magazine.issue, Magazine.year)
+            .order_by(Magazine.id.desc())}
+        # a row without a year matches the issue of any year
+        self.magazine_issues = {}
+        for (title, issue, _), magazine in self.magazines.items():
+            self.magazine_issues[title, issue] = magazine
+        self.asset_codes = {
+            code for code, in db.session.query(Copy.asset_code)
+            if code is not None}
+        # books whose authors changed after they were written
+        self.stale = set()
+        self.new_authors = []
+        self.new_items = []
+        self.new_links = []
+        self.new_copies = []
+        self.pending_rows = 0
+
+    def add_book(self, title, authors, asset, shelf=None):
+        book = self.books.get(title)
+        if book is None:
+            rand_date = datetime.\
+                strptime(str(randint(1978, int(datetime.today().year))),
+                         '%Y')
+            book = self.books[title] = self.new_item(
+                type='book', title=title, pub_date=rand_date.date(),
+                authors=[], author_names=set())
+        for name in author_pairs(authors):
+            if name in book['author_names']:
+                continue
+            author = self.authors.get(name)
+            if author is None:
+                author = self.authors[name] = {
+                    'id': None, 'first_name': name[0], 'last_name': name[1]}
+                self.new_authors.append(author)
+            book['author_names'].add(name)
+            if book['id'] is None:
+                book['authors'].append(author)
+            else:
+                self.stale.add(book['id'])
+            self.new_links.append((book, author))
+        self.add_copy(book, asset, shelf)
+        self.row_done()
+
+    def add_magazine(self, title, issue, year):
+        key = (title, issue, year)
+        if year is None:
+            magazine = self.magazine_issues.get((title, issue))
+        else:
+            magazine = self.magazines.get(key)
+        if magazine is None:
+            magazine = self.magazines[key] = self.new_item(
+                type='magazine', title=title, issue=issue, year=year)
+            self.magazine_issues.setdefault((title, issue), magazine)
+        self.add_copy(magazine, '', None)
+        self.row_done()
+
+    def new_item(self, **columns):
+        item = {'id': None, 'copies': False, 'cd': False,
+                'language': choice(['polish', 'other', 'english'])}
+        item.update(columns)
+        self.new_items.append(item)
+        return item
+
+    def add_copy(self, item, asset, shelf):
+        copy = {'shelf': shelf, 'has_cd_disk': False, 'asset_code': None}
+        if not asset:
+            if item['copies']:
+                return
+        elif "płyta" in asset:
+            if item['cd']:
+                return
+            item['cd'] = copy['has_cd_disk'] = True
+        elif asset in self.asset_codes:
+            return
+        else:
+            self.asset_codes.add(asset)
+            copy['asset_code'] = asset
+        item['copies'] = True
+        self.new_copies.append((item, copy))
+
+    def row_done(self):
+        self.counts['rows'] += 1
+        self.pending_rows += 1
+        if self.pending_rows >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Insert the rows collected since the last flush."""
+        for author, author_id in zip(self.new_authors, reserve_ids(
+                Author.__table__, len(self.new_authors))):
+            author['id'] = author_id
+        for item, item_id in zip(self.new_items, reserve_ids(
+                LibraryItem.__table__, len(self.new_items))):
+            item['id'] = item_id
+        insert(Author.__table__, [
+            {'id': author['id'], 'first_name': author['first_name'],
+             'last_name': author['last_name']}
+            for author in self.new_authors], self.chunk_size)
+        insert(LibraryItem.__table__, [
+            self.item_columns(item) for item in self.new_items],
+            self.chunk_size)
+        insert(Book.__table__, [
+            {'id': item['id'], 'pub_date': item['pub_date']}
+            for item in self.new_items if item['type'] == 'book'],
+            self.chunk_size)
+        insert(Magazine.__table__, [
+            {'id': item['id'], 'issue': item['issue'], 'year': item['year']}
+            for item in self.new_items if item['type'] == 'magazine'],
+            self.chunk_size)
+        insert(book_author, [{'book_id': book['id'], 'author_id': author['id']}
+                             for book, author in self.new_links],
+               self.chunk_size)
+        insert(Copy.__table__, [dict(copy, library_item_id=item['id'])
+                                for item, copy in self.new_copies],
+               self.chunk_size)
+        add_copy_counts(Counter(item['id'] for item, _ in self.new_copies))
+        self.counts.update(
+            authors=len(self.new_authors),
+            books=sum(item['type'] == 'book' for item in self.new_items),
+            magazines=sum(item['type'] == 'magazine'
+                          for item in self.new_items),
+            copies=len(self.new_copies))
+        for item in self.new_items:
+            # later authors of the book make it stale instead
+            item.pop('authors', None)
+        self.new_authors, self.new_items = [], []
+        self.new_links, self.new_copies = [], []
+        self.pending_rows = 0
+
+    @staticmethod
+    def item_columns(item):
+        """Return the library_item row of a new item, with the keys the
+        session events would fill in."""
+        fields = [item['title']]
+        if item['type'] == 'book':
+            fields.extend('{first_name} {last_name}'.format(**author)
+                          for author in item['authors'])
+        else:
+            fields.append(item['issue'])
+        return {
+            'id': item['id'],
+            'type': item['type'],
+            'title': item['title'],
+            'language': item['language'],
+            'search_title': analyze_fields([item['title']], item['language']),
+            'search_document': analyze_fields(fields, item['language']),
+            'title_key': title_key(item['title']),
+        }
+
+    def finish(self):
+        """Write what is left and return the counts, with the rows read
+        per second."""
+        self.flush()
+        stale = sorted(self.stale)
+        for chunk in chunks(stale):
+            for book in Book.query.filter(Book.id.in_(chunk)):
+                refresh_search_keys(book)
+        seconds = monotonic() - self.started
+        stats = dict(self.counts, seconds=round(seconds, 3))
+        stats['rows_per_second'] = round(
+            self.counts['rows'] / seconds if seconds else 0, 1)
+        return stats
+
+
+def load_books(loader, file_location):
+    for book in read_books(file_location):
+        loader.add_book(book['title'], book['authors'], book['asset'],
+                        book.get('current_shelf'))
+
+
+def load_magazines(loader, file_location):
+    for magazine in read_magazines(file_location):
+        year = None
+        if magazine['year']:
+            year = datetime.strptime(str(int(magazine['year'])), '%Y').date()
+        loader.add_magazine(magazine['title'], str(magazine['issue']), year)
+
+
+def load_workbook(file_location, chunk_size=CHUNK_SIZE):
+    """Load the magazines and books of a library spreadsheet in one
+    transaction; return the counts of rows read and written."""
+    loader = CatalogLoader(chunk_size)
+    load_magazines(loader, file_location)
+    load_books(loader, file_location)
+    return commit(loader)
 
 
 # writing authors, books and copies data in database
 def get_books(file_location):
-    books_properties = get_book_data(file_location)
-    asset_codes = []
-
-    for book in books_properties:
-        title = book['title']
-        asset = book['asset']
-        asset_codes.append(asset)
-        authors = book['authors']
-        list_of_authors = []
-
-        if isinstance(authors, tuple):
-            authors_id = []
-            first_name = str(authors[0])
-            last_name = str(authors[1])
-            author = create_library_item(db.session, Author,
-                                         last_name=last_name,
-                                         first_name=first_name)
-            id_of_auth = author.id
-            authors_id.append(id_of_auth)
-            list_of_authors.append(author)
-            book = create_library_item(db.session, Book, title=title)
-            book.authors.append(author)
-            create_copy(book, asset)
-
-        elif isinstance(authors, list):
-            authors_id = []
-            for auth_name in authors:
-                f_name = str(auth_name[0])
-                l_name = str(auth_name[1])
-                author = create_library_item(db.session, Author,
-                                             last_name=l_name,
-                                             first_name=f_name)
-                id_of_auth = author.id
-                authors_id.append(id_of_auth)
-                list_of_authors.append(author)
-                book = create_library_item(db.session, Book,
-                                           title=title)
-                book.authors.append(author)
-                create_copy(book, asset)
+    loader = CatalogLoader()
+    load_books(loader, file_location)
+    return commit(loader)
 
 
 # writing magazine's data in database
 def get_magazines(file_location):
-    magazines_properties = get_magazine_data(file_location)
-    for i in magazines_properties:
-        title = i['title']
-        issue = str(i['issue'])
-        year = i['year']
-        if not year:
-            magazine = create_library_item(db.session, Magazine,
-                                           title=title,
-                                           issue=issue)
-
-            create_library_item(db.session, Copy,
-                                library_item_id=magazine.id,
-                                library_item=magazine)
-        else:
-            year = datetime.strptime(str(int(i['year'])), '%Y')
-            magazine = create_library_item(db.session, Magazine,
-                                           title=title,
-                                           year=year,
-                                           issue=issue)
-
-            create_library_item(db.session, Copy,
-                                library_item_id=magazine.id,
-                                library_item=magazine)
+    loader = CatalogLoader()
+    load_magazines(loader, file_location)
+    return commit(loader)
+
+
+def commit(loader):
+    stats = loader.finish()
+    db.session.commit()
+    catalog_generation.bump()
+    catalog_indexer.invalidate()
+    return stats
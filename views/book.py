@@ -1,13 +1,19 @@
 from datetime import datetime
 
 from flask import Blueprint
-from flask import render_template, request, session, abort
+from flask import render_template, request, session
+from sqlalchemy import or_
 
 from forms.book import BookForm, MagazineForm,\
     AddNewItemBookForm, AddNewItemMagazineForm
 from init_db import db
-from models import User, Tag, Magazine, Book, Author, LibraryItem
+from models import Magazine, Book, LibraryItem
+from models.catalog import resolve_authors, resolve_tags, set_authors, \
+    set_tags
 from models.decorators_roles import require_role
+from search_engine import catalog_generation
+from search_engine.analysis import isbn_key, title_key
+from search_engine.documents import refresh_search_keys
 
 library_books = Blueprint('library_books', __name__,
                           template_folder='templates')
@@ -43,49 +49,28 @@ def add_book():
                             book_form.surname_2.data],
                            ]
 
-            new_authors = []
-
-            for first_name, surname in tmp_authors:
-                if first_name != '' and surname != '':
-                    author = Author.query.filter_by(first_name=first_name,
-                                                    last_name=surname
-                                                    ).first()
-                    if not author:
-                        new_author = Author(
-                            first_name=first_name,
-                            last_name=surname
-                        )
-                        new_authors.append(new_author)
-                        db.session.add(new_author)
-                        db.session.commit()
-                    else:
-                        new_authors.append(author)
-
-            tmp_tag = Tag.query.filter_by(name=book_form.tag.data).first()
-            if not tmp_tag:
-                new_tag = Tag(
-                    name=book_form.tag.data
-                )
-                db.session.add(new_tag)
-                db.session.commit()
-            else:
-                new_tag = tmp_tag
+            authors = resolve_authors(tmp_authors)
+            tags = resolve_tags([book_form.tag.data])
 
             new_book = Book(
                 title=book_form.title.data,
                 table_of_contents=book_form.table_of_contents.data,
                 language=book_form.language.data,
                 category=book_form.category.data,
-                tags=[new_tag],
+                tags=list(tags.values()),
                 description=book_form.description.data,
                 isbn=book_form.isbn.data,
-                authors=new_authors,
+                authors=list(authors.values()),
                 original_title=book_form.original_title.data,
                 publisher=book_form.publisher.data,
                 pub_date=datetime(year=int(book_form.pub_date.data),
                                   month=1,
                                   day=1))
-            if book_exists(new_book):
+            with db.session.no_autoflush:
+                duplicate = book_exists(new_book)
+            if duplicate:
+                # drops the authors and tag inserted above
+                db.session.rollback()
                 message_body = 'This book already exists.'
                 message_title = 'Oops!'
                 return render_template('message.html',
@@ -93,6 +78,7 @@ def add_book():
                                        message_body=message_body)
             db.session.add(new_book)
             db.session.commit()
+            catalog_generation.bump()
 
             message_body = 'The book has been added.'
             message_title = 'Success!'
@@ -101,22 +87,14 @@ def add_book():
                                    message_body=message_body)
 
         if magazine_form.submit2.data and magazine_form.validate():
-            tmp_tag = Tag.query.filter_by(name=magazine_form.tag.data).first()
-            if not tmp_tag:
-                new_tag = Tag(
-                    name=magazine_form.tag.data
-                )
-                db.session.add(new_tag)
-                db.session.commit()
-            else:
-                new_tag = tmp_tag
+            tags = resolve_tags([magazine_form.tag.data])
 
             new_magazine = Magazine(
                 title=magazine_form.title_of_magazine.data,
                 table_of_contents=magazine_form.table_of_contents.data,
                 language=magazine_form.language.data,
                 category=magazine_form.category.data,
-                tags=[new_tag],
+                tags=list(tags.values()),
                 description=magazine_form.description.data,
                 year=datetime(year=int(magazine_form.pub_date.data),
                               month=1,
@@ -125,6 +103,7 @@ def add_book():
 
             db.session.add(new_magazine)
             db.session.commit()
+            catalog_generation.bump()
 
             message_body = 'The magazine has been added.'
             message_title = 'Success!'
@@ -154,14 +133,6 @@ def add_book():
 @require_role('ADMIN')
 def edit_book(item_id):
     if request.method == 'GET':
-        try:
-            user = User.query.get(session['id'])
-            user.has_role('ADMIN')
-        except KeyError:
-            abort(401)
-        except Exception:
-            abort(500)
-
         item = LibraryItem.query.get_or_404(item_id)
 
         if item.type == 'book':
@@ -199,6 +170,7 @@ def edit_book(item_id):
 
             if not form.errors:
                 update_book(form, item)
+                catalog_generation.bump()
                 message_body = 'The book has been updated.'
                 message_title = 'Success!'
                 return render_template('message.html',
@@ -219,6 +191,7 @@ def edit_book(item_id):
 
             if not form.errors:
                 update_magazine(form, item)
+                catalog_generation.bump()
 
                 message_body = 'The magazine has been updated.'
                 message_title = 'Success!'
@@ -375,80 +348,14 @@ def update_book(form, item):
     item.pub_date = datetime(year=int(form.pub_date.data),
                              month=1,
                              day=1)
-    try:
-        tag = Tag.query.filter_by(name=item.tags_string).first()
-        tag.name = form.tag.data
-    except AttributeError:
-        new_tag = Tag(name=form.tag.data)
-        item.tags.append(new_tag)
-        db.session.add(new_tag)
-        db.session.commit()
-
-    try:
-        author = Author.query.filter_by(first_name=item.authors[0].first_name,
-                                        last_name=item.authors[0].last_name
-                                        ).first()
-        author.first_name = form.first_name.data
-        author.last_name = form.surname.data
-    except IndexError:
-        if form.first_name.data and form.surname.data:
-            author = Author.query.filter_by(first_name=form.first_name.data,
-                                            last_name=form.surname.data
-                                            ).first()
-            if not author:
-                new_author = Author(
-                    first_name=form.first_name.data,
-                    last_name=form.surname.data
-                )
-                item.authors.append(new_author)
-                db.session.add(new_author)
-                db.session.commit()
-
-    try:
-        author_1 = Author.query.filter_by(
-            first_name=item.authors[1].first_name,
-            last_name=item.authors[1].last_name
-        ).first()
-        author_1.first_name = form.first_name_1.data
-        author_1.last_name = form.surname_1.data
-    except IndexError:
-        if form.first_name_1.data and form.surname_1.data:
-            author = Author.query.filter_by(first_name=form.first_name_1.data,
-                                            last_name=form.surname_1.data
-                                            ).first()
-
-            if not author:
-                new_author = Author(
-                    first_name=form.first_name_1.data,
-                    last_name=form.surname_1.data
-                )
-                item.authors.append(new_author)
-                db.session.add(new_author)
-                db.session.commit()
-
-    try:
-        author_2 = Author.query.filter_by(
-            first_name=item.authors[2].first_name,
-            last_name=item.authors[2].last_name
-        ).first()
-
-        author_2.first_name = form.first_name_2.data
-        author_2.last_name = form.surname_2.data
-    except IndexError:
-        if form.first_name_2.data and form.surname_2.data:
-            author = Author.query.filter_by(first_name=form.first_name_2.data,
-                                            last_name=form.surname_2.data
-                                            ).first()
-            if not author:
-                new_author = Author(
-                    first_name=form.first_name_2.data,
-                    last_name=form.surname_2.data
-                )
-                item.authors.append(new_author)
-                db.session.add(new_author)
-                db.session.commit()
-
-        db.session.commit()
+    set_tags(item, tag_names(form.tag.data))
+    set_authors(item, [[form.first_name.data, form.surname.data],
+                       [form.first_name_1.data, form.surname_1.data],
+                       [form.first_name_2.data, form.surname_2.data]])
+    # authors and tags are written around the ORM, so the flush would
+    # not see they changed
+    refresh_search_keys(item)
+    db.session.commit()
 
 
 def check_diff_magazine(form, item):
@@ -483,26 +390,23 @@ def update_magazine(form, item):
     item.year = datetime(year=int(form.pub_date.data),
                          month=1,
                          day=1)
-    tag = Tag.query.filter_by(name=item.tags_string).first()
-    tag.name = form.tag.data
+    set_tags(item, tag_names(form.tag.data))
+    refresh_search_keys(item)
     db.session.commit()
 
 
+def tag_names(tags_string):
+    """Return the names in the tag field, which shows tags_string."""
+    return [name.strip() for name in tags_string.split(',')
+            if name.strip() not in ('', '-')]
+
+
 def book_exists(new_book):
-    results = Book.query.filter(
-        Book.title.like(new_book.title[:2])).all()
-    for i in results:
-        if i.isbn == new_book.isbn:
-            return False
-        i = str(i.title)
-        i = i.replace(" ", "").replace("_", "") \
-            .replace("-", "").replace(",", ""). \
-            replace(".", "").lower()
-        tmp = str(new_book.title)
-        tmp = tmp.replace(" ", "").replace("_", "") \
-            .replace("-", "").replace(",", ""). \
-            replace(".", "").lower()
-        if i == tmp:
-            return False
-        else:
-            return True
+    """Tell whether a book with the title or ISBN of new_book is in the
+    catalog, comparing the normalized keys of both."""
+    same_title = db.session.query(LibraryItem.id).filter(
+        LibraryItem.type == 'book',
+        LibraryItem.title_key == title_key(new_book.title)).exists()
+    same_isbn = db.session.query(Book.id).filter(
+        Book.isbn_key == isbn_key(new_book.isbn)).exists()
+    return db.session.query(or_(same_title, same_isbn)).scalar()
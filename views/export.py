@@ -0,0 +1,143 @@
+import csv
+from datetime import date
+from enum import Enum
+import io
+import json
+
+from flask import abort, Blueprint, Response, stream_with_context
+from sqlalchemy.orm import selectinload, with_polymorphic
+
+from init_db import db
+from models import Book, Copy, LibraryItem, Magazine, RentalLog
+from models.decorators_roles import require_role
+
+library_export = Blueprint('library_export', __name__,
+                           template_folder='templates')
+
+BATCH_SIZE = 1000
+
+ITEM_FIELDS = ['id', 'type', 'title', 'original_title', 'isbn', 'publisher',
+               'pub_date', 'issue', 'year', 'language', 'category',
+               'table_of_contents', 'description', 'authors', 'tags',
+               'copies']
+COPY_FIELDS = ['id', 'asset_code', 'library_item_id', 'shelf',
+               'has_cd_disk', 'available_status']
+RENTAL_LOG_FIELDS = ['id', 'copy_id', 'user_id', 'book_status',
+                     '_borrow_time', '_return_time', '_reservation_begin',
+                     '_reservation_end']
+
+
+def export_value(value):
+    if isinstance(value, Enum):
+        return value.name
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def item_row(item):
+    copies = [{'asset_code': copy.asset_code,
+               'shelf': copy.shelf,
+               'available_status': export_value(copy.available_status)}
+              for copy in item.copies]
+    return {
+        'id': item.id,
+        'type': item.type,
+        'title': item.title,
+        'original_title': getattr(item, 'original_title', None),
+        'isbn': getattr(item, 'isbn', None),
+        'publisher': getattr(item, 'publisher', None),
+        'pub_date': export_value(getattr(item, 'pub_date', None)),
+        'issue': getattr(item, 'issue', None),
+        'year': export_value(getattr(item, 'year', None)),
+        'language': item.language,
+        'category': item.category,
+        'table_of_contents': item.table_of_contents,
+        'description': item.description,
+        'authors': [author.full_name
+                    for author in getattr(item, 'authors', [])],
+        'tags': [tag.name for tag in item.tags],
+        'copies': copies,
+    }
+
+
+def iter_items():
+    """Yield export rows of library items with their authors, tags and
+    copies, loaded one keyset batch at a time.
+
+    Collections cannot be eager loaded with yield_per, so items are read
+    in id ranges with one select-in query per collection and batch.
+    """
+    item = with_polymorphic(LibraryItem, [Book, Magazine])
+    query = db.session.query(item).options(
+        selectinload(item.tags),
+        selectinload(item.Book.authors),
+        selectinload(item.copies)).order_by(item.id)
+    last_id = 0
+    while True:
+        batch = query.filter(item.id > last_id).limit(BATCH_SIZE).all()
+        if not batch:
+            return
+        for library_item in batch:
+            yield item_row(library_item)
+        last_id = batch[-1].id
+
+
+def iter_columns(model, fields):
+    """Yield export rows of a flat table through a server-side cursor."""
+    columns = [getattr(model, field) for field in fields]
+    query = db.session.query(*columns).order_by(model.id)
+    for row in query.yield_per(BATCH_SIZE):
+        yield {field: export_value(value)
+               for field, value in zip(fields, row)}
+
+
+EXPORTS = {
+    'items': (ITEM_FIELDS, iter_items),
+    'copies': (COPY_FIELDS, lambda: iter_columns(Copy, COPY_FIELDS)),
+    'rental_logs': (RENTAL_LOG_FIELDS,
+                    lambda: iter_columns(RentalLog, RENTAL_LOG_FIELDS)),
+}
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def csv_cell(value):
+    if isinstance(value, list):
+        return '; '.join(
+            '{}@{}'.format(v['asset_code'], v['shelf'] or '')
+            if isinstance(v, dict) else str(v) for v in value)
+    return value
+
+
+def csv_lines(fields, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    yield buffer.getvalue()
+    for row in rows:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow([csv_cell(row[field]) for field in fields])
+        yield buffer.getvalue()
+
+
+@library_export.route('/export/<resource>.<fmt>', methods=['GET'])
+@require_role('ADMIN')
+def export(resource, fmt):
+    if resource not in EXPORTS or fmt not in ('ndjson', 'csv'):
+        abort(404)
+    fields, rows = EXPORTS[resource]
+    if fmt == 'ndjson':
+        lines = ndjson_lines(rows())
+        mimetype = 'application/x-ndjson'
+    else:
+        lines = csv_lines(fields, rows())
+        mimetype = 'text/csv'
+    response = Response(stream_with_context(lines), mimetype=mimetype)
+    response.headers['Content-Disposition'] = \
+        'attachment; filename={}.{}'.format(resource, fmt)
+    return response
@@ -1,5 +1,7 @@
 from datetime import datetime, timedelta
 
+from flask_simpleldap import LDAPException
+from flask_sqlalchemy import Pagination
 from sqlalchemy import exc
 from sqlalchemy.exc import IntegrityError
 
@@ -8,7 +10,9 @@ import pytz
 from flask import (
     abort,
     Blueprint,
+    current_app,
     flash,
+    jsonify,
     redirect,
     render_template,
     request,
@@ -33,14 +37,31 @@ from ldap_utils.ldap_utils import ldap_client, refine_data
 from messages import ErrorMessage, SuccessMessage
 from models import LibraryItem
 from models.library import RentalLog, Copy, BookStatus
-from models.users import User
+from models.users import User, upsert_user
 from models.wishlist import WishListItem, Like
 from models.decorators_roles import (
+    current_user,
+    current_user_has_role,
+    login_session,
     require_role,
     require_logged_in,
     require_not_logged_in
 )
+from search_engine import (
+    cache_stats,
+    catalog_generation,
+    facet_options,
+    fuzzy_search_catalog,
+    fuzzy_search_wishlist,
+    get_search_backend,
+    parse_filters,
+    search_catalog,
+    suggest,
+    toggle_filter
+)
 from send_email.emails import send_email
+from utils.circuit_breaker import CircuitOpenError
+from utils.pagination import KeysetPagination, SortKey, keyset_enabled
 
 library = Blueprint('library', __name__,
                     template_folder='templates')
@@ -67,8 +88,13 @@ def login():
         if form.validate_on_submit():
             user = form.username.data
             passwd = form.password.data
-            test_conn = ldap_client.bind_user(user, passwd)
             message_title = 'Error!'
+            try:
+                test_conn = ldap_client.bind_user(user, passwd)
+            except (CircuitOpenError, LDAPException):
+                return ErrorMessage.message(
+                    'Login is temporarily unavailable, '
+                    'please try again in a minute')
             if not test_conn or passwd == '':
                 message_body = 'Invalid username and/or password'
                 return render_template(
@@ -77,55 +103,39 @@ def login():
                     message_body=message_body
                 )
             else:
+                # profiles are kept in line with the directory by the
+                # sync_users cron task; bind_user has just cached the
+                # entry, so reading its employee id costs no round trip
                 user_ldap = ldap_client.get_object_details(user=user)
-                if refine_data(user_ldap, 'l') != 'Wroclaw':
-                    message_body = 'Only employees from Wroclaw are accepted'
+                employee_id = refine_data(user_ldap, 'employeeID')
+                user_db = db.session.query(
+                    User.id, User.email, User.role_mask, User.active
+                ).filter_by(employee_id=employee_id).first()
+                if user_db is None:
+                    # not synced yet: a first login adds the account
+                    if refine_data(user_ldap, 'l') != 'Wroclaw':
+                        message_body = \
+                            'Only employees from Wroclaw are accepted'
+                        return render_template(
+                            'message.html',
+                            message_title=message_title,
+                            message_body=message_body
+                        )
+                    user_db = upsert_user(
+                        email=refine_data(user_ldap, 'mail'),
+                        first_name=refine_data(user_ldap, 'givenName'),
+                        surname=refine_data(user_ldap, 'sn'),
+                        employee_id=employee_id
+                    )
+                    db.session.commit()
+                elif not user_db.active:
+                    message_body = 'Your account is no longer active'
                     return render_template(
                         'message.html',
                         message_title=message_title,
                         message_body=message_body
                     )
-                user_ldap_data = {
-                    'mail': refine_data(user_ldap, 'mail'),
-                    'givenName': refine_data(user_ldap, 'givenName'),
-                    'sn': refine_data(user_ldap, 'sn'),
-                    'employeeID': refine_data(user_ldap, 'employeeID')
-                }
-                user_db = User.query.filter_by(
-                    employee_id=user_ldap_data['employeeID']
-                ).first()
-                if not user_db:
-                    new_user = User(
-                        email=user_ldap_data['mail'],
-                        first_name=user_ldap_data['givenName'],
-                        surname=user_ldap_data['sn'],
-                        employee_id=user_ldap_data['employeeID'],
-                        active=True
-                    )
-                    db.session.add(new_user)
-                    db.session.commit()
-                else:
-                    user_db_data = {
-                        'mail': user_db.email,
-                        'givenName': user_db.first_name,
-                        'sn': user_db.surname,
-                        'employeeID': user_db.employee_id
-                    }
-                    if user_db_data != user_ldap_data:
-                        user_db.email = user_ldap_data['mail']
-                        user_db.first_name = user_ldap_data['givenName']
-                        user_db.surname = user_ldap_data['sn']
-                        user_db.employee_id = user_ldap_data['employeeID']
-                        db.session.commit()
-
-                user_db = User.query.filter_by(
-                    employee_id=user_ldap_data['employeeID']
-                ).first()
-                session['logged_in'] = True
-                session['id'] = user_db.id
-                session['email'] = user_db.email
-                if user_db.has_role('ADMIN'):
-                    session['admin'] = True
+                login_session(user_db)
                 return render_template('index.html', session=session)
     elif request.method != 'GET':
         abort(405)
@@ -139,52 +149,70 @@ def login():
 @require_logged_in()
 def search():
     try:
-        user = User.query.get(session['id'])
-        admin = user.has_role('ADMIN')
+        admin = current_user_has_role('ADMIN')
     except KeyError:
         abort(401)
     except Exception:
         abort(500)
     if request.method == 'GET':
-        if not request.args or not request.args.get('query'):
-            form = SearchForm()
-            page = request.args.get('page', 1, type=int)
-            try:
-                paginate_query = LibraryItem.query.order_by(
-                    LibraryItem.title.asc()).paginate(page,
-                                                      error_out=True,
-                                                      max_per_page=10)
-                output = [d.serialize() for d in paginate_query.items]
-                return render_template('search.html',
-                                       all_query=output,
-                                       admin=admin,
-                                       pagination=paginate_query,
-                                       endpoint='library.search',
-                                       form=form)
-            except RuntimeError:
-                return ErrorMessage.message('Cannot connect to database!')
-        elif request.args.get('query'):
-            form = SearchForm()
-            query_str = request.args.get('query')
-            page = request.args.get('page', 1, type=int)
-            try:
-                paginate_query = (
-                    LibraryItem.query.filter(LibraryItem.title.ilike(
-                        '%{}%'.format(query_str)))).paginate(page,
-                                                             error_out=True,
-                                                             max_per_page=10)
-                output = [d.serialize() for d in paginate_query.items]
-            except RuntimeError:
-                return ErrorMessage.message('Cannot connect to database!')
-            return render_template('search.html',
-                                   all_query=output,
-                                   pagination=paginate_query,
-                                   endpoint='library.search',
-                                   admin=admin,
-                                   form=form,
-                                   query_str=query_str)
-        else:
-            abort(405)
+        form = SearchForm()
+        query_str = request.args.get('query')
+        page = request.args.get('page', 1, type=int)
+        filters = parse_filters(request.args)
+        similar = False
+        try:
+            pagination = search_catalog(query_str,
+                                        page,
+                                        per_page=10,
+                                        filters=filters)
+            facets = get_search_backend().facets(query_str, filters)
+            if query_str and not filters and not pagination.items \
+                    and not pagination.has_prev:
+                items = fuzzy_search_catalog(query_str)
+                pagination = Pagination(None, 1, 10, len(items), items)
+                similar = bool(items)
+        except RuntimeError:
+            return ErrorMessage.message('Cannot connect to database!')
+        return render_template('search.html',
+                               all_query=pagination.items,
+                               pagination=pagination,
+                               endpoint='library.search',
+                               admin=admin,
+                               form=form,
+                               query_str=query_str,
+                               filters=filters,
+                               facets=facet_options(facets, filters),
+                               available_args=toggle_filter(
+                                   filters, 'available', '1'),
+                               similar=similar)
+    else:
+        abort(405)
+
+
+@library.route('/api/suggest', methods=['GET'])
+@require_logged_in()
+def api_suggest():
+    query_str = request.args.get('q', '')
+    try:
+        suggestions = suggest(query_str)
+    except exc.SQLAlchemyError:
+        abort(503)
+    return jsonify(suggestions=suggestions)
+
+
+@library.route('/api/search_stats', methods=['GET'])
+@require_role('ADMIN')
+def api_search_stats():
+    return jsonify(cache_stats())
+
+
+@library.route('/api/service_stats', methods=['GET'])
+@require_role('ADMIN')
+def api_service_stats():
+    """Circuit breaker state of the directory and mail server."""
+    return jsonify({
+        name: breaker.stats() for name, breaker
+        in current_app.extensions['circuit_breakers'].items()})
 
 
 @library.route('/contact', methods=['GET', 'POST'])
@@ -208,7 +236,7 @@ def contact():
                 None)
             return SuccessMessage \
                 .message('Your email has been sent to administrator!')
-        except TimeoutError:
+        except (CircuitOpenError, OSError):
             return ErrorMessage \
                 .message('Oops, '
                          'some problem occurred'
@@ -252,8 +280,7 @@ def reserve(copy_id):
 @require_role('ADMIN')
 def remove_item(item_id):
     try:
-        user = User.query.get(session['id'])
-        admin = user.has_role('ADMIN')
+        admin = current_user_has_role('ADMIN')
     except KeyError:
         abort(401)
     except Exception:
@@ -263,6 +290,7 @@ def remove_item(item_id):
     if form.validate_on_submit():
         db.session.delete(item)
         db.session.commit()
+        catalog_generation.bump()
         flash(item.type.capitalize() + ' has been removed.')
         return redirect(url_for('library.search'))
     authors_list = []
@@ -279,8 +307,7 @@ def remove_item(item_id):
                methods=['GET', 'POST'])
 @require_role('ADMIN')
 def remove_copy(item_id, copy_id):
-    user = User.query.get(session['id'])
-    admin = user.has_role('ADMIN')
+    admin = current_user_has_role('ADMIN')
     form = RemoveForm()
     item = LibraryItem.query.get_or_404(item_id)
     copy = Copy.query.filter_by(id=copy_id).first_or_404()
@@ -290,6 +317,7 @@ def remove_copy(item_id, copy_id):
     if form.validate_on_submit():
         db.session.delete(copy)
         db.session.commit()
+        catalog_generation.bump()
         flash('Copy has been removed.')
         return redirect(url_for('library.item_description',
                                 item_id=item_id))
@@ -304,8 +332,7 @@ def remove_copy(item_id, copy_id):
 @library.route('/wishlist', methods=['GET', 'POST'])
 @require_logged_in()
 def wishlist():
-    user = User.query.get(session['id'])
-    admin = user.has_role('ADMIN')
+    admin = current_user_has_role('ADMIN')
     if request.method == 'GET':
         if not request.args or not request.args.get('query'):
             form = SearchForm()
@@ -313,12 +340,7 @@ def wishlist():
             if db.session.query(WishListItem).first() is None:
                 return render_template('wishlist.html', admin=admin)
             try:
-                data = (
-                    WishListItem.query.order_by(
-                        WishListItem.likes_count.desc()).order_by(
-                        WishListItem.title.asc()).paginate(page,
-                                                           error_out=True,
-                                                           max_per_page=5))
+                data = paginate_wishes(WishListItem.query, page)
             except RuntimeError:
                 return ErrorMessage.message('Cannot connect to database!')
             output = [d.serialize() for d in data.items]
@@ -332,14 +354,19 @@ def wishlist():
             form = SearchForm()
             query_str = request.args.get('query')
             page = request.args.get('page', 1, type=int)
+            similar = False
             try:
-                data = (
+                data = paginate_wishes(
                     WishListItem.query.filter(WishListItem.title.ilike(
-                        '%{}%'.format(query_str))).order_by(
-                        WishListItem.likes_count.desc()).order_by(
-                        WishListItem.title.asc()).paginate(page,
-                                                           error_out=True,
-                                                           max_per_page=5))
+                        '%{}%'.format(query_str))), page)
+                if not data.items and not data.has_prev:
+                    wish_ids = fuzzy_search_wishlist(query_str)
+                    wishes = WishListItem.query.filter(
+                        WishListItem.id.in_(wish_ids)).all() \
+                        if wish_ids else []
+                    wishes.sort(key=lambda wish: wish_ids.index(wish.id))
+                    data = Pagination(None, 1, 5, len(wishes), wishes)
+                    similar = bool(wishes)
             except RuntimeError:
                 return ErrorMessage.message('Cannot connect to database!')
             output = [d.serialize() for d in data.items]
@@ -348,11 +375,28 @@ def wishlist():
                                    admin=admin,
                                    pagination=data,
                                    endpoint='library.wishlist',
-                                   form=form, )
+                                   form=form,
+                                   similar=similar)
     else:
         abort(405)
 
 
+def paginate_wishes(query, page):
+    if keyset_enabled():
+        return KeysetPagination(
+            query,
+            [SortKey(WishListItem.likes_count, descending=True),
+             SortKey(WishListItem.title),
+             SortKey(WishListItem.id)],
+            per_page=5,
+            cursor=request.args.get('cursor'))
+    return query.order_by(
+        WishListItem.likes_count.desc()).order_by(
+        WishListItem.title.asc()).paginate(page,
+                                           error_out=True,
+                                           max_per_page=5)
+
+
 @library.route('/add_wish', methods=['GET', 'POST'])
 @require_logged_in()
 def add_wish():
@@ -377,7 +421,7 @@ def add_wish():
 @require_logged_in()
 def add_like():
     wish_id = request.form['wish_id']
-    user = User.query.filter_by(id=session['id']).first()
+    user = current_user()
     if not Like.like_exists(wish_id, user):
         try:
             Like.like(wish_id, user)
@@ -407,8 +451,7 @@ def delete_wish(wish_id):
 @require_logged_in()
 def item_description(item_id):
     try:
-        user = User.query.get(session['id'])
-        admin = user.has_role('ADMIN')
+        admin = current_user_has_role('ADMIN')
     except KeyError:
         abort(401)
     except Exception:
@@ -440,6 +483,7 @@ def add_copy(item_id):
             )
             db.session.add(new_copy)
             db.session.commit()
+            catalog_generation.bump()
             flash('Copy successfully added!')
             return redirect(url_for('library.item_description',
                                     item_id=item_id))
@@ -481,8 +525,7 @@ def edit_copy(copy_id):
 @require_role('ADMIN')
 def admin_dashboard():
     try:
-        user = User.query.get(session['id'])
-        admin = user.has_role('ADMIN')
+        admin = current_user_has_role('ADMIN')
     except KeyError:
         abort(401)
     except Exception:
@@ -492,13 +535,10 @@ def admin_dashboard():
             search_form = SearchForm(prefix="search")
             borrow_form = BorrowForm(prefix="borrow")
             return_form = ReturnForm(prefix="return")
-            reserv_page = request.args.get('page', 1, type=int)
-            borrow_page = request.args.get('page', 1, type=int)
-            reserv_query = RentalLog.query.filter_by(book_status=1).order_by(
-                RentalLog._reservation_begin.asc()).paginate(
-                reserv_page, 10, False)
-            borrow_query = RentalLog.query.filter_by(book_status=2).order_by(
-                RentalLog._return_time.asc()).paginate(borrow_page, 10, False)
+            reserv_query = paginate_reservations(
+                RentalLog.query.filter_by(book_status=1))
+            borrow_query = paginate_borrows(
+                RentalLog.query.filter_by(book_status=2))
             return render_template('admin.html',
                                    reservations=reserv_query.items,
                                    borrows=borrow_query.items,
@@ -515,18 +555,12 @@ def admin_dashboard():
             borrow_form = BorrowForm(prefix="borrow")
             return_form = ReturnForm(prefix="return")
             query_str = request.args.get('search-query')
-            reserv_page = request.args.get('page', 1, type=int)
-            borrow_page = request.args.get('page', 1, type=int)
-            reserv_query = RentalLog.query.filter_by(book_status=1).order_by(
-                RentalLog._reservation_begin.asc())
-            reserv_filter = reserv_query.filter(
-                User.surname.ilike("%{}%".format(query_str))).paginate(
-                reserv_page, 10, False)
-            borrow_query = RentalLog.query.filter_by(book_status=2).order_by(
-                RentalLog._return_time.asc())
-            borrow_filter = borrow_query.filter(
-                User.surname.ilike("%{}%".format(query_str))).paginate(
-                borrow_page, 10, False)
+            reserv_query = RentalLog.query.filter_by(book_status=1)
+            reserv_filter = paginate_reservations(reserv_query.filter(
+                User.surname.ilike("%{}%".format(query_str))))
+            borrow_query = RentalLog.query.filter_by(book_status=2)
+            borrow_filter = paginate_borrows(borrow_query.filter(
+                User.surname.ilike("%{}%".format(query_str))))
             return render_template('admin.html',
                                    reservations=reserv_filter.items,
                                    borrows=borrow_filter.items,
@@ -581,6 +615,32 @@ def admin_dashboard():
         abort(500)
 
 
+def paginate_reservations(query):
+    if keyset_enabled():
+        return KeysetPagination(
+            query,
+            [SortKey(RentalLog._reservation_begin), SortKey(RentalLog.id)],
+            per_page=10,
+            cursor=request.args.get('reserv_cursor'),
+            cursor_arg='reserv_cursor')
+    page = request.args.get('page', 1, type=int)
+    return query.order_by(
+        RentalLog._reservation_begin.asc()).paginate(page, 10, False)
+
+
+def paginate_borrows(query):
+    if keyset_enabled():
+        return KeysetPagination(
+            query,
+            [SortKey(RentalLog._return_time), SortKey(RentalLog.id)],
+            per_page=10,
+            cursor=request.args.get('borrow_cursor'),
+            cursor_arg='borrow_cursor')
+    page = request.args.get('page', 1, type=int)
+    return query.order_by(
+        RentalLog._return_time.asc()).paginate(page, 10, False)
+
+
 @library.errorhandler(401)
 def not_authorized(error):
     message_body = 'You are not authorized to visit this site!'
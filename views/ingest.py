@@ -0,0 +1,43 @@
+import csv
+import io
+
+from flask import abort, Blueprint, current_app, jsonify, request
+
+from init_db import db
+from models.decorators_roles import require_role
+from search_engine import catalog_generation, catalog_indexer
+from utils.catalog_import import CREATED, DUPLICATE, INVALID, import_catalog
+
+library_ingest = Blueprint('library_ingest', __name__,
+                           template_folder='templates')
+
+
+def request_rows():
+    """Return the rows of a JSON list of objects or of a CSV document
+    with a header row."""
+    if request.mimetype == 'text/csv':
+        return list(csv.DictReader(
+            io.StringIO(request.get_data(as_text=True))))
+    rows = request.get_json(silent=True)
+    if not isinstance(rows, list) or \
+            not all(isinstance(row, dict) for row in rows):
+        abort(400)
+    return rows
+
+
+@library_ingest.route('/api/import', methods=['POST'])
+@require_role('ADMIN')
+def api_import():
+    """Add a batch of books, magazines and copies in one transaction and
+    report on every row, see utils.catalog_import."""
+    rows = request_rows()
+    if len(rows) > current_app.config['IMPORT_MAX_ROWS']:
+        abort(413)
+    results = import_catalog(rows, current_app.config['IMPORT_CHUNK_SIZE'])
+    db.session.commit()
+    catalog_generation.bump()
+    catalog_indexer.invalidate()
+    counts = {status: 0 for status in (CREATED, DUPLICATE, INVALID)}
+    for result in results:
+        counts[result['status']] += 1
+    return jsonify(dict(counts, rows=results))